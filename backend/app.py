@@ -1,14 +1,28 @@
 import os
 import json
+import hashlib
+import secrets
+import threading
 from enum import Enum
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_socketio import SocketIO, emit
 # from flask_cors import CORS
 from agno.agent import Agent
 from agno.models.google import Gemini
 from agno.models.openai import OpenAIChat
-from smolagents_implementation import contact_finder_tool
+from agno.run.response import RunEvent
+from smolagents_implementation import contact_finder_tool, find_contacts_by_company
+from session_registry import SessionRegistry
+from client_pool import openai_http_client
+from email_drafting import submit_batch
+from state_patch import apply_patch, PatchError
+from metrics import registry, span, render_prometheus, process_memory_bytes
+from checkpoint_store import CheckpointStore
+from rate_limiter import get_limiter, estimate_tokens
+from json_stream import JsonResponseParser, JsonStreamError
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +34,18 @@ app = Flask(__name__)
 # Initialize SocketIO with CORS support
 socketio = SocketIO(app, cors_allowed_origins="*")
 
+# Agent turns run on a bounded pool so a slow turn never blocks other clients
+agent_workers = ThreadPoolExecutor(
+    max_workers=int(os.getenv('AGENT_WORKERS', '8')),
+    thread_name_prefix='agent-turn',
+)
+
+# Emit an 'agent_progress' token update every this many streamed chunks
+PROGRESS_TOKEN_INTERVAL = 25
+
+# Model driving the conversational workflow
+AGENT_MODEL_ID = 'o4-mini'
+
 class WorkflowStep(Enum):
     START = "START"
     CONTEXT = "CONTEXT_GENERATION"
@@ -28,35 +54,90 @@ class WorkflowStep(Enum):
     EMAILS = "EMAIL_GENERATION"
     DONE = "DONE"
 
-class MainAgent:
-    def __init__(self, basic_info):
-        # Initialize OpenAI model through Agno
-        agent_llm = OpenAIChat(id='o4-mini', api_key=os.getenv('OPENAI_API_KEY'))
-        
-        
-        # Initialize agent state
-        self.previous_step = WorkflowStep.CONTEXT.value
-        self.user_data = {**basic_info, "context": ""}
-        self.companies = []
-        self.contacts = []
+# The step a turn may move on to from each step
+NEXT_STEP = {
+    WorkflowStep.CONTEXT.value: WorkflowStep.COMPANIES.value,
+    WorkflowStep.COMPANIES.value: WorkflowStep.CONTACTS.value,
+    WorkflowStep.CONTACTS.value: WorkflowStep.EMAILS.value,
+    WorkflowStep.EMAILS.value: WorkflowStep.EMAILS.value,
+}
 
-        # More variables to track email being drafted
-        self.current_email = {}
-        self.num_processed_emails = 0
+# How each step reads the company and contact lists: "full" records or compact
+# "refs". Lists a step does not read are left out of its prompt.
+STEP_LIST_VIEWS = {
+    WorkflowStep.CONTEXT.value: {},
+    WorkflowStep.COMPANIES.value: {"companies": "full"},
+    WorkflowStep.CONTACTS.value: {"companies": "refs", "contacts": "full"},
+    WorkflowStep.EMAILS.value: {},
+}
 
-        # Tools
-        self.contact_finder_tool = contact_finder_tool
-        
-        # Define instructions as multi-line strings
-        overview_instructions = """
+# Only the first page of each list is sent with a turn, so the prompt stays the
+# same size as the lists grow; the model reads other pages with view_records
+PROMPT_PAGE_SIZE = int(os.getenv('PROMPT_PAGE_SIZE', '20'))
+
+PROMPT_CHARS = registry.histogram(
+    "agent_prompt_chars", "Size of the prompt sent with each turn in characters, by step",
+    buckets=(1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000),
+)
+
+class PartialRunError(RuntimeError):
+    """A model run failed after part of it reached the client; repeating it would repeat its text and tools"""
+    retryable = False
+
+def make_agent(tools, instructions):
+    """
+    Build the agent driving a session's workflow.
+
+    A module-level factory, so offline runs (see fake_llm.install_fake_models)
+    can swap in a stand-in model before any session is created.
+    """
+    # Sessions share one HTTP connection pool to the OpenAI API
+    agent_llm = OpenAIChat(
+        id=AGENT_MODEL_ID,
+        api_key=os.getenv('OPENAI_API_KEY'),
+        http_client=openai_http_client(),
+    )
+    return Agent(model=agent_llm, use_json_mode=True, tools=tools, instructions=instructions)
+
+def record_ref(index, record):
+    """Compact reference to a company or contact record: its index and name"""
+    ref = {"id": index}
+    if isinstance(record, dict):
+        lowered = {str(k).lower(): v for k, v in record.items()}
+        for field in ("name", "company"):
+            if lowered.get(field):
+                ref[field] = lowered[field]
+    else:
+        ref["name"] = str(record)
+    return ref
+
+def company_key(record):
+    """Key matching a company record to the contacts found for it: its lowercased name"""
+    if isinstance(record, dict):
+        lowered = {str(k).lower(): v for k, v in record.items()}
+        record = lowered.get("name") or lowered.get("company") or ""
+    return " ".join(str(record).lower().split())
+
+def contact_company_key(contact):
+    """company_key of the company a contact works at ('' if unknown)"""
+    if isinstance(contact, dict):
+        lowered = {str(k).lower(): v for k, v in contact.items()}
+        return company_key(lowered.get("company") or "")
+    return ""
+
+# Instructions sent with every turn. They never change, so they form a stable
+# prompt prefix that provider-side prompt caching can reuse across turns.
+OVERVIEW_INSTRUCTIONS = """
     OVERVIEW:
     You are an autonomous sales outreach assistant that helps find and contact potential leads.
     You can perform 2 types of tasks:
     1. Execute workflow steps as described in the workflow.
     2. Respond conversationally to the user's queries.
 
-    You have access to 1 tool:
+    You have access to 3 tools:
     1. contact_finder_tool: Searches the internet for companies and contacts based on user input
+    2. company_contacts_tool: Finds contacts at the companies in the current list, only searching companies it has not searched before, and adds them to the contacts list
+    3. view_records: Reads a page of the companies or contacts list kept on the server, for records past the first page sent in state
 
     Whenever you receive a user input, you will determine if the user input is requesting a workflow step to be executed, or if it is a conversational query.
     If the user input is a conversational query, generate a clear and concise answer, using information about the user state passed to you.
@@ -64,107 +145,227 @@ class MainAgent:
     When executing a step, use the user input to generate the output data and incorporate it naturally into your conversational response in the 'text' field.
     """
 
-        workflow_overview_instructions = """
+WORKFLOW_OVERVIEW_INSTRUCTIONS = """
     WORKFLOW OVERVIEW:
     The workflow consists of four sequential steps. You can only move on to the next step when the user approves your output for the previous step.
     You will only execute one step at a time.
     You can execute the same step more than once (if you deem that the user is not satisfied with your previous output)
     You should not execute earlier steps than the most recently executed one. That is, you cannot go backwards in the workflow.
-    The four steps are: CONTEXT_GENERATION, COMPANY_SEARCH, CONTACT_SEARCH, or EMAIL_GENERATION. More details about each step will be provided below.
+    The four steps are: CONTEXT_GENERATION, COMPANY_SEARCH, CONTACT_SEARCH, or EMAIL_GENERATION. The rules for the steps you may execute on this turn are given in the step_instructions field of the input.
     """
 
-        input_format_instructions = """
+INPUT_FORMAT_INSTRUCTIONS = """
     INPUT FORMAT:
     You will receive a JSON object with:
     1. previous_step: The previous step executed
-    2. state: The current state containing:
+    2. step_instructions: The rules for the previous step and for the step that follows it. These are the only steps you may execute on this turn.
+    3. state: The current state containing:
        - user_data: A dictionary containing user data from Step 1
-       - companies: List of companies generated from Step 2
-       - contacts: List of contacts generated from Step 3
-       - current_email: The most recently drafted email in Step 4. If this value is updated, this MUST contain the subject and content fields
+       - companies: The first page of the list of companies generated from Step 2 (only when the step needs the full records). A company's id is its 0-based position in the list.
+       - contacts: The first page of the list of contacts generated from Step 3 (only when the step needs the full records). A contact's id is its 0-based position in the list.
+       - company_refs / contact_refs: Compact references ({id, name}) to the first page of companies / contacts kept on the server, sent instead of the full records when the step does not need them. These are read-only: never return them in state.
+       - num_companies / num_contacts: The total number of companies / contacts. Use view_records to read the records past the first page.
+       - current_contact: (Only in Step 4) The full record of contacts[num_processed_emails], if within bounds
+       - current_email: (Only in Step 4) The most recently drafted email in Step 4. If this value is updated, this MUST contain the subject and content fields
        - num_processed_emails: The index of the contact in the 'contacts' list for whom an email draft has just been generated (or is about to be generated). This effectively counts how many contacts have had an email drafted for them so far. Starts at 0.
-    3. user_input: A string containing the user's most recent input (e.g., approval, rejection, modification request for the current email, or a request to proceed).
+       - queued_draft: (Only in Step 4, when available) An email already drafted for contacts[num_processed_emails], with subject and content fields
+    4. user_input: A string containing the user's most recent input (e.g., approval, rejection, modification request for the current email, or a request to proceed).
     """
 
-        workflow_steps_instructions = """
-    WORKFLOW STEPS:
+OUTPUT_FORMAT_INSTRUCTIONS = """
+    OUTPUT FORMAT:
+    Your *entire* response MUST be a single, valid JSON object string. This JSON object should contain the following fields, in this order (the text is shown to the user while the rest is still being written):
+    1. text: The agent's conversational response to the user. If a step was executed, this field MUST include a clear, human-readable presentation of the results or data generated for that step (as described in the Step-Specific Output Format for each step).
+    2. step: The step that was executed, if any (CONTEXT_GENERATION, COMPANY_SEARCH, CONTACT_SEARCH, or EMAIL_GENERATION). If no step was executed (e.g., email process finished), this should be None.
+    3. patch: A list of operations describing only what changed in the state ([] if nothing changed). Each operation is an object with:
+       - op: One of 'add', 'remove', 'update' or 'set'
+       - field: One of user_data, companies, contacts, current_email or num_processed_emails
+       - id: For 'remove' and 'update' on companies or contacts, the id (0-based index in the list you were given) of the record
+       - value: For 'add', the new record (or a list of new records); for 'update', an object with only the changed keys; for 'set', the complete new value
+       'add' and 'remove' only apply to companies and contacts. Ids always refer to the lists as you received them, even after earlier operations in the same patch.
+       Example: [{"op": "remove", "field": "companies", "id": 2}, {"op": "add", "field": "companies", "value": {"name": "Acme", "reason": "..."}}, {"op": "set", "field": "num_processed_emails", "value": 3}]
+    """
+
+IMPORTANT_RULES_INSTRUCTIONS = """
+    IMPORTANT RULES:
+    1. Always decide which step to execute (if any) by inferring from the user's input.
+    2. Never skip steps or execute multiple steps at once.
+    3. Only use the provided state data from the current and previous steps.
+    4. Follow the exact output format specified above (text, step, patch). Ensure the 'text' field contains both the conversational part and a description of any generated data if a step was run. Ensure that every state change is expressed as an operation in the patch, and never re-send data that did not change.
+    5. Your entire output *must* be a single JSON object string. Do not include ```json, ```, newlines outside the JSON string, or any other text before or after the JSON object. The `use_json_mode` is enabled, so adhere strictly to returning only the JSON structure.
+    """
 
+# Rules for each workflow step. Only the steps a turn may execute are sent with it.
+STEP_INSTRUCTIONS = {
+    WorkflowStep.CONTEXT.value: """
     Step 1: Generate Context (CONTEXT_GENERATION)
     - Use the user_data in state
     - Look at the user_input field potentially contains additional context given by the user
     - Using user_input and user_data, generate a updated user_data object
     - Step-Specific Output Format (to be included in the 'text' field): Describe the updated user profile information clearly. For example: "Okay, I've updated your profile. Here's the current information: First Name: [first_name], Last Name: [last_name], Company: [company], Role: [role], Industry: [industry], City: [city], Country: [country], Context: [context]. Let me know if this looks correct."
-    - Update the state object with the updated user data (state['user_data'])
+    - Update user_data through the patch (an 'update' with only the changed keys, or a 'set')
     - On user approval, go to the next step
-
+    """,
+    WorkflowStep.COMPANIES.value: """
     Step 2: Generate List of Companies (COMPANY_SEARCH)
-    - Use the user_data and companies list (if any) in state
+    - Use the user_data and companies list (if any) in state, and view_records for companies past the first page
     - Look at the user_input field which potentially contains the user's feedback regarding the current list of companies
     - Use contact_finder_tool to gather information on relevant companies
     - Using the structured data and state['companies'], generate an updated list of companies to contact
     - Step-Specific Output Format (to be included in the 'text' field): Present the list of companies clearly, including their names and the reason for suggesting them. For example: "Based on your profile and request, I found these companies:\n- [Company Name 1]: [Reason 1]\n- [Company Name 2]: [Reason 2]\nLet me know if you'd like to proceed with these or refine the search."
-    - Update the state object with the updated companies list (state['companies'])
+    - Update the companies list through the patch: 'add' new companies, 'remove' rejected ones by id, and 'update' changed ones. Do not re-send companies that are unchanged.
     - On user approval, go to the next step
-
+    """,
+    WorkflowStep.CONTACTS.value: """
     Step 3: Generate Contacts from Companies (CONTACT_SEARCH)
-    - Use the user_data, the companies list, the contacts list (if any) in state
+    - Use the user_data, the companies (state['company_refs']), the contacts list (if any) in state, and view_records for contacts past the first page
     - Look at the user_input field which potentially contains the user's feedback regarding the current list of contacts
-    - Use contact_finder_tool to find contacts from the current list of companies
+    - Use company_contacts_tool (no arguments) to find contacts at the current list of companies. It only searches companies that were added since its last call. It adds their contacts to the contacts list kept on the server itself and returns them, with their ids, in 'new_contacts': never 'add' them again in the patch. Contacts of removed companies have already been dropped from state['contacts'], and those of unchanged companies are already in it.
     - Using the structured data, and state['contacts'], generate a list of contacts to reach out to
     - Step-Specific Output Format (to be included in the 'text' field): Present the list of contacts clearly, including name, email, company, reason, and LinkedIn URL. For example: "I found the following contacts at the selected companies:\n- Name: [Name 1], Email: [Email 1], Company: [Company 1], Reason: [Reason 1], LinkedIn: [URL 1]\n- Name: [Name 2], Email: [Email 2], Company: [Company 2], Reason: [Reason 2], LinkedIn: [URL 2]\nShould I start drafting emails for them?"
-    - The state object should be updated with the updated contacts list (state['contacts']) separately. Ensure that each contact in this list has an email field.
+    - Update the contacts list through the patch: 'add' new contacts, 'remove' rejected ones by id, and 'update' changed ones. Do not re-send contacts that are unchanged. Ensure that each contact has an email field.
     - On user approval, go to the next step
-
+    """,
+    WorkflowStep.EMAILS.value: """
     Step 4: Generate Emails (EMAIL_GENERATION)
     - This step aims to draft an email for only one contact at a time, sequentially from the 'contacts' list.
-    - Use the 'user_data', 'contacts', 'current_email', and 'num_processed_emails' fields in state.
-    - Determine the current contact to process using the 'num_processed_emails' as the index for the 'contacts' list (i.e., `contact_to_process = contacts[num_processed_emails]`).
-    - Check if `num_processed_emails` is less than the total number of contacts. If not, the email generation phase is complete; inform the user and set 'step' to None in the output.
+    - Use the 'user_data', 'current_contact', 'num_contacts', 'current_email', and 'num_processed_emails' fields in state.
+    - The current contact to process is `state['current_contact']`, i.e. `contact_to_process = contacts[num_processed_emails]`.
+    - Check if `num_processed_emails` is less than `num_contacts`. If not, the email generation phase is complete; inform the user and set 'step' to None in the output.
     - If within bounds, use the 'user_input' (which might contain feedback on the *previous* draft or a request to proceed) and the details of `contact_to_process` to generate or refine an email draft.
+    - If state contains 'queued_draft', it was already drafted for `contact_to_process`: use it as the draft (applying any changes the user asked for) instead of writing a new email from scratch.
     - Step-Specific Output Format (to be included in the 'text' field): Present the drafted email clearly for the current contact (`contact_to_process`), including recipient details, subject, and body. For example: "Here's draft #{index + 1} for {contact_name} at {company_name} ({contact_email}):\nSubject: {subject}\n\nBody:\n{body}\n\nPlease review it. Let me know if you approve, want changes, or want to skip this contact."
-    - **Crucially**: After generating the draft for the current contact, update the state for the response:
-        - Set `state['current_email']` to the newly generated draft.
-        - Increment `state['num_processed_emails']` by 1. This signifies that this contact has now been processed (i.e., an email has been drafted and shown).
+    - **Crucially**: After generating the draft for the current contact, update the state through the patch:
+        - 'set' `current_email` to the newly generated draft.
+        - 'set' `num_processed_emails` to its current value plus 1. This signifies that this contact has now been processed (i.e., an email has been drafted and shown).
     - The workflow proceeds based on the *next* user input. When the user responds (approve/reject/modify/next), you will again check the (already incremented) `num_processed_emails` against the total number of contacts to decide whether to draft for the *next* contact or end the process.
     - DO NOT REPEAT ANY CONTACTS. The sequential processing using `num_processed_emails` ensures this.
-    """
+    """,
+}
 
-        output_format_instructions = """
-    OUTPUT FORMAT:
-    Your *entire* response MUST be a single, valid JSON object string. This JSON object should contain the following fields:
-    1. text: The agent's conversational response to the user. If a step was executed, this field MUST include a clear, human-readable presentation of the results or data generated for that step (as described in the Step-Specific Output Format for each step).
-    2. step: The step that was executed, if any (CONTEXT_GENERATION, COMPANY_SEARCH, CONTACT_SEARCH, or EMAIL_GENERATION). If no step was executed (e.g., email process finished), this should be None.
-    3. state: The updated state object, including user_data, companies, contacts, current_email, and the potentially incremented num_processed_emails.
-    """
+class MainAgent:
+    def __init__(self, basic_info):
+        # Initialize agent state
+        self.previous_step = WorkflowStep.CONTEXT.value
+        self.user_data = {**basic_info, "context": ""}
+        self.companies = []
+        self.contacts = []
 
-        important_rules_instructions = """
-    IMPORTANT RULES:
-    1. Always decide which step to execute (if any) by inferring from the user's input.
-    2. Never skip steps or execute multiple steps at once.
-    3. Only use the provided state data from the current and previous steps.
-    4. Follow the exact output format specified above (text, step, state). Ensure the 'text' field contains both the conversational part and a description of any generated data if a step was run. Ensure that the state variables are updated and returned correctly within the JSON structure.
-    5. Your entire output *must* be a single JSON object string. Do not include ```json, ```, newlines outside the JSON string, or any other text before or after the JSON object. The `use_json_mode` is enabled, so adhere strictly to returning only the JSON structure.
-    """
+        # Contacts found for each company (by company_key), so a changed company
+        # list only needs searches for the companies that were added
+        self.contacts_by_company = {}
+
+        # More variables to track email being drafted
+        self.current_email = {}
+        self.num_processed_emails = 0
+
+        # Emails drafted ahead of review, and the drafts still in flight, keyed by contact index
+        self.draft_queue = {}
+        self.drafting = {}
 
-        self.agent = Agent(
-            model=agent_llm,
-            use_json_mode=True,
+        # Size of the last prompt sent to the model, in characters
+        self.last_prompt_chars = 0
+
+        # Turns waiting to run for this session, as (sid, data); the first one is
+        # running. Only that one holds a worker, so a busy session cannot starve others
+        self.pending_turns = deque()
+        self.turns_lock = threading.Lock()
+
+        # Tools
+        self.contact_finder_tool = contact_finder_tool
+        
+        self.agent = make_agent(
             tools=[
             self.contact_finder_tool,
+            self.company_contacts_tool,
+            self.view_records,
             # self.linkedin_scraper_tool,
             # self.organize_information_tool,
             # self.send_email_tool,
             ],
             instructions=[
-            overview_instructions,
-            workflow_overview_instructions,
-            input_format_instructions,
-            workflow_steps_instructions,
-            output_format_instructions,
-            important_rules_instructions,
-            ]
+            OVERVIEW_INSTRUCTIONS,
+            WORKFLOW_OVERVIEW_INSTRUCTIONS,
+            INPUT_FORMAT_INSTRUCTIONS,
+            OUTPUT_FORMAT_INSTRUCTIONS,
+            IMPORTANT_RULES_INSTRUCTIONS,
+            ],
         )
     
+    def company_contacts_tool(self):
+        """Use this function to find contacts at the companies in the current list.
+
+        Only companies without contacts found yet are searched; companies that
+        were already searched are reused. The contacts found are added to the
+        contacts list right away, so they do not need to be added in the patch.
+
+        Returns:
+            str: JSON object with 'new_contacts' (a list of {'id', 'record'} objects
+            for the contacts added), 'searched', 'reused' and 'failed' (company names).
+        """
+        added = [c for c in self.companies if company_key(c) not in self.contacts_by_company]
+        reused = [record_ref(i, c).get("name") for i, c in enumerate(self.companies)
+                  if company_key(c) in self.contacts_by_company]
+        print(f"Contact search: {len(added)} companies to search, {len(reused)} reused")
+
+        new_contacts, searched, failed = [], [], []
+        results = find_contacts_by_company(added) if added else []
+        for company, contacts in zip(added, results):
+            name = record_ref(0, company).get("name")
+            if contacts is None:
+                # Not recorded, so the next call searches it again
+                failed.append(name)
+                continue
+            new_contacts.extend(c for c in contacts if c not in self.contacts and c not in new_contacts)
+            searched.append(name)
+            self.contacts_by_company[company_key(company)] = contacts
+        # Merged into the server-side list here rather than left to the model's
+        # patch, so contacts recorded as found are never lost with a failed turn
+        first_id = len(self.contacts)
+        if new_contacts:
+            self.set_state({"contacts": self.contacts + new_contacts})
+        return json.dumps({
+            "new_contacts": [{"id": first_id + i, "record": c} for i, c in enumerate(new_contacts)],
+            "searched": searched, "reused": reused, "failed": failed,
+        })
+
+    def view_records(self, field, start=0, count=PROMPT_PAGE_SIZE):
+        """Use this function to read part of the companies or contacts list kept on the server.
+
+        Args:
+            field (str): 'companies' or 'contacts'.
+            start (int): The id of the first record to read.
+            count (int): How many records to read, at most one page.
+
+        Returns:
+            str: JSON object with 'total' (the length of the list) and 'records',
+            a list of {'id', 'record'} objects.
+        """
+        records = {"companies": self.companies, "contacts": self.contacts}.get(field)
+        if records is None:
+            return json.dumps({"error": f"Unknown field {field!r}; use 'companies' or 'contacts'"})
+        start = max(0, int(start))
+        stop = start + max(0, min(int(count), PROMPT_PAGE_SIZE))
+        return json.dumps({
+            "total": len(records),
+            "records": [{"id": i, "record": records[i]} for i in range(start, min(stop, len(records)))],
+        })
+
+    def drop_removed_companies(self, companies, contacts):
+        """
+        Forget the contacts of companies that are not in `companies` any more.
+
+        Returns `contacts` without the ones working at a removed company.
+        """
+        kept = {company_key(c) for c in companies}
+        removed = {company_key(c) for c in self.companies} - kept
+        removed |= set(self.contacts_by_company) - kept
+        if not removed:
+            return contacts
+        # Contacts found for a removed company go too, even if their 'company' is spelled differently
+        found = [c for key in removed for c in self.contacts_by_company.pop(key, None) or []]
+        return [c for c in contacts if contact_company_key(c) not in removed and c not in found]
+
     def linkedin_scraper_tool(self, query):
         """Tool for searching LinkedIn"""
         # Implementation of LinkedIn scraping
@@ -180,107 +381,473 @@ class MainAgent:
         # Implementation of email sending
         return {"status": "success", "data": "Email sent"}
     
-    def handle_input(self, user_input):
-        """Handle all user input for the workflow"""        
+    def get_state(self):
+        """Return the workflow state tracked for this session"""
+        return {
+            "previous_step": self.previous_step,
+            "user_data": self.user_data,
+            "companies": self.companies,
+            "contacts": self.contacts,
+            "contacts_by_company": self.contacts_by_company,
+            "current_email": self.current_email,
+            "num_processed_emails": self.num_processed_emails,
+        }
+
+    def set_state(self, new_state):
+        """Update the workflow fields present in `new_state`, keeping the rest"""
+        self.user_data = new_state.get("user_data", self.user_data)
+        self.contacts_by_company = new_state.get("contacts_by_company", self.contacts_by_company)
+        companies = new_state.get("companies", self.companies)
+        contacts = new_state.get("contacts", self.contacts)
+        if companies != self.companies:
+            contacts = self.drop_removed_companies(companies, contacts)
+        self.companies = companies
+        if contacts != self.contacts:
+            # Queued drafts were written for the old contact list
+            self.cancel_drafting()
+            self.draft_queue = {}
+        self.contacts = contacts
+        self.current_email = new_state.get("current_email", self.current_email)
+        self.num_processed_emails = new_state.get("num_processed_emails", self.num_processed_emails)
+
+    def load_state(self, state):
+        """Restore a checkpointed state, including the step it was at"""
+        self.previous_step = state.get("previous_step", self.previous_step)
+        self.set_state(state)
+
+    def state_size(self):
+        """Approximate memory held by this session's workflow state, in bytes"""
+        return len(json.dumps(self.get_state(), default=str))
+
+    def run_agent(self, message, on_progress=None, parser=None):
+        """
+        Run the agent on `message` and return the full response text.
+
+        The run is streamed so that tool calls and token counts can be reported
+        to `on_progress` (a callable taking an event dict) while it is in flight.
+        Each streamed chunk is also fed to `parser` (a JsonResponseParser), if given.
+
+        A rate-limited run is only retried while nothing has been streamed yet.
+        Once text or a tool call has gone out, a failure raises PartialRunError
+        instead, so the client never sees the text twice and tools never run twice.
+        """
+        def report(event, **details):
+            if on_progress is not None:
+                on_progress({"event": event, **details})
+
+        def stream():
+            chunks = []
+            current_tool = None
+            started = False
+            try:
+                for chunk in self.agent.run(message, stream=True, stream_intermediate_steps=True):
+                    if chunk.event == RunEvent.tool_call_started:
+                        started = True
+                        current_tool = chunk.tools[-1].get("tool_name") if chunk.tools else None
+                        report("tool_started", tool=current_tool)
+                    elif chunk.event == RunEvent.tool_call_completed:
+                        report("tool_finished", tool=current_tool)
+                    elif chunk.event == RunEvent.run_response and isinstance(chunk.content, str):
+                        started = True
+                        chunks.append(chunk.content)
+                        if parser is not None:
+                            parser.feed(chunk.content)
+                        if len(chunks) % PROGRESS_TOKEN_INTERVAL == 0:
+                            report("tokens", output_tokens=len(chunks))
+            except Exception as e:
+                if started:
+                    raise PartialRunError(f"The model run was interrupted after it started responding: {e}") from e
+                raise
+            return "".join(chunks)
+
+        limiter = get_limiter("openai")
+        estimated = estimate_tokens(message)
+        with span("model", AGENT_MODEL_ID) as model_span:
+            # The run's tools make their own limited calls, so it does not hold a slot
+            text = limiter.call(stream, estimated_tokens=estimated, hold_slot=False)
+            metrics = self.agent.run_response.metrics or {}
+            model_span.add_tokens(
+                sum(metrics.get("input_tokens", [])),
+                sum(metrics.get("output_tokens", [])),
+            )
+            limiter.record_tokens(model_span.input_tokens + model_span.output_tokens, estimated)
+        report("completed", input_tokens=model_span.input_tokens, output_tokens=model_span.output_tokens)
+        return text
+
+    def start_batch_drafting(self):
+        """Draft emails for every contact still awaiting review, in the background"""
+        pending = [
+            index for index in range(self.num_processed_emails, len(self.contacts))
+            if index not in self.draft_queue and index not in self.drafting
+        ]
+        if pending:
+            futures = submit_batch([self.contacts[index] for index in pending], self.user_data)
+            self.drafting.update(zip(pending, futures))
+
+    def cancel_drafting(self):
+        """Stop drafting the emails that have not started yet"""
+        for future in self.drafting.values():
+            future.cancel()
+        self.drafting = {}
+
+    def next_queued_draft(self):
+        """Return the queued draft for contacts[num_processed_emails], waiting only for that draft if needed"""
+        current = self.num_processed_emails
+        for index, future in list(self.drafting.items()):
+            if index < current:
+                # Already reviewed without waiting for it
+                future.cancel()
+            elif index == current or future.done():
+                draft = future.result()
+                if draft is not None:
+                    self.draft_queue[index] = draft
+            else:
+                continue
+            del self.drafting[index]
+        return self.draft_queue.get(current)
+
+    def executed_step(self, step):
+        """
+        The step a turn's result leaves the workflow at.
+
+        Conversational replies have a null step, and an unknown step would lose
+        the step rules, so both keep the previous step.
+        """
+        return step if step in STEP_INSTRUCTIONS else self.previous_step
+
+    def turn_steps(self):
+        """The steps this turn may execute: the previous step and the one after it"""
+        steps = [self.previous_step]
+        next_step = NEXT_STEP.get(self.previous_step)
+        if next_step is not None and next_step != self.previous_step:
+            steps.append(next_step)
+        return steps
+
+    def step_instructions(self):
+        """Rules for the steps this turn may execute, sent with the turn instead of in the system prompt"""
+        return "".join(STEP_INSTRUCTIONS[step] for step in self.turn_steps() if step in STEP_INSTRUCTIONS)
+
+    def prompt_state(self):
+        """
+        Build the state sent to the model for this turn.
+
+        The authoritative state stays on the server. The prompt only carries
+        what the previous step and the step it may move on to actually read
+        (see STEP_LIST_VIEWS), limited to the first page of each list, plus the
+        contact currently under discussion during email generation.
+        """
+        steps = self.turn_steps()
+        views = {}
+        for step in steps:
+            for name, view in STEP_LIST_VIEWS.get(step, {}).items():
+                if views.get(name) != "full":
+                    views[name] = view
+
+        state = {
+            "user_data": self.user_data,
+            "num_companies": len(self.companies),
+            "num_contacts": len(self.contacts),
+            "num_processed_emails": self.num_processed_emails, # Pass the current count
+        }
+        lists = (
+            ("companies", "company_refs", self.companies),
+            ("contacts", "contact_refs", self.contacts),
+        )
+        for name, refs_name, records in lists:
+            page = records[:PROMPT_PAGE_SIZE]
+            if views.get(name) == "full":
+                state[name] = page
+            elif views.get(name) == "refs":
+                state[refs_name] = [record_ref(i, record) for i, record in enumerate(page)]
+
+        if WorkflowStep.EMAILS.value in steps:
+            state["current_email"] = self.current_email
+            if self.num_processed_emails < len(self.contacts):
+                state["current_contact"] = self.contacts[self.num_processed_emails]
+            if self.previous_step == WorkflowStep.EMAILS.value:
+                queued_draft = self.next_queued_draft()
+                if queued_draft is not None:
+                    state["queued_draft"] = queued_draft
+        return state
+
+    def handle_input(self, user_input, on_progress=None):
+        """Handle all user input for the workflow"""
+        with span("turn", self.previous_step) as turn:
+            result = self.run_turn(user_input, on_progress=on_progress)
+            # Label the turn with the step it executed
+            turn.name = self.previous_step
+            if "error" in result:
+                turn.fail()
+        return result
+
+    def run_turn(self, user_input, on_progress=None):
+        """Run one model turn and apply its result to the workflow state"""
         # Prepare input data for the agent
         input_data = {
             "previous_step": self.previous_step,
-            "state": {
-                "user_data": self.user_data,
-                "companies": self.companies,
-                "contacts": self.contacts,
-                "current_email": self.current_email,
-                "num_processed_emails": self.num_processed_emails, # Pass the current count
-            },
+            "step_instructions": self.step_instructions(),
+            "state": self.prompt_state(),
             "user_input": user_input.get("text", ""),
         }
+        message = json.dumps(input_data)
+        self.last_prompt_chars = len(message)
+        PROMPT_CHARS.observe(self.last_prompt_chars, step=self.previous_step)
+        print(f"Prompt size: {self.last_prompt_chars} chars ({self.previous_step})")
+        if on_progress is not None:
+            on_progress({"event": "prompt", "prompt_chars": self.last_prompt_chars})
         
+        # The reply's 'text' is forwarded to the client while the rest of the response streams in
+        def on_text(delta):
+            if on_progress is not None:
+                on_progress({"event": "text_delta", "text": delta})
+
         # Run the agent with the input
-        run_response = self.agent.run(json.dumps(input_data)).content
+        parser = JsonResponseParser(on_text=on_text)
+        try:
+            run_response = self.run_agent(message, on_progress=on_progress, parser=parser)
+        except PartialRunError as e:
+            print(f"PartialRunError: {e}")
+            return {"error": "The reply was interrupted; please send your message again", "raw_response": str(e)}
         print("Raw Agent response:", run_response) # BOOKMARK
 
-        # Clean the response string: remove potential markdown fences
-        cleaned_response = run_response.strip()
-        if cleaned_response.startswith("```json"):
-            cleaned_response = cleaned_response[len("```json"):].strip()
-        if cleaned_response.startswith("```"):
-             cleaned_response = cleaned_response[len("```"):].strip()
-        if cleaned_response.endswith("```"):
-            cleaned_response = cleaned_response[:-len("```")].strip()
-
-        print("Cleaned Agent response:", cleaned_response)
-        
-        # Attempt to parse the cleaned JSON response
+        # Parse the streamed response, recovering from fences and trailing text around the JSON
         try:
-            # Use the cleaned response string for parsing
-            result = json.loads(cleaned_response) 
-        except json.JSONDecodeError as e:
-             print(f"JSONDecodeError: {e}")
+            result = parser.result()
+        except JsonStreamError as e:
+             print(f"JsonStreamError: {e}")
              print("Could not parse the agent response string.")
              # Return error with the original raw response for debugging
              return {"error": "Failed to parse agent response", "raw_response": run_response}
 
-        # Update state (ensure 'state' key exists)
-        if "state" in result:
+        # Apply the model's state changes: a patch, or a full state from older prompts
+        if "patch" in result:
+            try:
+                new_state = apply_patch(self.get_state(), result.pop("patch"))
+            except PatchError as e:
+                print(f"Rejected state patch: {e}")
+                return {"error": f"Invalid state patch: {e}", "raw_response": run_response}
+            self.previous_step = self.executed_step(result.get("step"))
+            self.set_state(new_state)
+        elif "state" in result:
             new_state = result.pop("state")
-            self.previous_step = result.get("step", self.previous_step)
-            # Safely get values from new_state
-            self.user_data = new_state.get("user_data", self.user_data)
-            self.companies = new_state.get("companies", self.companies)
-            self.contacts = new_state.get("contacts", self.contacts)
-            self.current_email = new_state.get("current_email", self.current_email)
-            # Update num_processed_emails from the agent's returned state
-            self.num_processed_emails = new_state.get("num_processed_emails", self.num_processed_emails) 
+            self.previous_step = self.executed_step(result.get("step"))
+            self.set_state(new_state)
         else:
-            print("Warning: 'state' key not found in the parsed agent result.")
+            print("Warning: neither 'patch' nor 'state' found in the parsed agent result.")
+
+        # Once email generation has started, draft the remaining contacts ahead of review
+        if self.previous_step == WorkflowStep.EMAILS.value:
+            self.start_batch_drafting()
 
         return result
 
+# Every session's state is checkpointed after each turn, so it survives restarts
+checkpoints = CheckpointStore()
+
+def spill_session(session_id, agent):
+    """Write an evicted session to disk; it is reloaded on its next use"""
+    checkpoints.save(session_id, agent.get_state())
+    checkpoints.forget(session_id)
+
+# One agent per client session, evicted by LRU/TTL and an overall memory cap
+sessions = SessionRegistry(
+    max_sessions=int(os.getenv('SESSION_MAX_SESSIONS', '500')),
+    ttl_seconds=int(os.getenv('SESSION_TTL_SECONDS', '3600')),
+    max_memory_bytes=int(os.getenv('SESSION_MAX_MEMORY_MB', '256')) * 1024 * 1024,
+    size_of=lambda agent: agent.state_size(),
+    on_evict=spill_session,
+)
+
+# Maps each connected Socket.IO sid to the session id its agent is registered under
+sid_sessions = {}
+
+# Serializes reloads, so two events for an evicted session cannot each build an agent for it
+_load_lock = threading.Lock()
+
+def load_session(session_id, pin=False):
+    """
+    Return the agent for `session_id`, reloading it from its checkpoint if it was evicted.
+
+    With `pin`, the session is pinned in memory until sessions.unpin(session_id).
+    """
+    with _load_lock:
+        agent = sessions.pin(session_id) if pin else sessions.get(session_id)
+        if agent is not None:
+            return agent
+        state = checkpoints.load(session_id)
+        if state is None:
+            return None
+        agent = MainAgent(state.get("user_data", {}))
+        agent.load_state(state)
+        print(f"Reloaded session {session_id} from checkpoint ({agent.previous_step})")
+        return sessions.create(session_id, agent, pin=pin)
+
+def get_session_agent(pin=False):
+    """Return (session_id, agent) for the client that sent the current event"""
+    session_id = sid_sessions.get(request.sid)
+    if session_id is None:
+        return None, None
+    return session_id, load_session(session_id, pin=pin)
+
+def token_digest(token):
+    return hashlib.sha256(str(token).encode("utf-8")).hexdigest()
+
+def owns_session(session_id, token):
+    """
+    True when `token` is the one issued with `session_id`, or the id is not in use.
+
+    Only a digest of the token is checkpointed (as the 'owner' field), so the
+    check survives eviction and restarts. Sessions checkpointed before tokens
+    were issued have no owner and are claimed by the next client to resume them.
+    """
+    if session_id not in sessions and session_id not in checkpoints:
+        return True
+    owner = checkpoints.load_field(session_id, "owner")
+    return owner is None or (bool(token) and secrets.compare_digest(owner, token_digest(token)))
+
+@app.route('/sessions')
+def session_stats():
+    """Report live sessions and their memory cost"""
+    return jsonify(sessions.stats())
+
+registry.gauge("agent_live_sessions", "Agent sessions held in memory", lambda: len(sessions))
+registry.gauge("agent_session_memory_bytes", "Approximate memory held by session state", sessions.memory_bytes)
+registry.gauge("process_resident_memory_bytes", "Resident memory of the server process", process_memory_bytes)
+
+@app.route('/metrics')
+def metrics():
+    """Turn, tool and model timings in the Prometheus text format"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # WebSocket event handlers
 @socketio.on('initialize_agent')
 def initialize_agent(data: dict):
     """
     Initialize the agent with basic user information.
     
-    Expects a dictionary with the 'basic_info' key
+    Expects a dictionary with the 'basic_info' key. The agent is registered under
+    'session_id' (or the user's 'uid') when given, otherwise under the Socket.IO sid.
+    A new session is issued a 'session_token'. A client reconnecting with the
+    'session_id' and 'session_token' it was given resumes that session, from
+    memory or from its checkpoint; a session id in use is refused without its token,
+    and is not replaced while one of its turns is queued or running.
     """
     try:
         basic_info = data.get('basic_info', {})
-        global agent
-        agent = MainAgent(basic_info)
+        session_id = data.get('session_id') or basic_info.get('uid') or request.sid
+        token = data.get('session_token')
+        if not owns_session(session_id, token):
+            emit('error', {'message': f"Session {session_id} belongs to another client"})
+            return
+        agent = load_session(data['session_id']) if data.get('session_id') else None
+        resumed = agent is not None
+        token = token or secrets.token_urlsafe(24)
+        if not resumed:
+            # A queued or running turn would save its state over the new session's checkpoint
+            agent = sessions.create(session_id, MainAgent(basic_info), replace_pinned=False)
+            if agent is None:
+                emit('error', {'message': f"Session {session_id} has a turn running; initialize it again once the turn ends"})
+                return
+        checkpoints.save(session_id, {**agent.get_state(), "owner": token_digest(token)})
+        sid_sessions[request.sid] = session_id
         
         # Emit success message
-        emit('agent_initialized', {'status': 'success'})
+        emit('agent_initialized', {
+            'status': 'success',
+            'session_id': session_id,
+            'session_token': token,
+            'resumed': resumed,
+            'step': agent.previous_step,
+        })
     except Exception as e:
         emit('error', {'message': str(e)})
 
-@socketio.on('user_input')
-def handle_user_input(data: dict):
+def run_agent_turn(sid, session_id, agent, data):
     """
-    Provide user input to the agent
+    Run one agent turn on the worker pool and emit its progress and output to `sid`.
 
-    Expects a dictionary with the 'text' key
+    The session was pinned when the turn was queued and is unpinned once it ends.
     """
+    def on_progress(event):
+        socketio.emit('agent_progress', event, to=sid)
+
     try:
-        # Check if the user input contains "/sendemail"
-        user_text = data.get("text", "")
-        if "/sendemail" in user_text:
-            print("Detected '/sendemail' command in user input.")
-            emit('send_email', {
-                "email": agent.contacts[agent.num_processed_emails]["email"],
-                "subject": agent.current_email["subject"],
-                "content": agent.current_email["content"],
-            })
-        result = agent.handle_input(data)
+        result = agent.handle_input(data, on_progress=on_progress)
+        checkpoints.save(session_id, agent.get_state())
+        sessions.refresh(session_id)
         # Check if the result indicates an error from handle_input
         if isinstance(result, dict) and "error" in result:
-             emit('error', {'message': result["error"], 'details': result.get("raw_response")})
+            socketio.emit('error', {'message': result["error"], 'details': result.get("raw_response")}, to=sid)
         else:
-            emit('agent_output', result["text"]) # Emits JSON with 'text', 'step'
+            socketio.emit('agent_output', result["text"], to=sid) # Emits JSON with 'text', 'step'
+    except Exception as e:
+        print(f"Error in agent turn for session {session_id}: {e}")
+        socketio.emit('error', {'message': f"An unexpected error occurred: {str(e)}"}, to=sid)
+    finally:
+        sessions.unpin(session_id)
+
+def queue_turn(sid, session_id, agent, data):
+    """Queue a turn for the session; it goes to the worker pool once the turns before it have ended"""
+    with agent.turns_lock:
+        agent.pending_turns.append((sid, data))
+        if len(agent.pending_turns) > 1:
+            return
+    agent_workers.submit(run_queued_turns, session_id, agent)
+
+def run_queued_turns(session_id, agent):
+    """Run the session's first queued turn, then hand its next one back to the pool"""
+    sid, data = agent.pending_turns[0]
+    try:
+        run_agent_turn(sid, session_id, agent, data)
+    finally:
+        with agent.turns_lock:
+            agent.pending_turns.popleft()
+            more = bool(agent.pending_turns)
+        if more:
+            agent_workers.submit(run_queued_turns, session_id, agent)
+
+@socketio.on('user_input')
+def handle_user_input(data: dict):
+    """
+    Provide user input to the agent
+
+    Expects a dictionary with the 'text' key. The turn is queued behind the
+    session's earlier turns, which run one at a time on the worker pool, and
+    this handler returns immediately. 'agent_progress' events are emitted while
+    it runs, including 'text_delta' events carrying the reply's text as it
+    streams in, followed by 'agent_output' (or 'error').
+    """
+    try:
+        # Pinned until the turn ends, so the session cannot be evicted and reloaded as a second agent
+        session_id, agent = get_session_agent(pin=True)
+        if agent is None:
+            emit('error', {'message': "No active agent for this session. Send 'initialize_agent' first."})
+            return
+
+        try:
+            # Check if the user input contains "/sendemail"
+            user_text = data.get("text", "")
+            if "/sendemail" in user_text:
+                print("Detected '/sendemail' command in user input.")
+                emit('send_email', {
+                    "email": agent.contacts[agent.num_processed_emails]["email"],
+                    "subject": agent.current_email["subject"],
+                    "content": agent.current_email["content"],
+                })
+            queue_turn(request.sid, session_id, agent, data)
+        except Exception:
+            sessions.unpin(session_id)
+            raise
+        emit('agent_progress', {"event": "queued"})
     except Exception as e:
         # Catch any other unexpected errors during handling or emission
         print(f"Error in handle_user_input: {e}")
         emit('error', {'message': f"An unexpected error occurred: {str(e)}"})
 
+@socketio.on('disconnect')
+def handle_disconnect():
+    """Forget the sid mapping; the session itself lives on until it is evicted"""
+    sid_sessions.pop(request.sid, None)
+
 if __name__ == '__main__':
     socketio.run(app, debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
@@ -0,0 +1,267 @@
+"""
+Offline latency benchmark for both agent pipelines.
+
+Runs app.MainAgent.handle_input through a scripted conversation and
+mainAgent.MainAgent.run_workflow through a scripted workflow at several list
+sizes, with the models and tools replaced by fake_llm stand-ins. Reports per-turn
+latency, prompt size and tokens, and end-to-end time, and can compare them to a
+saved baseline. Exits non-zero on a regression or when a requested pipeline
+cannot run. Session checkpoints and cached results go to a temporary directory.
+
+Usage:
+    python benchmark.py --sizes 10 50 200 --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import types
+
+from fake_llm import FAKE_DRAFT, FakeAgent, FakeLLM, fake_tool
+
+# Get the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+
+# Metrics compared against the baseline; all of them are "lower is better"
+REGRESSION_METRICS = ["e2e_seconds", "input_tokens", "output_tokens", "max_prompt_chars"]
+
+BASIC_INFO = {
+    "first_name": "John",
+    "last_name": "Doe",
+    "company": "Acme Inc",
+    "role": "Sales Manager",
+    "industry": "Technology",
+    "city": "San Francisco",
+    "country": "USA",
+}
+
+def make_companies(size):
+    return [{"name": f"Company {i}", "reason": f"Fintech firm {i} matching the profile"} for i in range(size)]
+
+def make_contacts(size):
+    return [
+        {
+            "name": f"Contact {i}",
+            "role": "Head of Sales",
+            "company": f"Company {i // 2}",
+            "email": f"contact{i}@company{i // 2}.com",
+            "linkedin": f"https://www.linkedin.com/in/contact-{i}/",
+        }
+        for i in range(size)
+    ]
+
+def app_script(size, email_turns, tool_delay):
+    """Recorded turns for a conversation that finds `size` companies and 2 * `size` contacts"""
+    companies = make_companies(size)
+    contacts = make_contacts(2 * size)
+
+    def turn(text, step, patch, tool_calls=()):
+        return {"content": {"text": text, "step": step, "patch": patch}, "tool_calls": list(tool_calls)}
+
+    listing = "\n".join(f"- {c['name']}: {c['reason']}" for c in companies)
+    people = "\n".join(f"- Name: {c['name']}, Email: {c['email']}, Company: {c['company']}" for c in contacts)
+    script = [
+        ("We sell CRM software to fintechs", turn(
+            "Okay, I've updated your profile.", "CONTEXT_GENERATION",
+            [{"op": "update", "field": "user_data", "value": {"context": "Sells CRM software to fintechs"}}],
+        )),
+        ("Looks good, find companies", turn(
+            f"Based on your profile I found these companies:\n{listing}", "COMPANY_SEARCH",
+            [{"op": "add", "field": "companies", "value": companies}],
+            [{"tool": "contact_finder_tool", "result": json.dumps(companies), "delay": tool_delay}],
+        )),
+        ("Great, find contacts", turn(
+            f"I found the following contacts:\n{people}", "CONTACT_SEARCH",
+            [{"op": "add", "field": "contacts", "value": contacts}],
+            [{"tool": "company_contacts_tool", "result": json.dumps({"new_contacts": contacts}), "delay": tool_delay}],
+        )),
+    ]
+    for i in range(min(email_turns, len(contacts))):
+        email = {"subject": f"Hello {contacts[i]['name']}", "content": "Hi, I'd love to show you our CRM."}
+        script.append(("Approved, next" if i else "Start drafting emails", turn(
+            f"Here's draft #{i + 1}:\nSubject: {email['subject']}\n\n{email['content']}", "EMAIL_GENERATION",
+            [{"op": "set", "field": "current_email", "value": email},
+             {"op": "set", "field": "num_processed_emails", "value": i + 1}],
+        )))
+    return script
+
+def bench_app(size, args):
+    """Time app.MainAgent.handle_input over a scripted conversation"""
+    import app
+    import email_drafting
+
+    email_drafting.draft_email = fake_tool(
+        "draft_email",
+        lambda contact, user_data: {"subject": f"Hello {contact.get('name')}", "content": "Hi there"},
+        delay=args.tool_delay,
+    )
+    script = app_script(size, args.email_turns, args.tool_delay)
+    agent = app.MainAgent(dict(BASIC_INFO))
+    agent.agent = FakeAgent(
+        [response for _, response in script],
+        delay=args.delay,
+        delay_per_token=args.delay_per_token,
+    )
+
+    turns = []
+    for user_text, _ in script:
+        tokens = {}
+
+        def on_progress(event):
+            if event["event"] == "completed":
+                tokens.update(input_tokens=event["input_tokens"], output_tokens=event["output_tokens"])
+
+        start = time.perf_counter()
+        result = agent.handle_input({"text": user_text}, on_progress=on_progress)
+        turns.append({
+            "step": agent.previous_step,
+            "seconds": time.perf_counter() - start,
+            "prompt_chars": agent.last_prompt_chars,
+            "error": result.get("error") if isinstance(result, dict) else None,
+            **tokens,
+        })
+    return summarize(turns)
+
+def workflow_script(size, tool_delay):
+    """Recorded tool calls for a workflow that organizes and drafts `size` contacts"""
+    contacts = make_contacts(size)
+    profile = {"target_industry": "Fintech", "target_roles": ["Head of Sales"], "location": "NYC"}
+    return [{
+        "content": json.dumps([{"contact": c, "email": {"subject": "Hi", "body": "..."}} for c in contacts]),
+        "tool_calls": [
+            {"tool": "linkedin_scraper_tool", "args": {"query": "heads of sales at fintech companies in NYC"}},
+            {"tool": "linkedin_scraper_tool", "args": {"query": "fintech startups NYC sales leadership"}},
+            {"tool": "organize_information_tool", "args": {
+                "scraped_data": "scraped profiles", "target_roles": profile["target_roles"],
+                "target_industry": profile["target_industry"], "location": profile["location"],
+            }},
+            {"tool": "generate_emails_batch_tool", "args": {"contacts": contacts, "user_profile": profile}},
+        ],
+    }], profile
+
+def bench_workflow(size, args):
+    """Time mainAgent.MainAgent.run_workflow over a scripted workflow"""
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    # The scraper is replaced below, so its browser and model dependencies are not
+    # needed; a placeholder module keeps mainAgent from importing them
+    scraper = types.ModuleType("linkedin_scraper")
+    scraper.scrape_linkedin = None
+    sys.modules.setdefault("linkedin_scraper", scraper)
+    import mainAgent
+
+    contacts = make_contacts(size)
+    fake_llm = FakeLLM(
+        lambda prompt: json.dumps(contacts) if "Parse the following raw scraped data" in prompt
+        else json.dumps(FAKE_DRAFT),
+        delay=args.tool_delay,
+    )
+    mainAgent.get_tool_llm = lambda: fake_llm
+    mainAgent.scrape_linkedin = fake_tool(
+        "scrape_linkedin", lambda query: "\n".join(str(c) for c in contacts), delay=args.tool_delay, is_async=True,
+    )
+
+    script, profile = workflow_script(size, args.tool_delay)
+    agent = mainAgent.MainAgent()
+    agent.agent = FakeAgent(
+        script, tools=agent.agent.tools, delay=args.delay, delay_per_token=args.delay_per_token,
+    )
+    user = mainAgent.User(uid="benchmark")
+    user.profile.update(profile)
+
+    start = time.perf_counter()
+    asyncio.run(agent.run_workflow(user))
+    metrics = agent.agent.run_response.metrics
+    return summarize([{
+        "step": "WORKFLOW",
+        "seconds": time.perf_counter() - start,
+        "prompt_chars": len(agent.agent.calls[-1]),
+        "input_tokens": sum(metrics.get("input_tokens", [])),
+        "output_tokens": sum(metrics.get("output_tokens", [])),
+        "llm_calls": fake_llm.calls,
+    }])
+
+def summarize(turns):
+    return {
+        "e2e_seconds": sum(t["seconds"] for t in turns),
+        "max_turn_seconds": max(t["seconds"] for t in turns),
+        "input_tokens": sum(t.get("input_tokens", 0) for t in turns),
+        "output_tokens": sum(t.get("output_tokens", 0) for t in turns),
+        "max_prompt_chars": max(t["prompt_chars"] for t in turns),
+        "turns": turns,
+    }
+
+def find_regressions(results, baseline, tolerance):
+    """List metrics that got worse than the baseline by more than `tolerance` (a fraction)"""
+    regressions = []
+    for pipeline, sizes in baseline.items():
+        for size, expected in sizes.items():
+            actual = results.get(pipeline, {}).get(size)
+            if actual is None:
+                continue
+            for metric in REGRESSION_METRICS:
+                if metric in expected and actual[metric] > expected[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{pipeline}[{size}] {metric}: {actual[metric]:.3f} > baseline {expected[metric]:.3f}"
+                    )
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for the agent pipelines")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="List sizes to benchmark")
+    parser.add_argument("--pipelines", nargs="+", default=["app", "workflow"], choices=["app", "workflow"])
+    parser.add_argument("--email-turns", type=int, default=3, help="EMAIL_GENERATION turns per conversation")
+    parser.add_argument("--delay", type=float, default=0.05, help="Fixed fake model latency per turn (s)")
+    parser.add_argument("--delay-per-token", type=float, default=0.0002, help="Fake generation time per output token (s)")
+    parser.add_argument("--tool-delay", type=float, default=0.05, help="Fake latency of each tool call (s)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before failing (fraction)")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    # The app checkpoints sessions and caches results on import; keep them out of the real databases
+    workdir = tempfile.TemporaryDirectory(prefix="benchmark-")
+    os.environ["CHECKPOINT_PATH"] = os.path.join(workdir.name, "checkpoints.sqlite3")
+    os.environ["RESULT_CACHE_PATH"] = os.path.join(workdir.name, "result_cache.sqlite3")
+
+    benches = {"app": bench_app, "workflow": bench_workflow}
+    results = {}
+    skipped = []
+    for pipeline in args.pipelines:
+        results[pipeline] = {}
+        for size in args.sizes:
+            try:
+                summary = benches[pipeline](size, args)
+            except ImportError as e:
+                print(f"ERROR: {pipeline} pipeline skipped ({e})")
+                skipped.append(pipeline)
+                break
+            results[pipeline][str(size)] = summary
+            print(
+                f"{pipeline:8} size={size:<5} e2e={summary['e2e_seconds']:.3f}s "
+                f"max_turn={summary['max_turn_seconds']:.3f}s in_tokens={summary['input_tokens']} "
+                f"out_tokens={summary['output_tokens']} max_prompt={summary['max_prompt_chars']} chars"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+    # A pipeline that could not run counts as a failure, not a pass
+    return 1 if regressions or skipped else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Pool of warm browser contexts for the LinkedIn scraper.
+
+Launching a browser dominates the cost of a short scrape, so one browser is
+kept running per event loop and its contexts are reused across queries. The
+pool bounds how many contexts are in use at once, retires a context after
+`max_uses` scrapes, and stops keeping idle contexts around once the process
+(and its browser children) use more than `max_memory_mb`.
+
+The browser itself comes from a factory, so tests can swap in a fake browser
+or point the scraper at a local stand-in site via LINKEDIN_BASE_URL.
+"""
+import os
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "20"))
+BROWSER_MAX_MEMORY_MB = int(os.getenv("BROWSER_MAX_MEMORY_MB", "2048"))
+BROWSER_HEADLESS = os.getenv("BROWSER_HEADLESS", "1") == "1"
+
+class BrowserUseFactory:
+    """Launches one browser_use Browser and creates contexts from it"""
+
+    def __init__(self, headless=BROWSER_HEADLESS):
+        self.headless = headless
+        self.browser = None
+
+    async def new_context(self):
+        # browser_use is only needed when a real browser is used
+        from browser_use import Browser, BrowserConfig
+
+        if self.browser is None:
+            self.browser = Browser(config=BrowserConfig(headless=self.headless))
+        return await self.browser.new_context()
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+            self.browser = None
+
+def process_memory_mb():
+    """Resident memory of this process and its children (the browsers), in MB"""
+    import psutil
+
+    process = psutil.Process()
+    rss = process.memory_info().rss
+    for child in process.children(recursive=True):
+        try:
+            rss += child.memory_info().rss
+        except psutil.Error:
+            continue
+    return rss / (1024 * 1024)
+
+class _PooledContext:
+    __slots__ = ("context", "uses")
+
+    def __init__(self, context):
+        self.context = context
+        self.uses = 0
+
+class BrowserPool:
+    """
+    Reuses browser contexts across scrapes, with at most `max_concurrency` in use.
+
+    Use as `async with pool.session() as context:`. A context that raised,
+    reached `max_uses`, or was released while memory was over the limit is
+    closed instead of being kept for the next scrape.
+    """
+
+    def __init__(self, max_concurrency=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES,
+                 max_memory_mb=BROWSER_MAX_MEMORY_MB, factory=None, memory_usage=process_memory_mb):
+        self.max_concurrency = max_concurrency
+        self.max_uses = max_uses
+        self.max_memory_mb = max_memory_mb
+        self.factory = factory or BrowserUseFactory()
+        self.memory_usage = memory_usage
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._idle = []
+        self._in_use = 0
+        self._created = 0
+        self._recycled = 0
+        self._memory_warning_shown = False
+
+    def _over_memory(self):
+        if not self.max_memory_mb or self.memory_usage is None:
+            return False
+        try:
+            return self.memory_usage() > self.max_memory_mb
+        except ImportError:
+            if not self._memory_warning_shown:
+                print("psutil is not installed; the browser pool memory limit is disabled")
+                self._memory_warning_shown = True
+            return False
+
+    async def _close(self, pooled):
+        self._recycled += 1
+        try:
+            await pooled.context.close()
+        except Exception as e:
+            print(f"Error closing browser context: {e}")
+
+    async def _acquire(self):
+        if self._idle and self._over_memory():
+            # Free the idle contexts before opening or reusing one
+            while self._idle:
+                await self._close(self._idle.pop())
+        if self._idle:
+            return self._idle.pop()
+        self._created += 1
+        return _PooledContext(await self.factory.new_context())
+
+    async def _release(self, pooled, failed):
+        pooled.uses += 1
+        if failed or pooled.uses >= self.max_uses or self._over_memory():
+            await self._close(pooled)
+        else:
+            self._idle.append(pooled)
+
+    @asynccontextmanager
+    async def session(self):
+        """Borrow a browser context for one scrape"""
+        async with self._slots:
+            pooled = await self._acquire()
+            self._in_use += 1
+            failed = False
+            try:
+                yield pooled.context
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                self._in_use -= 1
+                await self._release(pooled, failed)
+
+    async def close(self):
+        """Close every idle context and the browser"""
+        while self._idle:
+            await self._close(self._idle.pop())
+        await self.factory.close()
+
+    def stats(self):
+        return {
+            "idle": len(self._idle),
+            "in_use": self._in_use,
+            "created": self._created,
+            "recycled": self._recycled,
+            "max_concurrency": self.max_concurrency,
+        }
+
+# Browsers are bound to the event loop that launched them, so there is one pool per loop
+_pools = weakref.WeakKeyDictionary()
+
+def get_browser_pool(factory=None):
+    """Return the browser pool for the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = BrowserPool(factory=factory)
+    return pool
+
+async def close_browser_pool():
+    """Close the running event loop's pool, if it has one; call before the loop ends"""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
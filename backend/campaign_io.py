@@ -0,0 +1,102 @@
+"""
+Input and output files of the headless campaign runner (run_campaign.py).
+
+Profiles are read from CSV or JSONL files. Results are appended to a JSONL file
+one record per line, tagged with the profile id, which is read back to resume an
+interrupted campaign and to export the contacts it found. Nothing here imports
+the workflow itself, so these helpers work (and are tested) without the model
+and scraper dependencies.
+"""
+import os
+import csv
+import json
+import time
+
+try:
+    from lead_store import LeadStore
+except ImportError:  # imported as backend.campaign_io from the repo root
+    from backend.lead_store import LeadStore
+
+# Profile fields holding lists; in CSV files they are JSON lists or ';'-separated
+LIST_FIELDS = {"target_roles"}
+
+def parse_profile_row(row):
+    """Turn a CSV row into a profile dict, splitting list fields"""
+    profile = {}
+    for key, value in row.items():
+        if key is None or value is None or value == "":
+            continue
+        key = key.strip()
+        value = value.strip()
+        if key in LIST_FIELDS:
+            if value.startswith("["):
+                value = json.loads(value)
+            else:
+                value = [item.strip() for item in value.split(";") if item.strip()]
+        profile[key] = value
+    return profile
+
+def load_profiles(path):
+    """Read profiles from a .csv or .jsonl file; each gets an 'id' (default: its line number)"""
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            profiles = [parse_profile_row(row) for row in csv.DictReader(f)]
+    else:
+        with open(path, encoding="utf-8") as f:
+            profiles = [json.loads(line) for line in f if line.strip()]
+    for number, profile in enumerate(profiles, start=1):
+        profile["id"] = str(profile.get("id") or profile.get("uid") or number)
+    return profiles
+
+def read_progress(path):
+    """Return ({completed profile ids}, {profile id: attempts so far}) from an output file"""
+    completed, attempts = set(), {}
+    if not os.path.exists(path):
+        return completed, attempts
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be cut short if the previous run was killed mid-write
+                continue
+            if record.get("type") == "completed":
+                completed.add(record["profile_id"])
+            elif record.get("type") == "started":
+                attempts[record["profile_id"]] = record.get("attempt", 1)
+    return completed, attempts
+
+def collect_leads(path):
+    """Return a LeadStore of the contacts found by each profile's last attempt in an output file"""
+    leads = LeadStore()
+    if not os.path.exists(path):
+        return leads
+    attempts = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("type") == "started":
+                # A new attempt replaces the contacts of the previous one
+                attempts[record["profile_id"]] = []
+            elif record.get("type") == "contact" and isinstance(record.get("contact"), dict):
+                attempts.setdefault(record["profile_id"], []).append(record["contact"])
+    for profile_id, contacts in attempts.items():
+        leads.extend(contacts, source=profile_id)
+    return leads
+
+class ResultWriter:
+    """Appends records to the output file, flushing each one so nothing is lost on a crash"""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, profile_id, record_type, **data):
+        record = {"profile_id": profile_id, "type": record_type, "timestamp": time.time(), **data}
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Get the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join(SCRIPT_DIR, "checkpoints.sqlite3"))
+
+class CheckpointStore:
+    """
+    SQLite store of each session's workflow state, one row per state field.
+
+    `save` only rewrites the fields that changed since the last save of that
+    session, so a turn that moves to the next email does not rewrite the
+    contact list. Saves are durable once they return (WAL mode).
+    """
+
+    def __init__(self, path=DEFAULT_CHECKPOINT_PATH, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Digest of the last saved value of each (session, field), to skip unchanged fields
+        self._saved = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_fields ("
+            " session_id TEXT NOT NULL,"
+            " field TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, field))"
+        )
+
+    @staticmethod
+    def _digest(encoded):
+        return hashlib.sha1(encoded.encode("utf-8")).digest()
+
+    def save(self, session_id, state):
+        """Write the fields of `state` that changed; returns how many were written"""
+        now = self._clock()
+        with self._lock:
+            saved = self._saved.setdefault(session_id, {})
+            changed = []
+            for field, value in state.items():
+                encoded = json.dumps(value, default=str)
+                digest = self._digest(encoded)
+                if saved.get(field) != digest:
+                    changed.append((session_id, field, encoded, now, digest))
+            if not changed:
+                return 0
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO session_fields (session_id, field, value, updated_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    [row[:4] for row in changed],
+                )
+            for _, field, _, _, digest in changed:
+                saved[field] = digest
+            return len(changed)
+
+    def load(self, session_id):
+        """Return the saved state of `session_id`, or None if there is none"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT field, value FROM session_fields WHERE session_id = ?", (session_id,)
+            ).fetchall()
+            if not rows:
+                return None
+            # What was just read is what is on disk, so the next save can diff against it
+            self._saved[session_id] = {field: self._digest(value) for field, value in rows}
+        return {field: json.loads(value) for field, value in rows}
+
+    def load_field(self, session_id, field):
+        """Return one saved field of `session_id`, or None if it has not been saved"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM session_fields WHERE session_id = ? AND field = ?", (session_id, field)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __contains__(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM session_fields WHERE session_id = ? LIMIT 1", (session_id,)
+            ).fetchone()
+        return row is not None
+
+    def forget(self, session_id):
+        """Drop the in-memory digests of a session that left memory; its rows stay on disk"""
+        with self._lock:
+            self._saved.pop(session_id, None)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._saved.pop(session_id, None)
+            self._conn.execute("DELETE FROM session_fields WHERE session_id = ?", (session_id,))
+
+    def prune(self, max_age_seconds):
+        """Delete sessions not saved for `max_age_seconds`; returns how many were removed"""
+        cutoff = self._clock() - max_age_seconds
+        with self._lock:
+            stale = [row[0] for row in self._conn.execute(
+                "SELECT session_id FROM session_fields GROUP BY session_id HAVING MAX(updated_at) < ?",
+                (cutoff,),
+            )]
+            for session_id in stale:
+                self._saved.pop(session_id, None)
+                self._conn.execute("DELETE FROM session_fields WHERE session_id = ?", (session_id,))
+        return len(stale)
@@ -0,0 +1,51 @@
+import os
+import threading
+import httpx
+
+# Shared provider clients, keyed by whatever identifies their configuration
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Prompt templates: path -> (mtime, text)
+_prompts = {}
+_prompts_lock = threading.Lock()
+
+def get_client(key, factory):
+    """
+    Return the shared client registered under `key`, creating it with `factory()` on first use.
+
+    Clients are kept for the life of the process so their HTTP connection pools
+    (and TLS sessions) are reused across tool calls and sessions.
+    """
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = factory()
+        return _clients[key]
+
+def openai_http_client():
+    """Shared HTTP connection pool for agno OpenAI models"""
+    return get_client("openai-http", lambda: httpx.Client(timeout=httpx.Timeout(600.0, connect=10.0)))
+
+def close_clients():
+    """Close and forget every pooled client that supports closing"""
+    with _clients_lock:
+        for client in _clients.values():
+            close = getattr(client, "close", None)
+            if callable(close):
+                close()
+        _clients.clear()
+
+def load_prompt(path):
+    """Return the contents of a prompt file, re-reading it only when its mtime changes"""
+    mtime = os.path.getmtime(path)
+    cached = _prompts.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with _prompts_lock:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        _prompts[path] = (mtime, text)
+        return text
@@ -0,0 +1,255 @@
+"""
+Deterministic extraction of contact records from LinkedIn scrape output.
+
+scrape_linkedin results are semi-structured: JSON lists of people, the
+`extracted_content='...'` strings of a browser_use history, "Name - Role at
+Company" lines, "Name: ..., Role: ..." lines and bare linkedin.com/in/ URLs.
+parse_scraped_contacts turns those into the records organize_information_tool
+returns, with a confidence score so the caller can fall back to the LLM when the
+text did not look like anything we know, or mentioned people it could not read.
+"""
+import re
+import ast
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+try:
+    from single_flight import fold_synonyms
+except ImportError:  # imported as backend.contact_parser from the repo root
+    from backend.single_flight import fold_synonyms
+
+# Field names used by scrapers and models for each contact attribute
+FIELD_ALIASES = {
+    "name": ("name", "full_name", "fullname", "person"),
+    "role": ("role", "title", "job_title", "position", "headline"),
+    "company": ("company", "company_name", "organization", "organisation", "employer"),
+    "profile_url": ("profile_url", "linkedin", "linkedin_url", "profile", "url"),
+    "location": ("location", "city", "region"),
+    "industry": ("industry", "sector"),
+}
+
+# Words ignored when matching roles, industries and locations
+STOPWORDS = {"a", "an", "and", "at", "for", "in", "of", "on", "the", "&", "-", "/"}
+
+EXTRACTED_CONTENT_RE = re.compile(r"""extracted_content=('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")""")
+PROFILE_URL_RE = re.compile(r"(?:https?://)?(?:[a-z]{2,3}\.)?linkedin\.com/in/([A-Za-z0-9_%-]+)/?", re.IGNORECASE)
+BULLET_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+# "Jane Doe - Head of Sales at Acme", "Jane Doe | CEO @ Acme", "Jane Doe, VP Sales at Acme"
+ROLE_AT_RE = re.compile(
+    r"^(?P<name>[^|,:–—-]+?)\s*[|,:–—-]\s*(?P<role>.+?)\s+(?:at|@)\s+(?P<company>.+)$"
+)
+# "Name: Jane Doe, Role: CEO, Company: Acme"
+KEY_VALUE_RE = re.compile(r"(?P<key>[A-Za-z_ ]+?)\s*:\s*(?P<value>[^,;]+)")
+NAME_RE = re.compile(r"^[A-Z][\w'.À-ſ-]*(?:\s+[A-Z][\w'.À-ſ-]*){1,3}$")
+# Two capitalized words in a line that gave no record, e.g. "We also spoke with Mark Smith"
+MENTION_RE = re.compile(r"\b[A-Z][a-z'À-ſ-]+\s+[A-Z][a-z'À-ſ-]+\b")
+
+# Words naming the job itself rather than its area, e.g. "manager" in "Sales Manager"
+TITLE_HEADS = {
+    "head", "vp", "president", "director", "chief", "ceo", "cto", "cfo", "cmo", "coo", "officer",
+    "founder", "owner", "partner", "manager", "lead", "engineer", "developer", "architect", "scientist",
+    "designer", "analyst", "consultant", "specialist", "executive", "representative", "associate",
+    "recruiter", "coordinator", "administrator",
+}
+
+@dataclass
+class ParseResult:
+    """Contacts found in a scrape and how sure the parser is that it found them all"""
+    contacts: List[Dict[str, Any]] = field(default_factory=list)
+    confidence: float = 0.0
+
+def parse_json_block(text):
+    """
+    Return the first JSON list or object in `text`, or None.
+
+    Tolerates markdown fences and prose around the JSON, which model responses
+    often include even when asked not to.
+    """
+    if not isinstance(text, str):
+        return text
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"[\[{]", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        return value
+    return None
+
+def _profile_url(slug):
+    """Canonical form of a LinkedIn profile URL, so the same profile always compares equal"""
+    return f"https://www.linkedin.com/in/{slug.lower()}/"
+
+def normalize_contact(record):
+    """Map a record's fields onto name/role/company/profile_url/location/industry"""
+    lowered = {str(k).lower().strip(): v for k, v in record.items()}
+    contact = {}
+    for name, aliases in FIELD_ALIASES.items():
+        for alias in aliases:
+            value = lowered.get(alias)
+            if isinstance(value, str) and value.strip():
+                contact[name] = value.strip()
+                break
+    if "profile_url" in contact:
+        url = PROFILE_URL_RE.search(contact.pop("profile_url"))
+        if url:
+            contact["profile_url"] = _profile_url(url.group(1))
+    return contact
+
+def _segments(text):
+    """The extracted_content strings of a browser_use history, or the whole text"""
+    segments = []
+    for match in EXTRACTED_CONTENT_RE.finditer(text):
+        try:
+            segments.append(ast.literal_eval(match.group(1)))
+        except (ValueError, SyntaxError):
+            continue
+    return segments or [text]
+
+def _json_records(segment):
+    """Contact-like dicts from the JSON values in `segment`"""
+    value = parse_json_block(segment)
+    if isinstance(value, dict):
+        lists = [v for v in value.values() if isinstance(v, list)]
+        value = lists[0] if lists else [value]
+    if not isinstance(value, list):
+        return []
+    return [normalize_contact(v) for v in value if isinstance(v, dict)]
+
+def _name_from_slug(slug):
+    words = [w for w in re.split(r"[-_]", slug) if w.isalpha()]
+    return " ".join(w.capitalize() for w in words[:4])
+
+def _line_record(line):
+    """Parse one line of text into a contact dict (possibly empty)"""
+    url = PROFILE_URL_RE.search(line)
+    text = PROFILE_URL_RE.sub("", line)
+    text = BULLET_RE.sub("", text).strip(" \t()[]<>")
+    record = {}
+
+    pairs = KEY_VALUE_RE.findall(text)
+    if len(pairs) >= 2:
+        record = normalize_contact({key: value for key, value in pairs})
+    else:
+        match = ROLE_AT_RE.match(text)
+        if match:
+            record = {k: v.strip(" .") for k, v in match.groupdict().items()}
+        elif "|" in text:
+            parts = [p.strip() for p in text.split("|") if p.strip()]
+            if len(parts) >= 3:
+                record = {"name": parts[0], "role": parts[1], "company": parts[2]}
+
+    if record.get("name") and not NAME_RE.match(record["name"]):
+        record = {}
+    if url:
+        record["profile_url"] = _profile_url(url.group(1))
+        record.setdefault("name", _name_from_slug(url.group(1)))
+    return record
+
+def _line_records(segment):
+    """Records parsed from the lines of `segment`, and how many other lines seem to mention someone"""
+    records, missed = [], 0
+    for line in segment.splitlines():
+        record = _line_record(line)
+        if not record.get("name"):
+            missed += bool(MENTION_RE.search(line))
+            continue
+        # A profile URL on its own line belongs to the contact above it
+        if records and set(record) == {"name", "profile_url"} and "profile_url" not in records[-1]:
+            records[-1]["profile_url"] = record["profile_url"]
+            continue
+        records.append(record)
+    return records, missed
+
+def _completeness(contact):
+    return (1 + sum(1 for key in ("role", "company", "profile_url") if contact.get(key))) / 4
+
+def dedupe_contacts(contacts):
+    """Drop repeated contacts, matching on profile URL, then name and company; later copies fill gaps"""
+    unique = {}
+    for contact in contacts:
+        url = PROFILE_URL_RE.search(str(contact.get("profile_url") or ""))
+        key = _profile_url(url.group(1)) if url else (
+            str(contact.get("name") or "").lower(), str(contact.get("company") or "").lower()
+        )
+        if key in unique:
+            for name, value in contact.items():
+                unique[key].setdefault(name, value)
+        else:
+            unique[key] = dict(contact)
+    return list(unique.values())
+
+def parse_scraped_contacts(text):
+    """
+    Extract contact records from scrape output.
+
+    The confidence is the mean completeness of the records found (a name plus
+    role, company and profile URL) times their coverage: the share of the
+    lines naming someone that were parsed. It is 0 when nothing was found.
+    """
+    contacts, missed = [], 0
+    for segment in _segments(str(text)):
+        records = _json_records(segment)
+        if not any(r.get("name") for r in records):
+            records, segment_missed = _line_records(segment)
+            missed += segment_missed
+        contacts.extend(records)
+    contacts = [c for c in contacts if c.get("name")]
+    if not contacts:
+        return ParseResult()
+    coverage = len(contacts) / (len(contacts) + missed)
+    contacts = dedupe_contacts(contacts)
+    return ParseResult(contacts, coverage * sum(_completeness(c) for c in contacts) / len(contacts))
+
+def _keywords(text):
+    """Keywords of `text` in order, with synonyms folded ("Vice President of Sales" -> vp, sales)"""
+    return [w for w in re.findall(r"[a-z0-9]+", fold_synonyms(text)) if w not in STOPWORDS]
+
+def _head(keywords):
+    """The word naming what a target is: its last title word ("head" in "Head of Sales"), else its last word"""
+    heads = [w for w in keywords if w in TITLE_HEADS]
+    return heads[-1] if heads else keywords[-1]
+
+def _matches(value, targets):
+    """
+    True when `value` has the head word and at least half the keywords of one of `targets`.
+
+    "Senior Sales Manager" matches "Sales Manager"; "Sales Engineer" does not.
+    """
+    words = set(_keywords(value))
+    for target in targets:
+        wanted = _keywords(target)
+        if wanted and _head(wanted) in words and len(words & set(wanted)) * 2 >= len(set(wanted)):
+            return True
+    return False
+
+def filter_contacts(contacts, target_roles=None, target_industry=None, location=None):
+    """
+    Keep the contacts matching the targets, each with a 'justification'.
+
+    Roles must match one of `target_roles`. Industry and location only rule a
+    contact out when the record has that field, since scrapes rarely include them.
+    """
+    if isinstance(target_roles, str):
+        target_roles = [target_roles]
+    matched = []
+    for contact in contacts:
+        if target_roles and not _matches(contact.get("role", ""), target_roles):
+            continue
+        if target_industry and contact.get("industry") and not _matches(contact["industry"], [target_industry]):
+            continue
+        if location and contact.get("location") and not _matches(contact["location"], [location]):
+            continue
+        reason = f"Matches target role {contact['role']}" if target_roles else "Found in the scrape"
+        if target_industry and contact.get("industry"):
+            reason += f" in {contact['industry']}"
+        if location and contact.get("location"):
+            reason += f", based in {contact['location']}"
+        matched.append({**contact, "justification": reason + "."})
+    return matched
+
+def extract_contacts(text, target_roles=None, target_industry=None, location=None):
+    """Parse scrape output and filter it; returns (contacts, confidence)"""
+    result = parse_scraped_contacts(text)
+    return filter_contacts(result.contacts, target_roles, target_industry, location), result.confidence
@@ -0,0 +1,115 @@
+import os
+import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from agno.agent import Agent
+from agno.models.openai import OpenAIChat
+from client_pool import openai_http_client
+from metrics import span
+from rate_limiter import get_limiter, estimate_tokens
+from json_stream import parse_response
+from email_templates import TemplateDrafter
+
+# Model used to draft each email
+DRAFT_MODEL_ID = 'gpt-4.1-mini'
+
+# "template" builds each email from a cached campaign template, company paragraph
+# and recipient opening line; "full" has the model write every email from scratch
+EMAIL_DRAFT_MODE = os.getenv('EMAIL_DRAFT_MODE', 'template')
+
+# At most this many drafts are requested from the model at once per batch
+EMAIL_DRAFT_CONCURRENCY = int(os.getenv('EMAIL_DRAFT_CONCURRENCY', '5'))
+
+# Background drafts from every session share this pool, so a turn can return while the rest are drafted
+_draft_workers = ThreadPoolExecutor(
+    max_workers=int(os.getenv('EMAIL_DRAFT_WORKERS', '16')),
+    thread_name_prefix='draft-email',
+)
+
+draft_instructions = """
+    You draft concise and compelling personalized sales outreach emails.
+    You will receive a JSON object with:
+    1. sender: The profile of the sales person sending the email, including any context about their offer
+    2. recipient: The contact the email is addressed to
+
+    Personalize the email using the recipient's name, role and company, and keep it focused on the sender's purpose.
+    Your entire response MUST be a single JSON object with a 'subject' and a 'content' field, and nothing else.
+    """
+
+def make_agent(instructions):
+    """Build a JSON-mode drafting agent; swapped out by fake_llm.install_fake_models for offline runs"""
+    return Agent(
+        model=OpenAIChat(
+            id=DRAFT_MODEL_ID,
+            api_key=os.getenv('OPENAI_API_KEY'),
+            http_client=openai_http_client(),
+        ),
+        use_json_mode=True,
+        instructions=[instructions],
+    )
+
+def complete_json(instructions, payload):
+    """Run one JSON-mode model call with `instructions` on `payload`; returns the response object"""
+    # Agents keep per-run state, so each call gets its own (they share the HTTP pool)
+    agent = make_agent(instructions)
+    message = json.dumps(payload, default=str)
+    limiter = get_limiter("openai")
+    with span("model", DRAFT_MODEL_ID) as model_span:
+        run = limiter.call(agent.run, message, estimated_tokens=estimate_tokens(message))
+        metrics = run.metrics or {}
+        model_span.add_tokens(sum(metrics.get("input_tokens", [])), sum(metrics.get("output_tokens", [])))
+        limiter.record_tokens(model_span.input_tokens + model_span.output_tokens, estimate_tokens(message))
+    return parse_response(run.content)
+
+template_drafter = TemplateDrafter(complete_json)
+
+def draft_email(contact, user_data):
+    """
+    Draft an outreach email to `contact` on behalf of `user_data`.
+
+    Returns a dict with 'subject' and 'content' keys.
+    """
+    if EMAIL_DRAFT_MODE == "template":
+        return template_drafter.draft(contact, user_data)
+
+    draft = complete_json(draft_instructions, {"sender": user_data, "recipient": contact})
+    if "subject" not in draft or "content" not in draft:
+        raise ValueError(f"Unexpected email draft format: {draft}")
+    return {"subject": draft["subject"], "content": draft["content"]}
+
+def _safe_draft(contact, user_data):
+    try:
+        return draft_email(contact, user_data)
+    except Exception as e:
+        print(f"Error drafting email for {contact}: {e}")
+        return None
+
+def submit_batch(contacts, user_data, concurrency=None):
+    """
+    Start drafting `contacts` in the background, at most `concurrency` at a time.
+
+    Returns one Future per contact, in order, resolving to its draft (None if it
+    failed). Contacts are drafted in order, so the first ones are ready first,
+    and cancelling a future that has not started skips that contact.
+    """
+    contacts, user_data = list(contacts), dict(user_data)
+    futures = [Future() for _ in contacts]
+    pending = iter(range(len(contacts)))
+    lock = threading.Lock()
+
+    def start_next():
+        with lock:
+            index = next(pending, None)
+        if index is not None:
+            _draft_workers.submit(run, index)
+
+    def run(index):
+        try:
+            if futures[index].set_running_or_notify_cancel():
+                futures[index].set_result(_safe_draft(contacts[index], user_data))
+        finally:
+            start_next()
+
+    for _ in range(min(concurrency or EMAIL_DRAFT_CONCURRENCY, len(contacts))):
+        start_next()
+    return futures
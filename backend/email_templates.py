@@ -0,0 +1,131 @@
+"""
+Template-plus-slots drafting of outreach emails.
+
+Instead of asking the model for every email from scratch, a campaign's emails
+are built from three kinds of pieces:
+
+- the campaign template (subject, pitch and closing), generated once per sender
+- a paragraph on why the offer fits a company, generated once per company
+- the recipient-specific opening line, generated once per contact
+
+Every piece is cached in the result cache, and concurrent requests for the same
+piece share one model call, so contacts at the same company only pay for their
+own opening line. The pieces are assembled into the email locally.
+"""
+import json
+
+try:
+    from result_cache import get_cache, MISSING, normalize_query
+    from single_flight import SingleFlight
+except ImportError:  # imported as backend.email_templates from the repo root
+    from backend.result_cache import get_cache, MISSING, normalize_query
+    from backend.single_flight import SingleFlight
+
+template_instructions = """
+    You write the shared part of a sales outreach email campaign, reused for every recipient.
+    You will receive a JSON object with:
+    1. sender: The profile of the sales person sending the emails, including any context about their offer
+
+    Your entire response MUST be a single JSON object with these fields, and nothing else:
+    1. subject: The subject line. It may use the placeholders {first_name} and {company} for the recipient's first name and company.
+    2. pitch: One or two short paragraphs presenting the sender's offer. Do not greet or name the recipient.
+    3. closing: A one or two sentence call to action, followed by a sign-off with the sender's name.
+    """
+
+company_instructions = """
+    You write one paragraph of a sales outreach email, explaining why the sender's offer is relevant to the recipient's company.
+    You will receive a JSON object with:
+    1. sender: The profile of the sales person sending the email, including any context about their offer
+    2. company: The recipient's company
+
+    Write two or three sentences. Do not greet or name the recipient, and do not restate the whole offer.
+    Your entire response MUST be a single JSON object with a 'paragraph' field, and nothing else.
+    """
+
+slot_instructions = """
+    You write the opening line of a sales outreach email to one recipient.
+    You will receive a JSON object with:
+    1. sender: The profile of the sales person sending the email
+    2. recipient: The contact the email is addressed to
+
+    Write one sentence, under 40 words, tied to the recipient's role or work. Do not greet them; the greeting is added separately.
+    Your entire response MUST be a single JSON object with an 'opening' field, and nothing else.
+    """
+
+# One flight per piece kind, shared by every drafter so concurrent drafts coalesce
+_flights = {kind: SingleFlight(f"email_{kind}") for kind in ("templates", "companies", "slots")}
+
+def _field(contact, *names):
+    lowered = {str(k).lower(): v for k, v in contact.items()}
+    for name in names:
+        if lowered.get(name):
+            return str(lowered[name]).strip()
+    return ""
+
+def recipient_company(contact):
+    return _field(contact, "company", "company_name", "organization", "organisation", "employer")
+
+def recipient_first_name(contact):
+    name = _field(contact, "first_name", "name", "full_name")
+    return name.split()[0] if name else ""
+
+def assemble_email(template, paragraph, slots, contact):
+    """Build the email to `contact` from its pieces; returns a dict with 'subject' and 'content'"""
+    first_name = recipient_first_name(contact)
+    company = recipient_company(contact)
+    subject = template.get("subject", "")
+    subject = subject.replace("{first_name}", first_name or "there").replace("{company}", company or "your team")
+    parts = [
+        f"Hi {first_name}," if first_name else "Hi,",
+        slots.get("opening", ""),
+        paragraph,
+        template.get("pitch", ""),
+        template.get("closing", ""),
+    ]
+    return {"subject": subject.strip(), "content": "\n\n".join(p.strip() for p in parts if p and p.strip())}
+
+class TemplateDrafter:
+    """
+    Drafts emails from cached campaign, company and recipient pieces.
+
+    `generate(instructions, payload)` makes one model call and returns its
+    response as a dict; pieces missing the fields they need raise ValueError.
+    """
+
+    def __init__(self, generate, cache=None):
+        self.generate = generate
+        self.cache = cache
+
+    def _piece(self, kind, query, instructions, required):
+        cache = self.cache or get_cache()
+        namespace = f"email_{kind}"
+        value = cache.get(namespace, query)
+        if value is not MISSING:
+            return value
+
+        def run():
+            piece = self.generate(instructions, query)
+            if not isinstance(piece, dict) or any(not piece.get(field) for field in required):
+                raise ValueError(f"Unexpected {kind} piece: {piece}")
+            cache.set(namespace, query, piece)
+            return piece
+
+        key = json.dumps(normalize_query(query), sort_keys=True, default=str)
+        return _flights[kind].do(key, run)
+
+    def template(self, user_data):
+        return self._piece("templates", {"sender": user_data}, template_instructions, ("subject", "pitch", "closing"))
+
+    def company_paragraph(self, user_data, company):
+        piece = self._piece("companies", {"sender": user_data, "company": company}, company_instructions, ("paragraph",))
+        return piece["paragraph"]
+
+    def slots(self, user_data, contact):
+        return self._piece("slots", {"sender": user_data, "recipient": contact}, slot_instructions, ("opening",))
+
+    def draft(self, contact, user_data):
+        """Draft the email to `contact`; returns a dict with 'subject' and 'content'"""
+        company = recipient_company(contact)
+        template = self.template(user_data)
+        paragraph = self.company_paragraph(user_data, company) if company else ""
+        return assemble_email(template, paragraph, self.slots(user_data, contact), contact)
@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import asyncio
+import inspect
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# Rough characters-per-token ratio used when a response does not record token counts
+CHARS_PER_TOKEN = 4
+
+# Defaults for install_fake_models: the JSON file of recorded turns the server
+# replays (see FakeAgent) instead of calling the models, e.g. for load tests,
+# and the latencies it simulates. Email drafts get FAKE_DRAFT.
+FAKE_LLM_SCRIPT = os.getenv('FAKE_LLM_SCRIPT', '')
+FAKE_LLM_DELAY = float(os.getenv('FAKE_LLM_DELAY', '0.5'))
+FAKE_LLM_DELAY_PER_TOKEN = float(os.getenv('FAKE_LLM_DELAY_PER_TOKEN', '0.002'))
+
+# A response carrying every field the email drafting prompts ask for
+FAKE_DRAFT = {
+    "subject": "Quick question about {company}",
+    "content": "Hi, I'd love to show you how we could help your team.",
+    "pitch": "Our CRM helps sales teams spend less time on data entry.",
+    "closing": "Would you be open to a short call next week?",
+    "paragraph": "Your team is growing quickly, which is when this matters most.",
+    "opening": "I saw your team is hiring across sales.",
+}
+
+@dataclass
+class FakeRunResponse:
+    """The parts of agno's RunResponse that our code reads"""
+    content: Any = None
+    event: str = "RunResponse"
+    tools: Optional[List[Dict[str, Any]]] = None
+    metrics: Dict[str, List[int]] = field(default_factory=dict)
+
+class FakeAgent:
+    """
+    Offline stand-in for an agno Agent that replays recorded responses.
+
+    `responses` is a list of recorded turns (replayed in order, wrapping
+    around) or a callable taking the prompt and returning one. A turn is a dict:
+    - content: The text the model returns (a dict/list is JSON encoded)
+    - tool_calls: Optional list of {"tool", "args", "result", "delay"}. When
+      "result" is given the tool is simulated, otherwise the matching function
+      in `tools` is called with "args"
+    - input_tokens / output_tokens: Optional token counts, estimated from the
+      prompt and content length when missing
+    - delay: Optional fixed latency in seconds for the turn
+
+    Each turn sleeps for `delay + output_tokens * delay_per_token` to model
+    generation time, and streams its content in chunks of `chunk_chars`.
+    """
+
+    def __init__(self, responses, tools=None, delay=0.0, delay_per_token=0.0, chunk_chars=16):
+        self.responses = responses
+        self.tools = list(tools or [])
+        self.delay = delay
+        self.delay_per_token = delay_per_token
+        self.chunk_chars = chunk_chars
+        self.instructions = []
+        self.run_response = FakeRunResponse()
+        self.calls = []
+        self._turn = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """Load recorded responses from a JSON file holding a list of turns"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def _next_response(self, message):
+        self.calls.append(message)
+        if callable(self.responses):
+            response = self.responses(message)
+        else:
+            response = self.responses[self._turn % len(self.responses)]
+        self._turn += 1
+        content = response.get("content", "")
+        if not isinstance(content, str):
+            content = json.dumps(content)
+        input_tokens = response.get("input_tokens", len(str(message)) // CHARS_PER_TOKEN)
+        output_tokens = response.get("output_tokens", len(content) // CHARS_PER_TOKEN)
+        delay = response.get("delay", self.delay) + output_tokens * self.delay_per_token
+        return response, content, input_tokens, output_tokens, delay
+
+    def _tool(self, name):
+        for tool in self.tools:
+            if getattr(tool, "__name__", None) == name:
+                return tool
+        raise KeyError(f"FakeAgent has no tool named {name!r}")
+
+    def _finish(self, content, input_tokens, output_tokens):
+        self.run_response = FakeRunResponse(
+            content=content,
+            event="RunCompleted",
+            metrics={"input_tokens": [input_tokens], "output_tokens": [output_tokens]},
+        )
+        return self.run_response
+
+    def _chunks(self, content):
+        for start in range(0, len(content), self.chunk_chars):
+            yield FakeRunResponse(content=content[start:start + self.chunk_chars])
+
+    def run(self, message=None, stream=False, stream_intermediate_steps=False, **kwargs):
+        """Replay one turn; returns a FakeRunResponse, or an iterator of them when streaming"""
+        if stream:
+            return self._run_stream(message, stream_intermediate_steps)
+        response, content, input_tokens, output_tokens, delay = self._next_response(message)
+        for call in response.get("tool_calls", []):
+            self._call_tool(call)
+        time.sleep(delay)
+        return self._finish(content, input_tokens, output_tokens)
+
+    def _run_stream(self, message, stream_intermediate_steps):
+        response, content, input_tokens, output_tokens, delay = self._next_response(message)
+        for call in response.get("tool_calls", []):
+            tools = [{"tool_name": call["tool"], "tool_args": call.get("args", {})}]
+            if stream_intermediate_steps:
+                yield FakeRunResponse(event="ToolCallStarted", tools=tools)
+            self._call_tool(call)
+            if stream_intermediate_steps:
+                yield FakeRunResponse(event="ToolCallCompleted", tools=tools)
+        chunks = list(self._chunks(content))
+        for chunk in chunks:
+            time.sleep(delay / max(len(chunks), 1))
+            yield chunk
+        self._finish(content, input_tokens, output_tokens)
+
+    def _call_tool(self, call):
+        time.sleep(call.get("delay", 0.0))
+        if "result" in call:
+            return call["result"]
+        return self._tool(call["tool"])(**call.get("args", {}))
+
+    async def arun(self, message=None, **kwargs):
+        """Async replay of one turn; async tools are awaited"""
+        response, content, input_tokens, output_tokens, delay = self._next_response(message)
+        for call in response.get("tool_calls", []):
+            await asyncio.sleep(call.get("delay", 0.0))
+            if "result" in call:
+                continue
+            result = self._tool(call["tool"])(**call.get("args", {}))
+            if inspect.isawaitable(result):
+                await result
+        await asyncio.sleep(delay)
+        return self._finish(content, input_tokens, output_tokens)
+
+def install_fake_models(script_path=FAKE_LLM_SCRIPT, delay=FAKE_LLM_DELAY, delay_per_token=FAKE_LLM_DELAY_PER_TOKEN):
+    """
+    Make the server replay `script_path` instead of calling the models.
+
+    Replaces the agent factories of app (each session gets a FakeAgent over the
+    recorded turns, with its real tools) and email_drafting (every draft is
+    FAKE_DRAFT). Call it before the server starts.
+    """
+    import app
+    import email_drafting
+
+    with open(script_path, "r", encoding="utf-8") as f:
+        responses = json.load(f)
+    app.make_agent = lambda tools, instructions: FakeAgent(
+        responses, tools=tools, delay=delay, delay_per_token=delay_per_token)
+    email_drafting.make_agent = lambda instructions: FakeAgent(
+        [{"content": FAKE_DRAFT}], delay=delay, delay_per_token=delay_per_token)
+
+class FakeLLM:
+    """
+    Offline stand-in for a model client used directly by tools (`acall`).
+
+    `respond` maps the prompt to the response text; `delay` is the latency of
+    each call in seconds.
+    """
+
+    def __init__(self, respond, delay=0.0):
+        self.respond = respond
+        self.delay = delay
+        self.calls = 0
+
+    async def acall(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.respond(prompt)
+
+def fake_tool(name, result, delay=0.0, is_async=False):
+    """Build a tool named `name` that waits `delay` seconds and returns `result`"""
+    if is_async:
+        async def tool(*args, **kwargs):
+            await asyncio.sleep(delay)
+            return result(*args, **kwargs) if callable(result) else result
+    else:
+        def tool(*args, **kwargs):
+            time.sleep(delay)
+            return result(*args, **kwargs) if callable(result) else result
+    tool.__name__ = name
+    return tool
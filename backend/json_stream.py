@@ -0,0 +1,223 @@
+"""
+Incremental parsing of the agent's streamed JSON response.
+
+The model answers with one JSON object such as {"text": ..., "step": ..., "patch": [...]}.
+JsonResponseParser is fed the response chunk by chunk as it streams in. It
+passes the decoded characters of the top-level "text" string to `on_text` as
+soon as they arrive, so the client can show the reply before the rest of the
+object is generated. Every other field is only buffered and parsed once the
+object is complete.
+
+Common formatting slips are recovered without asking the model again: markdown
+fences or prose around the object, trailing garbage after it, and a response
+cut off before its closing brackets.
+"""
+import re
+import json
+
+class JsonStreamError(ValueError):
+    """Raised when a streamed response does not contain a usable JSON object"""
+
+# Scanner states for the top-level object
+_BEFORE, _KEY, _KEY_STRING, _AFTER_KEY, _VALUE, _STRING, _NESTED, _SCALAR, _AFTER_VALUE, _DONE = range(10)
+
+# A trailing escape that may still be incomplete: a lone backslash, a partial
+# \uXXXX, or a high surrogate whose low half has not arrived yet
+_PARTIAL_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{0,3}|u[dD][89abAB][0-9a-fA-F]{2}(\\u?[0-9a-fA-F]{0,3})?)?$')
+
+def _safe_end(raw):
+    """Length of the prefix of an unterminated JSON string body that can be decoded now"""
+    match = _PARTIAL_ESCAPE.search(raw)
+    if match is None:
+        return len(raw)
+    # Only an escape if the backslash itself is not escaped
+    backslashes = len(raw[:match.start()]) - len(raw[:match.start()].rstrip("\\"))
+    return match.start() if backslashes % 2 == 0 else len(raw)
+
+def _decode_key(raw):
+    try:
+        return json.loads('"' + raw + '"')
+    except json.JSONDecodeError:
+        return raw
+
+class JsonResponseParser:
+    """Streaming parser for one JSON object; `text_field` is streamed to `on_text`"""
+
+    def __init__(self, on_text=None, text_field="text"):
+        self.on_text = on_text
+        self.text_field = text_field
+        self.reset()
+
+    def reset(self):
+        """Forget everything fed so far, e.g. when the response is restarted"""
+        self.buffer = []
+        self.text = ""
+        self._state = _BEFORE
+        self._start = None        # Offset of the opening brace in the joined input
+        self._end = None          # Offset just past the closing brace
+        self._offset = 0
+        self._value_end = None    # Offset just past the last complete top-level value
+        self._key = []
+        self._current_key = None
+        self._escaped = False
+        self._string_raw = []     # Undecoded body of the text string so far
+        self._decoded_upto = 0
+        self._stack = []          # Open brackets inside a nested value
+        self._in_nested_string = False
+
+    def feed(self, chunk):
+        """Consume the next chunk of the response"""
+        self.buffer.append(chunk)
+        for char in chunk:
+            self._step(char)
+            self._offset += 1
+        if self._state == _STRING and self._current_key == self.text_field:
+            self._emit_text()
+
+    def _emit_text(self, final=False):
+        raw = "".join(self._string_raw)
+        end = len(raw) if final else _safe_end(raw)
+        if end <= self._decoded_upto:
+            return
+        try:
+            delta = json.loads('"' + raw[self._decoded_upto:end] + '"')
+        except json.JSONDecodeError:
+            # Invalid escape: pass the raw characters through rather than stall the stream
+            delta = raw[self._decoded_upto:end]
+        self._decoded_upto = end
+        self.text += delta
+        if self.on_text is not None and delta:
+            self.on_text(delta)
+
+    def _step(self, char):
+        state = self._state
+        if state == _BEFORE:
+            # Fences and prose before the object are skipped
+            if char == "{":
+                self._start = self._offset
+                self._state = _KEY
+        elif state == _KEY:
+            if char == '"':
+                self._key = []
+                self._state = _KEY_STRING
+            elif char == "}":
+                self._close()
+        elif state == _KEY_STRING:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                self._current_key = _decode_key("".join(self._key))
+                self._state = _AFTER_KEY
+                return
+            self._key.append(char)
+        elif state == _AFTER_KEY:
+            if char == ":":
+                self._state = _VALUE
+        elif state == _VALUE:
+            if char == '"':
+                self._state = _STRING
+                self._string_raw = []
+                self._decoded_upto = 0
+            elif char in "[{":
+                self._stack = [char]
+                self._in_nested_string = False
+                self._state = _NESTED
+            elif not char.isspace():
+                self._state = _SCALAR
+        elif state == _STRING:
+            if self._escaped:
+                self._escaped = False
+            elif char == "\\":
+                self._escaped = True
+            elif char == '"':
+                if self._current_key == self.text_field:
+                    self._emit_text(final=True)
+                self._end_value(self._offset + 1)
+                return
+            if self._current_key == self.text_field:
+                self._string_raw.append(char)
+        elif state == _NESTED:
+            if self._in_nested_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_nested_string = False
+            elif char == '"':
+                self._in_nested_string = True
+            elif char in "[{":
+                self._stack.append(char)
+            elif char in "]}":
+                self._stack.pop()
+                if not self._stack:
+                    self._end_value(self._offset + 1)
+        elif state == _SCALAR:
+            if char == "," or char == "}":
+                self._end_value(self._offset)
+                self._step(char)
+        elif state == _AFTER_VALUE:
+            if char == ",":
+                self._next_key()
+            elif char == "}":
+                self._close()
+
+    def _end_value(self, end):
+        self._value_end = end
+        self._state = _AFTER_VALUE
+
+    def _next_key(self):
+        self._current_key = None
+        self._state = _KEY
+
+    def _close(self):
+        self._end = self._offset + 1
+        self._state = _DONE
+
+    @property
+    def complete(self):
+        """True once the closing brace of the top-level object has been seen"""
+        return self._state == _DONE
+
+    def result(self):
+        """
+        Parse the complete object and return it as a dict.
+
+        Anything after the closing brace is ignored. A response that stopped
+        before the object was closed is completed with the missing quotes and
+        brackets where that is safe. Raises JsonStreamError if no object can be recovered.
+        """
+        data = "".join(self.buffer)
+        if self._start is None:
+            raise JsonStreamError("No JSON object in the response")
+        if self._end is not None:
+            candidate = data[self._start:self._end]
+        else:
+            candidate = self._truncated(data)
+        try:
+            result = json.loads(candidate)
+        except json.JSONDecodeError as e:
+            raise JsonStreamError(f"Invalid JSON response: {e}") from e
+        if not isinstance(result, dict):
+            raise JsonStreamError(f"Expected a JSON object, got {type(result).__name__}")
+        return result
+
+    def _truncated(self, data):
+        """
+        The object of a response that ended early, closed after what it got through.
+
+        A cut-off text string keeps what was streamed of it. Any other half-written
+        field is dropped: a partial patch must never be applied.
+        """
+        if self._state == _STRING and self._current_key == self.text_field:
+            raw = "".join(self._string_raw)
+            return data[self._start:self._offset - len(raw) + _safe_end(raw)] + '"}'
+        return data[self._start:self._value_end or self._start + 1] + "}"
+
+def parse_response(text, on_text=None):
+    """Parse a whole response at once, with the same recovery as the streaming parser"""
+    parser = JsonResponseParser(on_text=on_text)
+    parser.feed(text)
+    return parser.result()
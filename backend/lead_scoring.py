@@ -0,0 +1,176 @@
+"""
+Local scoring of contacts against the user's targeting, before any emails are drafted.
+
+Every contact and every target (roles, industry, location, context) is turned
+into a hashed bag of word unigrams, bigrams and character trigrams. Role and
+location synonyms are folded to one spelling first, so "VP Sales" matches "Vice
+President of Sales". Scores are cosine similarities computed for all contacts at
+once with NumPy, combined with FIELD_WEIGHTS over the fields a contact actually
+has. rank_contacts then sorts by score, drops weak matches and caps the list, so
+thousands of candidates are pruned in a fraction of a second before any
+drafting tokens are spent. Contacts with none of the compared fields (e.g. just
+a name, LinkedIn URL and email) cannot be judged, so they are kept, unscored.
+"""
+import os
+import re
+import zlib
+import functools
+import numpy as np
+
+try:
+    from contact_parser import FIELD_ALIASES
+    from single_flight import fold_synonyms
+except ImportError:  # imported as backend.lead_scoring from the repo root
+    from backend.contact_parser import FIELD_ALIASES
+    from backend.single_flight import fold_synonyms
+
+# Contacts scoring below LEAD_MIN_SCORE are not drafted; at most LEAD_MAX_CONTACTS are kept
+LEAD_MIN_SCORE = float(os.getenv("LEAD_MIN_SCORE", "0.15"))
+LEAD_MAX_CONTACTS = int(os.getenv("LEAD_MAX_CONTACTS", "50"))
+
+# Width of the hashed feature vectors
+N_FEATURES = 2 ** 14
+
+# How much each target counts towards a contact's score. Targets the profile
+# does not set, or whose fields a contact does not have, are left out and the
+# remaining weights rescaled.
+FIELD_WEIGHTS = {
+    "target_roles": 0.45,
+    "target_industry": 0.2,
+    "location": 0.15,
+    "context": 0.2,
+}
+
+# Which contact fields each target is compared with
+TARGET_FIELDS = {
+    "target_roles": ("role",),
+    "target_industry": ("industry", "company", "justification"),
+    "location": ("location",),
+    "context": ("role", "company", "industry", "justification"),
+}
+
+_WORD_RE = re.compile(r"[a-z0-9+#]+")
+
+@functools.lru_cache(maxsize=65536)
+def _hash(token):
+    return zlib.crc32(token.encode("utf-8")) % N_FEATURES
+
+@functools.lru_cache(maxsize=65536)
+def _word_hashes(word):
+    """Hashes of a word and of its character trigrams; words repeat a lot, so they are cached"""
+    padded = f"<{word}>"
+    return (_hash(word),) + tuple(_hash(padded[i:i + 3]) for i in range(len(padded) - 2))
+
+def _hashes(text):
+    """Hashed words, word bigrams and character trigrams of `text`, after folding synonyms"""
+    words = _WORD_RE.findall(fold_synonyms(text))
+    hashes = [h for word in words for h in _word_hashes(word)]
+    hashes.extend(_hash(f"{a} {b}") for a, b in zip(words, words[1:]))
+    return hashes
+
+def sparse_features(texts):
+    """
+    L2-normalized hashed features of `texts` as sparse (rows, cols, values) arrays.
+
+    Hashes are crc32, so the same text gets the same features in every process.
+    """
+    rows, cols = [], []
+    for row, text in enumerate(texts):
+        hashes = _hashes(text)
+        rows.extend([row] * len(hashes))
+        cols.extend(hashes)
+    # Repeated features of a text are summed into one entry
+    keys, counts = np.unique(np.asarray(rows, dtype=np.int64) * N_FEATURES + np.asarray(cols, dtype=np.int64),
+                             return_counts=True)
+    rows, cols = keys // N_FEATURES, keys % N_FEATURES
+    values = counts.astype(np.float32)
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(texts)))
+    values /= norms[rows]
+    return rows, cols, values
+
+def hashed_features(texts):
+    """Dense version of sparse_features, one row per text; meant for a few texts such as the targets"""
+    rows, cols, values = sparse_features(texts)
+    matrix = np.zeros((len(texts), N_FEATURES), dtype=np.float32)
+    matrix[rows, cols] = values
+    return matrix
+
+def similarities(texts, targets):
+    """Cosine similarity of each text to its closest target, as an array in text order"""
+    # Contact fields repeat a lot (the same role or company), so each distinct text is scored once
+    unique, inverse = np.unique(np.asarray(texts, dtype=object), return_inverse=True)
+    rows, cols, values = sparse_features(unique)
+    target_features = hashed_features(targets)
+    best = np.zeros(len(unique), dtype=np.float32)
+    for target in target_features:
+        np.maximum(best, np.bincount(rows, weights=values * target[cols], minlength=len(unique)), out=best)
+    return best[inverse]
+
+def _contact_text(lowered, fields):
+    """The values of `fields` in a contact (with lowercased keys), matched by any of their aliases"""
+    values = []
+    for field in fields:
+        for alias in FIELD_ALIASES.get(field, (field,)):
+            if lowered.get(alias):
+                values.append(str(lowered[alias]))
+                break
+    return " ".join(values)
+
+def _targets(profile, name):
+    value = profile.get(name)
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value if v]
+    return [str(value)]
+
+def score_contacts(contacts, profile):
+    """
+    Score every contact against the targeting in `profile`, in one vectorized pass.
+
+    `profile` may set target_roles (a list), target_industry, location and
+    context. Returns a float array of scores between 0 and 1, in contact order.
+    Each contact is only scored on the targets whose fields it has; contacts
+    with none of them (or all contacts, if the profile sets no targets) get NaN.
+    """
+    scores = np.zeros(len(contacts), dtype=np.float32)
+    total_weight = np.zeros(len(contacts), dtype=np.float32)
+    lowered = [
+        {str(k).lower(): v for k, v in c.items()} if isinstance(c, dict) else {"role": str(c)}
+        for c in contacts
+    ]
+    for name, weight in FIELD_WEIGHTS.items():
+        targets = _targets(profile, name)
+        if not targets or not contacts:
+            continue
+        texts = [_contact_text(c, TARGET_FIELDS[name]) for c in lowered]
+        # Best match among the targets (e.g. any of the target roles)
+        scores += weight * similarities(texts, targets)
+        total_weight += weight * np.fromiter((bool(t) for t in texts), dtype=np.float32, count=len(texts))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total_weight > 0, scores / total_weight, np.nan).astype(np.float32)
+
+def rank_contacts(contacts, profile, min_score=LEAD_MIN_SCORE, max_contacts=LEAD_MAX_CONTACTS):
+    """
+    Return the contacts worth drafting for: best first, at least `min_score`, at most `max_contacts`.
+
+    Each scored contact is a copy with its 'score' added. Contacts without any
+    field to compare are kept unchanged after the scored ones, since nothing
+    says they are weak matches. Contacts are returned unchanged and unfiltered if
+    the profile sets no targets to score against.
+    """
+    if not contacts or not any(_targets(profile, name) for name in FIELD_WEIGHTS):
+        return list(contacts)
+    scores = score_contacts(contacts, profile)
+    scored = ~np.isnan(scores)
+    # Stable sort, so equally scored contacts keep their order
+    order = np.argsort(-np.where(scored, scores, -1.0), kind="stable")
+    order = order[scored[order] & (np.where(scored, scores, 0.0)[order] >= min_score)]
+    order = np.concatenate([order, np.flatnonzero(~scored)])[:max_contacts]
+    ranked = []
+    for index in order:
+        contact = contacts[index]
+        if isinstance(contact, dict) and scored[index]:
+            contact = {**contact, "score": round(float(scores[index]), 3)}
+        ranked.append(contact)
+    return ranked
@@ -0,0 +1,301 @@
+"""
+Compact columnar storage for large numbers of contacts.
+
+A list of contact dicts costs a dict, its keys and its strings per contact.
+LeadStore keeps one column per field instead: names, emails and URLs in plain
+lists, repetitive values (roles, locations, sources) interned, companies as
+integer ids into a table of unique company names, and scores in a float array.
+Fields outside the known columns are kept per row only for the rows that have
+them.
+
+Rows are read through Lead, a two-slot view onto the columns, and page() gives
+a view onto a range of rows without copying anything. Whole stores are
+exported to and imported from Parquet or Arrow IPC files for downstream CRMs;
+this needs pyarrow, which is only imported when one of those methods is used.
+"""
+import sys
+import json
+import math
+from array import array
+
+try:
+    from contact_parser import FIELD_ALIASES
+except ImportError:  # imported as backend.lead_store from the repo root
+    from backend.contact_parser import FIELD_ALIASES
+
+# Columns every contact has, in export order. Interned columns hold values that
+# repeat across contacts, so each distinct value is stored once.
+STRING_COLUMNS = ("name", "role", "email", "profile_url", "location", "source")
+INTERNED_COLUMNS = {"role", "location", "source"}
+
+# Field names accepted for each column, besides the column name itself
+COLUMN_ALIASES = {
+    **{name: aliases for name, aliases in FIELD_ALIASES.items() if name in STRING_COLUMNS},
+    "email": ("email", "email_address"),
+    "source": ("source",),
+}
+COMPANY_ALIASES = FIELD_ALIASES["company"]
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Parquet and Arrow export needs pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+class Lead:
+    """One contact in a LeadStore, read from its columns on access"""
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, field):
+        return self._store.value(self._index, field)
+
+    def get(self, field, default=None):
+        try:
+            value = self._store.value(self._index, field)
+        except AttributeError:
+            return default
+        return default if value is None else value
+
+    def to_dict(self):
+        return self._store.row(self._index)
+
+    def __repr__(self):
+        return f"Lead({self.to_dict()!r})"
+
+class LeadPage:
+    """Rows start..stop of a LeadStore, without copying them"""
+
+    __slots__ = ("_store", "start", "stop")
+
+    def __init__(self, store, start, stop):
+        self._store = store
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("page index out of range")
+        return Lead(self._store, self.start + index)
+
+    def __iter__(self):
+        return (Lead(self._store, i) for i in range(self.start, self.stop))
+
+    @property
+    def scores(self):
+        """The page's scores as a memoryview onto the store's score column (NaN where unscored)"""
+        return memoryview(self._store.scores)[self.start:self.stop]
+
+    def to_dicts(self):
+        return [self._store.row(i) for i in range(self.start, self.stop)]
+
+class LeadStore:
+    """Columnar store of contacts with an interned table of their companies"""
+
+    def __init__(self, contacts=()):
+        self.columns = {name: [] for name in STRING_COLUMNS}
+        self.company_ids = array("i")
+        self.company_names = []
+        self.scores = array("f")
+        # Fields outside the known columns, only for the rows that have any
+        self.extras = {}
+        self._companies = {}
+        self.extend(contacts)
+
+    def __len__(self):
+        return len(self.company_ids)
+
+    def __iter__(self):
+        return (Lead(self, i) for i in range(len(self)))
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("lead index out of range")
+        return Lead(self, index)
+
+    @staticmethod
+    def _intern(value):
+        return None if value is None else sys.intern(value)
+
+    def company_id(self, name):
+        """Id of company `name` in the company table, adding it if it is new (-1 for no company)"""
+        if not name:
+            return -1
+        key = " ".join(name.lower().split())
+        company_id = self._companies.get(key)
+        if company_id is None:
+            company_id = self._companies[key] = len(self.company_names)
+            self.company_names.append(sys.intern(name))
+        return company_id
+
+    def add(self, contact, source=None):
+        """Append a contact dict; returns its row index"""
+        lowered = {str(k).lower(): v for k, v in contact.items()}
+        used = set()
+        for name in STRING_COLUMNS:
+            value = None
+            for alias in COLUMN_ALIASES.get(name, (name,)):
+                if lowered.get(alias) not in (None, ""):
+                    value = str(lowered[alias]).strip()
+                    used.add(alias)
+                    break
+            if name == "source" and value is None and source is not None:
+                value = str(source)
+            self.columns[name].append(self._intern(value) if name in INTERNED_COLUMNS else value)
+
+        company = None
+        for alias in COMPANY_ALIASES:
+            if lowered.get(alias):
+                company = str(lowered[alias]).strip()
+                used.add(alias)
+                break
+        self.company_ids.append(self.company_id(company))
+
+        score = lowered.get("score")
+        used.add("score")
+        try:
+            self.scores.append(float(score) if score is not None else math.nan)
+        except (TypeError, ValueError):
+            self.scores.append(math.nan)
+            used.discard("score")
+
+        extra = {k: v for k, v in contact.items() if str(k).lower() not in used}
+        index = len(self.company_ids) - 1
+        if extra:
+            self.extras[index] = extra
+        return index
+
+    def extend(self, contacts, source=None):
+        for contact in contacts:
+            if isinstance(contact, dict):
+                self.add(contact, source=source)
+
+    def value(self, index, field):
+        """Value of `field` in row `index` (None if it has none)"""
+        if field in self.columns:
+            return self.columns[field][index]
+        if field == "company":
+            company_id = self.company_ids[index]
+            return self.company_names[company_id] if company_id >= 0 else None
+        if field == "score":
+            score = self.scores[index]
+            return None if math.isnan(score) else score
+        extra = self.extras.get(index)
+        if extra is not None and field in extra:
+            return extra[field]
+        raise AttributeError(field)
+
+    def row(self, index):
+        """Row `index` as a contact dict, without its empty fields"""
+        record = {name: column[index] for name, column in self.columns.items() if column[index] is not None}
+        company = self.value(index, "company")
+        if company is not None:
+            record["company"] = company
+        score = self.scores[index]
+        if not math.isnan(score):
+            record["score"] = round(score, 6)
+        record.update(self.extras.get(index, {}))
+        return record
+
+    def to_dicts(self):
+        return [self.row(i) for i in range(len(self))]
+
+    def page(self, page, page_size):
+        """View of page number `page` (from 0) of `page_size` rows"""
+        start = min(page * page_size, len(self))
+        return LeadPage(self, start, min(start + page_size, len(self)))
+
+    # --- Arrow / Parquet ---
+
+    def to_arrow(self):
+        """
+        The contacts as a pyarrow Table.
+
+        The company column is dictionary-encoded straight from the company ids
+        and table, and the score column shares the store's buffer.
+        """
+        import numpy as np
+        pa = _require_pyarrow()
+        ids = np.frombuffer(self.company_ids, dtype=np.int32) if len(self) else np.zeros(0, dtype=np.int32)
+        companies = pa.DictionaryArray.from_arrays(
+            pa.array(ids, mask=ids < 0), pa.array(self.company_names, type=pa.string()),
+        )
+        scores = np.frombuffer(self.scores, dtype=np.float32) if len(self) else np.zeros(0, dtype=np.float32)
+        extras = [json.dumps(self.extras[i], default=str) if i in self.extras else None for i in range(len(self))]
+        arrays = [pa.array(self.columns[name], type=pa.string()) for name in STRING_COLUMNS]
+        arrays += [companies, pa.array(scores, mask=np.isnan(scores)), pa.array(extras, type=pa.string())]
+        return pa.table(arrays, names=list(STRING_COLUMNS) + ["company", "score", "extra"])
+
+    @classmethod
+    def from_arrow(cls, table):
+        """Build a store from a Table written by to_arrow (or any table with some of its columns)"""
+        store = cls()
+        names = set(table.column_names)
+        length = table.num_rows
+        for name in STRING_COLUMNS:
+            values = table.column(name).to_pylist() if name in names else [None] * length
+            if name in INTERNED_COLUMNS:
+                values = [store._intern(v) for v in values]
+            store.columns[name] = values
+
+        if "company" in names:
+            column = table.column("company").combine_chunks()
+            if hasattr(column, "dictionary"):
+                # Dictionary-encoded: add each distinct company once, then map the indices
+                ids = [store.company_id(name) for name in column.dictionary.to_pylist()]
+                store.company_ids = array("i", (-1 if i is None else ids[i] for i in column.indices.to_pylist()))
+            else:
+                store.company_ids = array("i", (store.company_id(name) for name in column.to_pylist()))
+        else:
+            store.company_ids = array("i", [-1] * length)
+
+        scores = table.column("score").to_pylist() if "score" in names else [None] * length
+        store.scores = array("f", (math.nan if s is None else s for s in scores))
+        if "extra" in names:
+            for index, extra in enumerate(table.column("extra").to_pylist()):
+                if extra:
+                    store.extras[index] = json.loads(extra)
+        return store
+
+    def write_parquet(self, path):
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path)
+
+    @classmethod
+    def read_parquet(cls, path):
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(path))
+
+    def write_ipc(self, path):
+        """Write the contacts as an Arrow IPC (Feather v2) file"""
+        pa = _require_pyarrow()
+        table = self.to_arrow()
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    @classmethod
+    def read_ipc(cls, path):
+        pa = _require_pyarrow()
+        with pa.memory_map(path, "r") as source:
+            return cls.from_arrow(pa.ipc.open_file(source).read_all())
+
+    def export(self, path):
+        """Write to `path` as Parquet (.parquet) or Arrow IPC (anything else, e.g. .arrow)"""
+        if path.endswith(".parquet"):
+            self.write_parquet(path)
+        else:
+            self.write_ipc(path)
@@ -0,0 +1,354 @@
+"""
+Socket.IO load test for the agent server.
+
+Opens N simulated reps against one `socketio.run(app)` process, each replaying
+the benchmark conversation (initialize_agent, then every user_input turn of
+benchmark.app_script) over its own session. The server answers from a fake
+model backend (fake_llm.install_fake_models), so only the server itself is measured.
+
+Reports the p50/p95/p99 of:
+- connect: Socket.IO connection time
+- initialize: initialize_agent until agent_initialized
+- queued: user_input until its 'queued' progress event
+- first_text: user_input until the first streamed text_delta
+- turn: user_input until agent_output
+along with completed turns per second, errors and the server's resident memory
+(sampled from /metrics).
+
+By default a server is started on a free port with a temporary result cache
+and checkpoint store; server settings such as AGENT_WORKERS are read from the
+environment. Use --url to load an already running server instead.
+
+Usage:
+    python load_test.py --clients 50 --ramp 10 --output load.json
+    AGENT_WORKERS=32 python load_test.py --clients 200 --ramp 30
+    python load_test.py --url http://127.0.0.1:5000 --clients 20
+"""
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import tempfile
+import argparse
+import importlib.util
+import threading
+import subprocess
+import urllib.request
+
+from benchmark import BASIC_INFO, app_script
+
+# Get the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Latencies measured for every client, in report order
+LATENCY_METRICS = ["connect", "initialize", "queued", "first_text", "turn"]
+
+# Starts the app on the port given as its first argument, replaying FAKE_LLM_SCRIPT
+SERVER_CODE = (
+    "import sys, app, fake_llm; "
+    "fake_llm.install_fake_models(); "
+    "app.socketio.run(app.app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True, log_output=False)"
+)
+
+def percentile(values, q):
+    """The `q`th percentile (0-100) of `values`, interpolating between the closest ranks"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def summarize_latencies(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values),
+    }
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def read_memory(url):
+    """The server's process_resident_memory_bytes from its /metrics page, or None"""
+    try:
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+            text = response.read().decode()
+    except OSError:
+        return None
+    for line in text.splitlines():
+        if line.startswith("process_resident_memory_bytes "):
+            return float(line.split()[1])
+    return None
+
+def start_server(port, script_path, args, workdir):
+    """Start the app on `port` with the fake model backend; returns the process and its log path"""
+    env = {
+        **os.environ,
+        "FAKE_LLM_SCRIPT": script_path,
+        "FAKE_LLM_DELAY": str(args.delay),
+        "FAKE_LLM_DELAY_PER_TOKEN": str(args.delay_per_token),
+        "RESULT_CACHE_PATH": os.path.join(workdir, "result_cache.sqlite3"),
+        "CHECKPOINT_PATH": os.path.join(workdir, "checkpoints.sqlite3"),
+    }
+    env.setdefault("OPENAI_API_KEY", "load-test")
+    log_path = os.path.join(workdir, "server.log")
+    with open(log_path, "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-c", SERVER_CODE, str(port)],
+            cwd=SCRIPT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+    return process, log_path
+
+def wait_until_ready(url, process=None, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        if read_memory(url) is not None:
+            return
+        time.sleep(0.2)
+    raise TimeoutError(f"Server at {url} did not come up within {timeout:.0f}s")
+
+class MemorySampler(threading.Thread):
+    """Polls the server's resident memory until stopped"""
+
+    def __init__(self, url, interval=0.5):
+        super().__init__(daemon=True)
+        self.url = url
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            value = read_memory(self.url)
+            if value is not None:
+                self.samples.append(value)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        value = read_memory(self.url)
+        if value is not None:
+            self.samples.append(value)
+
+class SimulatedRep:
+    """
+    One client replaying the conversation over its own Socket.IO connection.
+
+    Latencies are collected per metric in `latencies`; failures in `errors`.
+    """
+
+    def __init__(self, url, session_id, user_texts, timeout, transports):
+        import socketio
+        from engineio.payload import Payload
+
+        # A long-poll response carries every packet queued since the last one, e.g. a
+        # burst of text_delta events. Browsers accept any number of them; the Python
+        # client aborts the connection above 16 unless told otherwise.
+        Payload.max_decode_packets = max(Payload.max_decode_packets, 10000)
+
+        self.url = url
+        self.session_id = session_id
+        self.user_texts = user_texts
+        self.timeout = timeout
+        self.transports = transports
+        self.latencies = {metric: [] for metric in LATENCY_METRICS}
+        self.completed_turns = 0
+        self.errors = []
+        self.events = queue.Queue()
+
+        self.client = socketio.Client(reconnection=False)
+        for event in ("agent_initialized", "agent_progress", "agent_output", "error", "disconnect"):
+            self.client.on(event, self._handler(event))
+
+    def _handler(self, event):
+        def handle(data=None):
+            self.events.put((event, data, time.perf_counter()))
+        return handle
+
+    def _next_event(self):
+        try:
+            item = self.events.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No event from the server within {self.timeout:.0f}s") from None
+        if item[0] == "disconnect":
+            raise ConnectionError("Disconnected by the server")
+        return item
+
+    def _initialize(self):
+        start = time.perf_counter()
+        self.client.emit("initialize_agent", {"basic_info": dict(BASIC_INFO), "session_id": self.session_id})
+        while True:
+            event, data, at = self._next_event()
+            if event == "agent_initialized":
+                self.latencies["initialize"].append(at - start)
+                return
+            if event == "error":
+                raise RuntimeError(f"initialize_agent failed: {data}")
+
+    def _turn(self, text):
+        start = time.perf_counter()
+        self.client.emit("user_input", {"text": text})
+        first_text = None
+        while True:
+            event, data, at = self._next_event()
+            if event == "agent_progress":
+                kind = (data or {}).get("event")
+                if kind == "queued":
+                    self.latencies["queued"].append(at - start)
+                elif kind == "text_delta" and first_text is None:
+                    first_text = at - start
+                    self.latencies["first_text"].append(first_text)
+            elif event == "agent_output":
+                self.latencies["turn"].append(at - start)
+                self.completed_turns += 1
+                return
+            elif event == "error":
+                raise RuntimeError(f"user_input failed: {data}")
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            self.client.connect(self.url, transports=self.transports, wait_timeout=self.timeout)
+        except Exception as e:
+            self.errors.append(f"connect: {e}")
+            return
+        self.latencies["connect"].append(time.perf_counter() - start)
+        try:
+            self._initialize()
+            for text in self.user_texts:
+                self._turn(text)
+        except Exception as e:
+            self.errors.append(str(e))
+        finally:
+            self.client.disconnect()
+
+def run_load(url, user_texts, args):
+    """Run `args.clients` reps against `url`, starting them evenly over `args.ramp` seconds"""
+    run_id = f"load-{os.getpid()}-{int(time.time())}"
+    if args.transports:
+        transports = args.transports.split(",")
+    else:
+        # The websocket transport needs websocket-client; without it clients stay on long-polling
+        transports = ["polling", "websocket"] if importlib.util.find_spec("websocket") else ["polling"]
+    reps = [SimulatedRep(url, f"{run_id}-{i}", user_texts, args.timeout, transports) for i in range(args.clients)]
+    threads = [threading.Thread(target=rep.run, daemon=True) for rep in reps]
+
+    sampler = MemorySampler(url)
+    sampler.start()
+    start = time.perf_counter()
+    for i, thread in enumerate(threads):
+        delay = start + args.ramp * i / max(args.clients, 1) - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - start
+    sampler.stop()
+
+    completed = sum(rep.completed_turns for rep in reps)
+    errors = [f"{rep.session_id}: {error}" for rep in reps for error in rep.errors]
+    memory = sampler.samples
+    return {
+        "clients": args.clients,
+        "ramp_seconds": args.ramp,
+        "turns_per_client": len(user_texts),
+        "completed_turns": completed,
+        "wall_seconds": wall_seconds,
+        "turns_per_second": completed / wall_seconds if wall_seconds else 0.0,
+        "errors": errors,
+        "latency": {
+            metric: summarize_latencies([value for rep in reps for value in rep.latencies[metric]])
+            for metric in LATENCY_METRICS
+        },
+        "server_memory_bytes": {
+            "start": memory[0], "peak": max(memory), "end": memory[-1],
+        } if memory else None,
+    }
+
+def print_report(results):
+    print(
+        f"clients={results['clients']} turns={results['completed_turns']}/"
+        f"{results['clients'] * results['turns_per_client']} errors={len(results['errors'])} "
+        f"wall={results['wall_seconds']:.2f}s throughput={results['turns_per_second']:.2f} turns/s"
+    )
+    for metric, summary in results["latency"].items():
+        if not summary["count"]:
+            print(f"{metric:11} no samples")
+            continue
+        print(
+            f"{metric:11} n={summary['count']:<5} p50={summary['p50']:.3f}s p95={summary['p95']:.3f}s "
+            f"p99={summary['p99']:.3f}s max={summary['max']:.3f}s"
+        )
+    memory = results["server_memory_bytes"]
+    if memory:
+        mb = 1024 * 1024
+        print(f"server RSS  start={memory['start'] / mb:.1f}MB peak={memory['peak'] / mb:.1f}MB "
+              f"end={memory['end'] / mb:.1f}MB")
+    for error in results["errors"][:10]:
+        print(f"ERROR: {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Socket.IO load test for the agent server")
+    parser.add_argument("--clients", type=int, default=10, help="Simulated reps connected at once")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Seconds over which the clients are started")
+    parser.add_argument("--size", type=int, default=10, help="Companies found per conversation")
+    parser.add_argument("--email-turns", type=int, default=3, help="EMAIL_GENERATION turns per conversation")
+    parser.add_argument("--delay", type=float, default=0.5, help="Fixed fake model latency per call (s)")
+    parser.add_argument("--delay-per-token", type=float, default=0.002, help="Fake generation time per output token (s)")
+    parser.add_argument("--tool-delay", type=float, default=0.5, help="Fake latency of each tool call (s)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Seconds to wait for each server event")
+    parser.add_argument("--transports", help="Engine.IO transports, comma separated (default: polling,websocket)")
+    parser.add_argument("--url", help="Load this running server instead of starting one (its model is not faked)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    script = app_script(args.size, args.email_turns, args.tool_delay)
+    user_texts = [text for text, _ in script]
+
+    with tempfile.TemporaryDirectory(prefix="load-test-") as workdir:
+        process = None
+        url = args.url
+        if url is None:
+            script_path = os.path.join(workdir, "script.json")
+            with open(script_path, "w", encoding="utf-8") as f:
+                json.dump([response for _, response in script], f)
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            process, log_path = start_server(port, script_path, args, workdir)
+            print(f"Started server at {url} (pid {process.pid})")
+        try:
+            wait_until_ready(url, process)
+            results = run_load(url, user_texts, args)
+        except Exception:
+            if process is not None:
+                with open(log_path, "r") as log:
+                    print(log.read()[-4000:], file=sys.stderr)
+            raise
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 1 if results["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
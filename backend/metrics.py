@@ -0,0 +1,258 @@
+import os
+import sys
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+
+# Latency buckets in seconds, from quick chat turns up to long agent searches
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+class Gauge:
+    """Gauge whose value is read from a callable when metrics are rendered"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        self.name = name
+        self.help = help_text
+        self._fn = fn
+
+    def samples(self):
+        return [(self.name, (), self._fn())]
+
+class Histogram:
+    """Cumulative histogram with labels, in the Prometheus bucket layout"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series["count"] if series else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series["counts"]):
+                    samples.append((f"{self.name}_bucket", key + (("le", _format_value(bound)),), count))
+                samples.append((f"{self.name}_sum", key, series["sum"]))
+                samples.append((f"{self.name}_count", key, series["count"]))
+        return samples
+
+class Registry:
+    """Holds the process's metrics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, fn):
+        """Register (or replace) a gauge read from `fn()` at render time"""
+        with self._lock:
+            self._metrics[name] = Gauge(name, help_text, fn)
+            return self._metrics[name]
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+SPAN_SECONDS = registry.histogram(
+    "agent_span_seconds", "Latency of workflow turns, tool calls and model calls")
+SPAN_TOKENS = registry.counter(
+    "agent_span_tokens_total", "Model tokens used by spans, by direction")
+SPAN_RETRIES = registry.counter(
+    "agent_span_retries_total", "Retries made inside spans")
+SPAN_CACHE_HITS = registry.counter(
+    "agent_span_cache_hits_total", "Result cache hits inside spans")
+CACHE_REQUESTS = registry.counter(
+    "agent_cache_requests_total", "Result cache lookups by namespace and result")
+
+# The innermost span running in the current thread or task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """
+    Times one unit of work and records it when it ends.
+
+    `kind` groups spans (turn, tool, model, workflow) and `name` identifies the
+    step, tool or model. Tokens, retries and cache hits noted on the span are
+    added to the span counters and rolled up into the enclosing span; the
+    latency goes to agent_span_seconds with a status of ok or error.
+    """
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.seconds = None
+        self.failed = False
+        self._start = None
+        self._token = None
+
+    def add_tokens(self, input_tokens=0, output_tokens=0):
+        self.input_tokens += input_tokens or 0
+        self.output_tokens += output_tokens or 0
+
+    def retry(self):
+        self.retries += 1
+
+    def cache_hit(self):
+        self.cache_hits += 1
+
+    def fail(self):
+        """Record the span as an error even though no exception was raised"""
+        self.failed = True
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        _current_span.reset(self._token)
+        labels = {"kind": self.kind, "name": self.name}
+        status = "error" if exc_type or self.failed else "ok"
+        SPAN_SECONDS.observe(self.seconds, status=status, **labels)
+        if self.input_tokens:
+            SPAN_TOKENS.inc(self.input_tokens, direction="input", **labels)
+        if self.output_tokens:
+            SPAN_TOKENS.inc(self.output_tokens, direction="output", **labels)
+        if self.retries:
+            SPAN_RETRIES.inc(self.retries, **labels)
+        if self.cache_hits:
+            SPAN_CACHE_HITS.inc(self.cache_hits, **labels)
+        parent = _current_span.get()
+        if parent is not None:
+            parent.add_tokens(self.input_tokens, self.output_tokens)
+            parent.retries += self.retries
+            parent.cache_hits += self.cache_hits
+        return False
+
+def span(kind, name):
+    """Context manager timing a unit of work, e.g. `with span("tool", "contact_finder_tool") as s:`"""
+    return Span(kind, name)
+
+def current_span():
+    """The innermost running span, or None"""
+    return _current_span.get()
+
+def record_cache(namespace, hit):
+    """Count a result cache lookup, and note hits on the running span"""
+    CACHE_REQUESTS.inc(namespace=namespace, result="hit" if hit else "miss")
+    running = current_span()
+    if hit and running is not None:
+        running.cache_hit()
+
+def timed(kind, name=None):
+    """Decorator wrapping every call of a regular or async function in a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(kind, span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def process_memory_bytes():
+    """Resident memory of this process in bytes (its peak where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format"""
+    return registry.render()
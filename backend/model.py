@@ -0,0 +1,14 @@
+"""
+The user a workflow runs for.
+
+MainAgent.run_workflow reads the targets and the sender's details from the
+profile: target_industry, target_roles, location, email_purpose and any other
+fields the email tools should see.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+@dataclass
+class User:
+    uid: str
+    profile: Dict[str, Any] = field(default_factory=dict)
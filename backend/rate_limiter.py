@@ -0,0 +1,300 @@
+"""
+Process-wide rate limiting for model provider calls.
+
+Each provider gets one ProviderLimiter shared by every session, tool and agent
+in the process. It paces calls with two token buckets (requests per minute and
+tokens per minute), bounds in-flight calls with an adaptive concurrency limit
+(additive increase on success, halved on a 429), and retries rate-limited
+calls with jittered exponential backoff. Models driven by an agent are limited
+request by request with limit_agno_model or LimitedModel (smolagents), so a
+429 retries that one request rather than the whole run and its tool calls.
+Limits come from the environment:
+
+    RATE_LIMIT_<PROVIDER>_RPM, RATE_LIMIT_<PROVIDER>_TPM,
+    RATE_LIMIT_<PROVIDER>_CONCURRENCY, RATE_LIMIT_MAX_RETRIES
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+
+try:
+    from metrics import registry, current_span
+except ImportError:  # imported as backend.rate_limiter from the repo root
+    from backend.metrics import registry, current_span
+
+# Default quotas per provider: (requests/min, tokens/min, max concurrent calls)
+DEFAULT_LIMITS = {
+    "openai": (500, 200000, 16),
+    "gemini": (60, 1000000, 8),
+}
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "5"))
+
+RATE_LIMIT_EVENTS = registry.counter(
+    "agent_rate_limit_events_total", "Provider calls delayed by the limiter (wait) or rejected with a 429 (throttled)")
+
+# Rough characters-per-token ratio for estimating a prompt's token cost
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    return len(str(text)) // CHARS_PER_TOKEN
+
+def is_rate_limit_error(error):
+    """
+    True for the 429 / quota errors raised by the OpenAI, Gemini and agno clients.
+
+    Errors with `retryable = False` never are, whatever they wrap, so a call can
+    opt out of being retried once it is no longer safe to repeat.
+    """
+    if getattr(error, "retryable", True) is False:
+        return False
+    if getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "resource_exhausted" in message
+
+class TokenBucket:
+    """Refills at `per_minute` units a minute up to one minute's worth; may go negative"""
+
+    def __init__(self, per_minute, clock=time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available (0 if they are now)"""
+        self._refill()
+        # A single request larger than the bucket only waits for a full bucket
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate) if self.rate else 0.0
+
+    def consume(self, amount):
+        self._refill()
+        self.level -= amount
+
+class ProviderLimiter:
+    """Paces, bounds and retries the calls made to one model provider"""
+
+    def __init__(self, name, rpm, tpm, max_concurrency, min_concurrency=1, max_retries=RATE_LIMIT_MAX_RETRIES,
+                 base_delay=1.0, max_delay=60.0, clock=time.monotonic, sleep=time.sleep, async_sleep=asyncio.sleep):
+        self.name = name
+        self.requests = TokenBucket(rpm, clock) if rpm else None
+        self.tokens = TokenBucket(tpm, clock) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self._sleep = sleep
+        self._async_sleep = async_sleep
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens, hold_slot):
+        """Take a slot and the quota for one call, or return how long to wait first"""
+        with self._lock:
+            if hold_slot and self.in_flight >= int(self.concurrency_limit):
+                return 0.05
+            wait = max(
+                self.requests.wait_time(1) if self.requests else 0.0,
+                self.tokens.wait_time(tokens) if self.tokens else 0.0,
+            )
+            if wait > 0:
+                return wait
+            if self.requests:
+                self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(tokens)
+            if hold_slot:
+                self.in_flight += 1
+            return 0.0
+
+    def _release(self, outcome, hold_slot):
+        """Free the slot and adapt the concurrency limit: halve it on a 429, grow it on success"""
+        with self._lock:
+            if hold_slot:
+                self.in_flight -= 1
+            if outcome == "throttled":
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+            elif outcome == "ok":
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+    def record_tokens(self, actual, estimated):
+        """Charge the difference once a call reports how many tokens it really used"""
+        if self.tokens and actual:
+            with self._lock:
+                self.tokens.consume(actual - estimated)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff delay for retry number `attempt` (from 0)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _note_retry(self):
+        RATE_LIMIT_EVENTS.inc(provider=self.name, event="throttled")
+        span = current_span()
+        if span is not None:
+            span.retry()
+
+    def call(self, func, *args, estimated_tokens=0, hold_slot=True, **kwargs):
+        """
+        Run `func(*args, **kwargs)` within the limits, retrying it on 429s.
+
+        Agent runs whose tools make their own limited calls pass hold_slot=False:
+        they are paced and retried but do not occupy a concurrency slot, so the
+        calls they wait on can always get one.
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = False
+            while (wait := self._try_acquire(estimated_tokens, hold_slot)) > 0:
+                waited = True
+                self._sleep(wait)
+            if waited:
+                RATE_LIMIT_EVENTS.inc(provider=self.name, event="wait")
+            outcome = "ok"
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                outcome = "throttled" if is_rate_limit_error(e) else "error"
+                if outcome == "error" or attempt == self.max_retries:
+                    raise
+                self._note_retry()
+            finally:
+                self._release(outcome, hold_slot)
+            self._sleep(self.backoff(attempt))
+
+    async def acall(self, func, *args, estimated_tokens=0, hold_slot=True, **kwargs):
+        """Async version of `call` for coroutine functions"""
+        for attempt in range(self.max_retries + 1):
+            waited = False
+            while (wait := self._try_acquire(estimated_tokens, hold_slot)) > 0:
+                waited = True
+                await self._async_sleep(wait)
+            if waited:
+                RATE_LIMIT_EVENTS.inc(provider=self.name, event="wait")
+            outcome = "ok"
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                outcome = "throttled" if is_rate_limit_error(e) else "error"
+                if outcome == "error" or attempt == self.max_retries:
+                    raise
+                self._note_retry()
+            finally:
+                self._release(outcome, hold_slot)
+            await self._async_sleep(self.backoff(attempt))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "concurrency_limit": round(self.concurrency_limit, 2),
+                "requests_available": round(self.requests.level, 1) if self.requests else None,
+                "tokens_available": round(self.tokens.level, 1) if self.tokens else None,
+            }
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider):
+    """Return the process-wide limiter for `provider` ("openai", "gemini", ...)"""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            rpm, tpm, concurrency = DEFAULT_LIMITS.get(provider, (60, 100000, 4))
+            prefix = f"RATE_LIMIT_{provider.upper()}"
+            limiter = _limiters[provider] = ProviderLimiter(
+                provider,
+                rpm=int(os.getenv(f"{prefix}_RPM", str(rpm))),
+                tpm=int(os.getenv(f"{prefix}_TPM", str(tpm))),
+                max_concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", str(concurrency))),
+            )
+        return limiter
+
+def estimate_message_tokens(messages):
+    """Rough prompt tokens of a model request's messages (agno Messages or chat dicts)"""
+    return estimate_tokens(" ".join(str(getattr(message, "content", message)) for message in messages or ()))
+
+def _request_messages(args, kwargs):
+    return kwargs.get("messages", args[0] if args else ())
+
+# Marks a streamed request that ended before its first chunk
+_END = object()
+
+def limit_agno_model(model, limiter):
+    """
+    Send every request an agno model makes through `limiter`; returns `model`.
+
+    A streamed request is retried on a 429 only until its first chunk arrives,
+    and holds its concurrency slot until then.
+    """
+    invoke, ainvoke = model.invoke, model.ainvoke
+    invoke_stream, ainvoke_stream = model.invoke_stream, model.ainvoke_stream
+
+    def limited_invoke(*args, **kwargs):
+        tokens = estimate_message_tokens(_request_messages(args, kwargs))
+        return limiter.call(invoke, *args, estimated_tokens=tokens, **kwargs)
+
+    async def limited_ainvoke(*args, **kwargs):
+        tokens = estimate_message_tokens(_request_messages(args, kwargs))
+        return await limiter.acall(ainvoke, *args, estimated_tokens=tokens, **kwargs)
+
+    def limited_invoke_stream(*args, **kwargs):
+        def start():
+            stream = iter(invoke_stream(*args, **kwargs))
+            return stream, next(stream, _END)
+
+        tokens = estimate_message_tokens(_request_messages(args, kwargs))
+        stream, first = limiter.call(start, estimated_tokens=tokens)
+        if first is not _END:
+            yield first
+            yield from stream
+
+    async def limited_ainvoke_stream(*args, **kwargs):
+        async def start():
+            stream = ainvoke_stream(*args, **kwargs).__aiter__()
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, _END
+
+        tokens = estimate_message_tokens(_request_messages(args, kwargs))
+        stream, first = await limiter.acall(start, estimated_tokens=tokens)
+        if first is not _END:
+            yield first
+            async for chunk in stream:
+                yield chunk
+
+    model.invoke, model.ainvoke = limited_invoke, limited_ainvoke
+    model.invoke_stream, model.ainvoke_stream = limited_invoke_stream, limited_ainvoke_stream
+    return model
+
+class LimitedModel:
+    """
+    A smolagents model whose requests go through `limiter`.
+
+    Every other attribute is the wrapped model's, so agents and their monitors
+    see its token counts, which are also charged to the limiter's token budget.
+    """
+
+    def __init__(self, model, limiter):
+        self._model = model
+        self._limiter = limiter
+
+    def __call__(self, messages, *args, **kwargs):
+        estimated = estimate_message_tokens(messages)
+        message = self._limiter.call(self._model, messages, *args, estimated_tokens=estimated, **kwargs)
+        used = sum(getattr(self._model, f"last_{kind}_token_count", None) or 0 for kind in ("input", "output"))
+        self._limiter.record_tokens(used, estimated)
+        return message
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
@@ -0,0 +1,192 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import asyncio
+import functools
+import threading
+
+try:
+    from metrics import record_cache
+except ImportError:  # imported as backend.result_cache from the repo root
+    from backend.metrics import record_cache
+
+# Get the directory where this script is located
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(SCRIPT_DIR, "result_cache.sqlite3"))
+DEFAULT_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+
+# Returned by ResultCache.get on a miss, since None can be a cached value
+MISSING = object()
+
+def normalize_query(query):
+    """
+    Normalize a search query so equivalent queries share a cache entry.
+
+    Strings are lowercased with whitespace collapsed, lists are normalized
+    element-wise and sorted (a company list is unordered), and dicts by key.
+    """
+    if isinstance(query, str):
+        return re.sub(r"\s+", " ", query).strip().lower()
+    if isinstance(query, (list, tuple, set)):
+        return sorted((normalize_query(item) for item in query), key=lambda item: json.dumps(item, default=str))
+    if isinstance(query, dict):
+        return {str(k).lower(): normalize_query(v) for k, v in sorted(query.items(), key=lambda kv: str(kv[0]))}
+    return query
+
+class ResultCache:
+    """
+    Persistent TTL cache for search results, backed by SQLite.
+
+    Entries are keyed by namespace and normalized query, expire after
+    `ttl_seconds`, and the least recently used entries are evicted once more
+    than `max_entries` are stored. Hit and miss counts are kept per namespace.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hits = {}
+        self._misses = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, namespace TEXT, value TEXT,"
+            " created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+
+    @staticmethod
+    def make_key(namespace, query):
+        normalized = json.dumps(normalize_query(query), sort_keys=True, default=str)
+        return f"{namespace}:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+    def get(self, namespace, query):
+        """Return the cached value for `query`, or MISSING"""
+        key = self.make_key(namespace, query)
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._misses[namespace] = self._misses.get(namespace, 0) + 1
+                record_cache(namespace, hit=False)
+                return MISSING
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._hits[namespace] = self._hits.get(namespace, 0) + 1
+        record_cache(namespace, hit=True)
+        return json.loads(row[0])
+
+    def set(self, namespace, query, value):
+        """Store `value` (which must be JSON serializable) for `query`"""
+        key = self.make_key(namespace, query)
+        now = self._clock()
+        encoded = json.dumps(value, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, namespace, value, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, namespace, encoded, now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl_seconds,))
+        count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN"
+                " (SELECT key FROM results ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+    def stats(self):
+        """Hit/miss counters per namespace and the number of stored entries"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        namespaces = set(self._hits) | set(self._misses)
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": sum(self._hits.values()),
+            "misses": sum(self._misses.values()),
+            "namespaces": {
+                name: {"hits": self._hits.get(name, 0), "misses": self._misses.get(name, 0)}
+                for name in sorted(namespaces)
+            },
+        }
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide result cache, opening it on first use"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
+
+def cached(namespace, cache=None, encode=None, decode=None, key=None, should_cache=None):
+    """
+    Decorator caching a search function's result under `namespace`.
+
+    The cache key is the normalized call arguments, passed through `key` first
+    when given. Works for both regular and async functions; results are only
+    stored when the call returns normally and `should_cache(result)` (if given)
+    is true, so failures returned as values are not served for the whole TTL.
+    Results that are not JSON serializable need `encode` (to a JSON value) and
+    `decode` (back from it) hooks.
+    """
+    encode = encode or (lambda value: value)
+    decode = decode or (lambda value: value)
+    should_cache = should_cache or (lambda value: True)
+
+    def decorator(func):
+        def query_for(args, kwargs):
+            query = list(args) if len(args) != 1 else args[0]
+            query = [query, kwargs] if kwargs else query
+            return key(query) if key else query
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                store = cache or get_cache()
+                query = query_for(args, kwargs)
+                value = store.get(namespace, query)
+                if value is not MISSING:
+                    return decode(value)
+                value = await func(*args, **kwargs)
+                if should_cache(value):
+                    store.set(namespace, query, encode(value))
+                return value
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            store = cache or get_cache()
+            query = query_for(args, kwargs)
+            value = store.get(namespace, query)
+            if value is not MISSING:
+                return decode(value)
+            value = func(*args, **kwargs)
+            if should_cache(value):
+                store.set(namespace, query, encode(value))
+            return value
+        return wrapper
+    return decorator
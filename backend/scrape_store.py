@@ -0,0 +1,89 @@
+import os
+import uuid
+import threading
+from collections import OrderedDict
+
+# Bounds on the scrape results kept in memory, evicting least recently used first
+SCRAPE_STORE_MAX_ENTRIES = int(os.getenv("SCRAPE_STORE_MAX_ENTRIES", "64"))
+SCRAPE_STORE_MAX_MB = int(os.getenv("SCRAPE_STORE_MAX_MB", "64"))
+
+# Scrape text is organized in chunks of this many characters, each overlapping the
+# previous one so records cut at a boundary appear whole in one of them
+SCRAPE_CHUNK_CHARS = int(os.getenv("SCRAPE_CHUNK_CHARS", "4000"))
+SCRAPE_CHUNK_OVERLAP = int(os.getenv("SCRAPE_CHUNK_OVERLAP", "400"))
+
+class ScrapeStore:
+    """
+    Full scrape results kept server-side, so tools can pass a short scrape_id
+    to the model instead of the text itself.
+
+    Bounded by entry count and total characters; the least recently used
+    results are dropped first.
+    """
+
+    def __init__(self, max_entries=SCRAPE_STORE_MAX_ENTRIES, max_chars=SCRAPE_STORE_MAX_MB * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._results = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def put(self, text):
+        """Store `text` and return its scrape_id"""
+        scrape_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._results[scrape_id] = text
+            self._chars += len(text)
+            # Always keep the newest result, even if it alone is over the limit
+            while len(self._results) > 1 and (
+                len(self._results) > self.max_entries or self._chars > self.max_chars
+            ):
+                _, evicted = self._results.popitem(last=False)
+                self._chars -= len(evicted)
+        return scrape_id
+
+    def get(self, scrape_id):
+        """Return the stored text, or None if it is unknown or was evicted"""
+        with self._lock:
+            text = self._results.get(scrape_id)
+            if text is not None:
+                self._results.move_to_end(scrape_id)
+            return text
+
+    def __len__(self):
+        return len(self._results)
+
+    @property
+    def chars(self):
+        return self._chars
+
+def iter_chunks(text, chunk_chars=SCRAPE_CHUNK_CHARS, overlap=SCRAPE_CHUNK_OVERLAP):
+    """
+    Yield overlapping chunks of `text`, preferring to cut at line breaks.
+
+    Chunks are produced lazily, so only the ones being processed are held in
+    memory besides the text itself.
+    """
+    if chunk_chars <= overlap:
+        raise ValueError("chunk_chars must be larger than overlap")
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            # Cut after the last line break in the second half of the chunk, if any
+            newline = text.rfind("\n", start + chunk_chars // 2, end)
+            if newline != -1:
+                end = newline + 1
+        yield text[start:end]
+        if end >= len(text):
+            break
+        # Start the next chunk on a line boundary within the overlap, if there is one
+        overlap_start = max(end - overlap, start + 1)
+        newline = text.find("\n", overlap_start, end - 1)
+        start = newline + 1 if newline != -1 else overlap_start
+
+_default_store = ScrapeStore()
+
+def get_store():
+    """Return the process-wide scrape store"""
+    return _default_store
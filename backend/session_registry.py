@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Session:
+    """Bookkeeping for a single registered agent"""
+
+    __slots__ = ("agent", "created_at", "last_used", "size_bytes", "turns", "pins")
+
+    def __init__(self, agent, now, size_bytes):
+        self.agent = agent
+        self.created_at = now
+        self.last_used = now
+        self.size_bytes = size_bytes
+        self.turns = 0
+        self.pins = 0
+
+
+class SessionRegistry:
+    """
+    Holds one agent per client session with LRU/TTL eviction and a memory cap.
+
+    Sessions are kept in least-recently-used order. A session is evicted when it
+    has been idle for longer than `ttl_seconds`, when more than `max_sessions`
+    are live, or when the estimated memory of all sessions exceeds
+    `max_memory_bytes` (oldest first). Pinned sessions (e.g. with a turn queued
+    or running) are never evicted. `size_of` estimates the memory held by an
+    agent and `on_evict` is called with (key, agent) for every evicted session.
+    """
+
+    def __init__(self, max_sessions=500, ttl_seconds=3600, max_memory_bytes=256 * 1024 * 1024,
+                 size_of=None, on_evict=None, clock=time.monotonic):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self._size_of = size_of or (lambda agent: 0)
+        self._on_evict = on_evict
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self._evictions = {"ttl": 0, "capacity": 0, "memory": 0}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._sessions
+
+    def create(self, key, agent, pin=False, replace_pinned=True):
+        """
+        Register `agent` under `key`, replacing any existing session; `pin` pins it right away.
+
+        With `replace_pinned=False` a pinned session under `key` is kept and None is returned.
+        """
+        with self._lock:
+            existing = self._sessions.get(key)
+            if existing is not None and existing.pins and not replace_pinned:
+                return None
+            now = self._clock()
+            self._sessions.pop(key, None)
+            self._sessions[key] = session = _Session(agent, now, self._size_of(agent))
+            session.pins = int(pin)
+            self._enforce_limits(keep=key)
+            return agent
+
+    def get(self, key):
+        """Return the agent registered under `key` (or None) and mark it as recently used"""
+        with self._lock:
+            self.evict_expired()
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            session.last_used = self._clock()
+            self._sessions.move_to_end(key)
+            return session.agent
+
+    def pin(self, key):
+        """Like `get`, but the session is not evicted until a matching `unpin`"""
+        with self._lock:
+            agent = self.get(key)
+            if agent is not None:
+                self._sessions[key].pins += 1
+            return agent
+
+    def unpin(self, key):
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and session.pins:
+                session.pins -= 1
+                session.last_used = self._clock()
+
+    def refresh(self, key):
+        """Re-measure a session after a turn and enforce the memory cap"""
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return
+            session.turns += 1
+            session.last_used = self._clock()
+            session.size_bytes = self._size_of(session.agent)
+            self._sessions.move_to_end(key)
+            self._enforce_limits(keep=key)
+
+    def remove(self, key):
+        """Drop a session without calling `on_evict`"""
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            return session.agent if session else None
+
+    def evict_expired(self):
+        """Evict every session that has been idle for longer than the TTL"""
+        with self._lock:
+            if not self.ttl_seconds:
+                return
+            cutoff = self._clock() - self.ttl_seconds
+            # Sessions are in LRU order, so stop at the first one that is still fresh
+            for key, session in list(self._sessions.items()):
+                if session.last_used > cutoff:
+                    break
+                if not session.pins:
+                    self._evict(key, "ttl")
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(session.size_bytes for session in self._sessions.values())
+
+    def stats(self):
+        """Summary of live sessions and what they cost"""
+        with self._lock:
+            self.evict_expired()
+            now = self._clock()
+            return {
+                "live_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "memory_bytes": self.memory_bytes(),
+                "max_memory_bytes": self.max_memory_bytes,
+                "evictions": dict(self._evictions),
+                "sessions": [
+                    {
+                        "session_id": key,
+                        "age_seconds": round(now - session.created_at, 3),
+                        "idle_seconds": round(now - session.last_used, 3),
+                        "size_bytes": session.size_bytes,
+                        "turns": session.turns,
+                        "pinned": session.pins > 0,
+                    }
+                    for key, session in self._sessions.items()
+                ],
+            }
+
+    def _enforce_limits(self, keep=None):
+        self.evict_expired()
+        while len(self._sessions) > self.max_sessions and self._evict_oldest("capacity", keep):
+            pass
+        if self.max_memory_bytes:
+            while self.memory_bytes() > self.max_memory_bytes and self._evict_oldest("memory", keep):
+                pass
+
+    def _evict_oldest(self, reason, keep):
+        for key, session in self._sessions.items():
+            if key != keep and not session.pins:
+                self._evict(key, reason)
+                return True
+        return False
+
+    def _evict(self, key, reason):
+        session = self._sessions.pop(key)
+        self._evictions[reason] += 1
+        print(f"Evicting session {key} ({reason})")
+        if self._on_evict is not None:
+            self._on_evict(key, session.agent)
@@ -0,0 +1,188 @@
+"""
+Query canonicalization and single-flight coalescing for scrapes and searches.
+
+canonicalize_query maps near-identical queries ("VP Sales NYC", "vp, sales
+New York City") to the same key. SingleFlight makes concurrent calls with the
+same key share one execution: the first caller runs it and every other caller
+waits for, and receives, its result (or its exception).
+"""
+import re
+import json
+import asyncio
+import functools
+import threading
+
+try:
+    from metrics import registry
+except ImportError:  # imported as backend.single_flight from the repo root
+    from backend.metrics import registry
+
+SINGLE_FLIGHT_CALLS = registry.counter(
+    "agent_single_flight_calls_total", "Scrape and search calls, by whether they ran (leader) or joined one in flight (coalesced)")
+
+# Phrases rewritten to one spelling before comparing queries; longest match first.
+# Canonical queries also key the persistent result cache, so only spellings that
+# cannot mean anything else belong here (not e.g. "us", "la" or "leads").
+SYNONYMS = {
+    # Roles
+    "chief executive officer": "ceo",
+    "chief technology officer": "cto",
+    "chief financial officer": "cfo",
+    "chief marketing officer": "cmo",
+    "chief operating officer": "coo",
+    "vice president": "vp",
+    "v.p.": "vp",
+    "svp": "senior vp",
+    "sr.": "senior",
+    "mgr": "manager",
+    "managers": "manager",
+    "directors": "director",
+    "founders": "founder",
+    "co-founder": "founder",
+    "cofounder": "founder",
+    "head of": "head",
+    "heads of": "head",
+    # Locations
+    "new york city": "new york",
+    "nyc": "new york",
+    "united states of america": "usa",
+    "united states": "usa",
+    "u.s.a.": "usa",
+    # Industries
+    "startups": "startup",
+    "companies": "company",
+}
+
+# Words that never change what a query asks for; prepositions do ("from Google" vs "at Google")
+STOPWORDS = {"a", "an", "the"}
+
+_SYNONYM_RE = re.compile(
+    r"(?<![\w.])(" + "|".join(re.escape(p) for p in sorted(SYNONYMS, key=len, reverse=True)) + r")(?![\w])"
+)
+
+def fold_synonyms(text):
+    """Lowercase `text` and rewrite every phrase in SYNONYMS to its one spelling"""
+    text = re.sub(r"\s+", " ", str(text).lower()).strip()
+    return _SYNONYM_RE.sub(lambda m: SYNONYMS[m.group(1)], text)
+
+def _canonical_text(text):
+    words = [w for w in re.findall(r"[a-z0-9+#&]+", fold_synonyms(text)) if w not in STOPWORDS]
+    # Word order is kept: "left Google for Meta" and "left Meta for Google" ask different things
+    return " ".join(w for i, w in enumerate(words) if i == 0 or w != words[i - 1])
+
+def _canonical(value):
+    if isinstance(value, str):
+        return _canonical_text(value)
+    if isinstance(value, dict):
+        return {str(k).lower(): _canonical(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple, set)):
+        return sorted((_canonical(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True))
+    return value
+
+def canonicalize_query(query):
+    """
+    Key under which equivalent queries coincide.
+
+    Ignores case, whitespace, punctuation, articles and repeated words, and
+    maps a few unambiguous role/location/industry synonyms to one spelling.
+    Word order and prepositions are kept, since they can change the meaning. Lists (e.g. of companies) are compared as
+    sets of canonical items.
+    """
+    canonical = _canonical(query)
+    return canonical if isinstance(canonical, str) else json.dumps(canonical, sort_keys=True)
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key; `name` labels its metrics"""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        # In-flight coroutine calls, kept per event loop since futures are bound to one
+        self._futures = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Run `func(*args, **kwargs)` unless a call with `key` is in flight, then share its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        SINGLE_FLIGHT_CALLS.inc(name=self.name, result="leader" if leader else "coalesced")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    async def ado(self, key, func, *args, **kwargs):
+        """Async version of `do` for coroutine functions"""
+        flight_key = (id(asyncio.get_running_loop()), key)
+        future = self._futures.get(flight_key)
+        if future is not None:
+            SINGLE_FLIGHT_CALLS.inc(name=self.name, result="coalesced")
+            # Shielded so a cancelled waiter does not cancel the shared call
+            return await asyncio.shield(future)
+
+        SINGLE_FLIGHT_CALLS.inc(name=self.name, result="leader")
+        future = self._futures[flight_key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve the exception so it is not reported as never retrieved when nobody waited
+            future.exception()
+            raise
+        finally:
+            self._futures.pop(flight_key, None)
+
+def coalesce(name, key=canonicalize_query):
+    """
+    Decorator coalescing concurrent calls to a regular or async function whose
+    arguments have the same `key` (canonicalize_query of the arguments by default).
+    """
+    flight = SingleFlight(name)
+
+    def decorator(func):
+        def key_for(args, kwargs):
+            query = list(args) if len(args) != 1 else args[0]
+            return key([query, kwargs] if kwargs else query)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await flight.ado(key_for(args, kwargs), func, *args, **kwargs)
+            async_wrapper.flight = flight
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return flight.do(key_for(args, kwargs), func, *args, **kwargs)
+        wrapper.flight = flight
+        return wrapper
+    return decorator
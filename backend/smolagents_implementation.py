@@ -1,9 +1,61 @@
 import os
+import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from smolagents import OpenAIServerModel, CodeAgent
+from client_pool import load_prompt
+from result_cache import cached
+from metrics import span, timed
+from rate_limiter import get_limiter, LimitedModel
+from single_flight import coalesce, canonicalize_query
 
 # Get the directory where this script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# Fan-out settings for contact_finder_tool: companies are searched in batches of
+# CONTACT_FINDER_BATCH_SIZE, at most CONTACT_FINDER_CONCURRENCY at a time per call, and
+# a batch not done CONTACT_FINDER_TIMEOUT seconds after it was submitted is dropped.
+CONTACT_FINDER_FANOUT = os.getenv("CONTACT_FINDER_FANOUT", "1") == "1"
+CONTACT_FINDER_BATCH_SIZE = int(os.getenv("CONTACT_FINDER_BATCH_SIZE", "1"))
+CONTACT_FINDER_CONCURRENCY = int(os.getenv("CONTACT_FINDER_CONCURRENCY", "4"))
+CONTACT_FINDER_TIMEOUT = float(os.getenv("CONTACT_FINDER_TIMEOUT", "180"))
+
+# Contact searches from every session share this pool. A dropped batch that has
+# started holds its worker until its agent's current step ends, so the pool is bounded.
+search_workers = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CONTACT_SEARCH_WORKERS", "16")),
+    thread_name_prefix="contact-search",
+)
+
+# Model behind the company and contact search agents
+SEARCH_MODEL_ID = "gpt-4.1-mini"
+
+# Deadline (time.monotonic()) of the batch a search thread is running, set by run_batches
+_search_deadline = threading.local()
+
+# Models keep per-call token counts, so each thread uses its own
+_search_models = threading.local()
+
+def get_search_model():
+    """
+    The calling thread's model for the search agents, reused across its calls along with its HTTP connections.
+
+    Each request an agent makes with it goes through the OpenAI limiter on its own.
+    """
+    model = getattr(_search_models, "model", None)
+    if model is None:
+        model = _search_models.model = LimitedModel(OpenAIServerModel(
+            model_id=SEARCH_MODEL_ID, # Optimizes performance and cost
+            api_base="https://api.openai.com/v1",
+            api_key=os.environ["OPENAI_API_KEY"],
+        ), get_limiter("openai"))
+    return model
+
+@timed("tool")
+@coalesce("companies")
+@cached("companies", key=canonicalize_query)
 def company_finder_tool(user_query):
     """Use this function to find companies from the internet.
 
@@ -14,19 +66,19 @@ def company_finder_tool(user_query):
         str: Array of companies
     """
 
-    model = OpenAIServerModel(
-        model_id="gpt-4.1-mini", # Optimizes performance and cost
-        api_base="https://api.openai.com/v1",
-        api_key=os.environ["OPENAI_API_KEY"],
-    )
-
-    with open(os.path.join(SCRIPT_DIR, "company_prompt.txt"), "r", encoding="utf-8") as f:
-        instructions = f.read()
+    model = get_search_model()
+    instructions = load_prompt(os.path.join(SCRIPT_DIR, "company_prompt.txt"))
 
     agent = CodeAgent(tools=[], model=model, add_base_tools=True)
 
-    return agent.run(f'{instructions}\n\n{user_query}')
+    task = f'{instructions}\n\n{user_query}'
+    with span("model", SEARCH_MODEL_ID) as model_span:
+        try:
+            return agent.run(task)
+        finally:
+            record_agent_tokens(model_span, agent)
 
+@timed("tool")
 def contact_finder_tool(company_list):
     """Use this function to find contacts from the internet.
 
@@ -37,15 +89,171 @@ def contact_finder_tool(company_list):
         str: Array of contacts as JSON objects.
     """
 
-    model = OpenAIServerModel(
-        model_id="gpt-4.1-mini", # Optimizes performance and cost
-        api_base="https://api.openai.com/v1",
-        api_key=os.environ["OPENAI_API_KEY"],
+    companies = _as_company_list(company_list)
+    if not CONTACT_FINDER_FANOUT or companies is None or len(companies) <= CONTACT_FINDER_BATCH_SIZE:
+        contacts = dedupe_contacts(parse_contacts(_search_contacts(company_list)))
+    else:
+        contacts = find_contacts_fanout(companies)
+    return json.dumps(contacts)
+
+def find_contacts_fanout(companies, batch_size=None, concurrency=None, timeout=None):
+    """
+    Search contacts for `companies` in small batches with bounded concurrency.
+
+    Each batch runs its own agent. Batches that fail or exceed `timeout` seconds
+    are skipped so they cannot hold up the rest. Returns the merged, deduplicated
+    list of contacts.
+    """
+    batch_size = batch_size or CONTACT_FINDER_BATCH_SIZE
+    batches = [companies[i:i + batch_size] for i in range(0, len(companies), batch_size)]
+    results = run_batches(batches, concurrency or CONTACT_FINDER_CONCURRENCY, timeout or CONTACT_FINDER_TIMEOUT)
+
+    contacts = []
+    for result in results:
+        if result is not None:
+            contacts.extend(parse_contacts(result))
+    return dedupe_contacts(contacts)
+
+def find_contacts_by_company(companies, concurrency=None, timeout=None):
+    """
+    Search contacts for each company on its own, with bounded concurrency.
+
+    Returns one entry per company, in order: its deduplicated contacts, or None
+    if the search failed or timed out.
+    """
+    results = run_batches(
+        [[company] for company in companies],
+        concurrency or CONTACT_FINDER_CONCURRENCY,
+        timeout or CONTACT_FINDER_TIMEOUT,
+    )
+    return [None if result is None else dedupe_contacts(parse_contacts(result)) for result in results]
+
+def run_batches(batches, concurrency, timeout):
+    """
+    Run _search_contacts on each batch on the shared pool, at most `concurrency` at once.
+
+    Returns the results in order. A batch that failed, or had not finished
+    `timeout` seconds after it was submitted, gives None: if it has not started
+    by then it is cancelled, otherwise its agent stops after its current step.
+    """
+    results = [None] * len(batches)
+
+    def run(index, deadline):
+        _search_deadline.at = deadline
+        try:
+            return _search_contacts(batches[index])
+        finally:
+            _search_deadline.at = None
+
+    queued = list(range(len(batches)))
+    running = {}
+    while queued or running:
+        while queued and len(running) < concurrency:
+            index = queued.pop(0)
+            deadline = time.monotonic() + timeout
+            # Each search runs in a copy of this context, so its spans roll up into the caller's
+            future = search_workers.submit(contextvars.copy_context().run, run, index, deadline)
+            running[future] = (index, deadline)
+
+        next_deadline = min(deadline for _, deadline in running.values())
+        done, _ = wait(running, timeout=max(0.0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            index, _ = running.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                print(f"Contact search failed for {batches[index]}: {e}")
+
+        now = time.monotonic()
+        for future, (index, deadline) in list(running.items()):
+            if now >= deadline and not future.done():
+                print(f"Contact search timed out after {timeout}s for: {batches[index]}")
+                future.cancel()
+                del running[future]
+    return results
+
+def record_agent_tokens(model_span, agent):
+    """Add the tokens used by every model call of an agent's run to `model_span`"""
+    monitor = agent.monitor
+    model_span.add_tokens(
+        getattr(monitor, "total_input_token_count", 0), getattr(monitor, "total_output_token_count", 0),
     )
 
-    with open(os.path.join(SCRIPT_DIR, "contact_prompt.txt"), "r", encoding="utf-8") as f:
-        instructions = f.read()
+def _stop_after_deadline(step, agent):
+    """Step callback interrupting a search agent whose batch is past its deadline"""
+    deadline = getattr(_search_deadline, "at", None)
+    if deadline is not None and time.monotonic() >= deadline:
+        agent.interrupt()
 
-    agent = CodeAgent(tools=[], model=model, add_base_tools=True)
+@coalesce("contacts")
+@cached("contacts", key=canonicalize_query)
+def _search_contacts(company_list):
+    model = get_search_model()
+    instructions = load_prompt(os.path.join(SCRIPT_DIR, "contact_prompt.txt"))
+
+    agent = CodeAgent(tools=[], model=model, add_base_tools=True, step_callbacks=[_stop_after_deadline])
+
+    task = f'{instructions}\n\n{company_list}'
+    with span("model", SEARCH_MODEL_ID) as model_span:
+        try:
+            return agent.run(task)
+        finally:
+            record_agent_tokens(model_span, agent)
+
+def _as_company_list(company_list):
+    """Return `company_list` as a list of companies, or None if it cannot be split"""
+    if isinstance(company_list, str):
+        try:
+            company_list = json.loads(company_list)
+        except json.JSONDecodeError:
+            return None
+    if isinstance(company_list, (list, tuple)):
+        return list(company_list)
+    return None
+
+def parse_contacts(result):
+    """
+    Turn an agent result into a list of contact dicts.
+
+    Results that cannot be parsed are kept as {"raw": ...} so no data is lost.
+    """
+    if isinstance(result, dict):
+        return [result]
+    if isinstance(result, (list, tuple)):
+        return [c if isinstance(c, dict) else {"raw": str(c)} for c in result]
+
+    text = str(result).strip()
+    start, end = text.find("["), text.rfind("]")
+    if start != -1 and end > start:
+        try:
+            parsed = json.loads(text[start:end + 1])
+            if isinstance(parsed, list):
+                return parse_contacts(parsed)
+        except json.JSONDecodeError:
+            pass
+    return [{"raw": text}] if text else []
+
+def _contact_field(contact, *names):
+    """Case-insensitive lookup of the first non-empty field in `names`"""
+    lowered = {str(k).lower(): v for k, v in contact.items()}
+    for name in names:
+        value = lowered.get(name)
+        if value:
+            return str(value).strip().lower()
+    return ""
 
-    return agent.run(f'{instructions}\n\n{company_list}')
+def dedupe_contacts(contacts):
+    """Drop repeated contacts, matching on LinkedIn URL, then email, then name"""
+    seen = set()
+    unique = []
+    for contact in contacts:
+        key = (
+            _contact_field(contact, "linkedin", "linkedin_url", "profile_url").rstrip("/")
+            or _contact_field(contact, "email")
+            or _contact_field(contact, "name", "raw")
+        )
+        if key and key in seen:
+            continue
+        seen.add(key)
+        unique.append(contact)
+    return unique
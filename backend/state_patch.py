@@ -0,0 +1,98 @@
+import copy
+
+# Fields the model may change and how: lists of records, dicts merged by
+# 'update', and plain values that can only be replaced
+LIST_FIELDS = {"companies", "contacts"}
+DICT_FIELDS = {"user_data", "current_email"}
+VALUE_FIELDS = {"num_processed_emails"}
+
+OPS = {"add", "remove", "update", "set"}
+
+class PatchError(ValueError):
+    """Raised when a state patch from the model is malformed"""
+
+def apply_patch(state, patch):
+    """
+    Apply a list of patch operations to `state` and return the new state.
+
+    Operations are dicts with an 'op', a 'field' and, depending on the op:
+    - add:    append 'value' (a record or a list of records) to a list field
+    - remove: delete the record at index 'id' from a list field
+    - update: merge the dict 'value' into the record at 'id' of a list field,
+              or into a dict field when no 'id' is given
+    - set:    replace the whole field with 'value'
+
+    Record ids are indexes into the lists as they were before the patch, so
+    several removes and updates in one patch never shift each other. The patch
+    is validated in full before anything is applied; `state` is not modified.
+    """
+    if not isinstance(patch, list):
+        raise PatchError(f"Patch must be a list of operations, got {type(patch).__name__}")
+    for op in patch:
+        _validate(op, state)
+    for field in LIST_FIELDS:
+        ops = [op["op"] for op in patch if op["field"] == field]
+        if "set" in ops and len(ops) > 1:
+            raise PatchError(f"'set' on {field} cannot be combined with other operations on it")
+
+    new_state = copy.copy(state)
+    for field in LIST_FIELDS:
+        if field in new_state:
+            new_state[field] = list(new_state[field])
+
+    removed = {field: set() for field in LIST_FIELDS}
+    added = {field: [] for field in LIST_FIELDS}
+    for op in patch:
+        field = op["field"]
+        kind = op["op"]
+        if kind == "set":
+            new_state[field] = op["value"]
+        elif kind == "add":
+            value = op["value"]
+            added[field].extend(value if isinstance(value, list) else [value])
+        elif kind == "remove":
+            removed[field].add(op["id"])
+        elif kind == "update" and field in LIST_FIELDS:
+            index = op["id"]
+            new_state[field][index] = {**new_state[field][index], **op["value"]}
+        elif kind == "update":
+            new_state[field] = {**(new_state.get(field) or {}), **op["value"]}
+
+    for field in LIST_FIELDS:
+        if removed[field] or added[field]:
+            records = [r for i, r in enumerate(new_state.get(field, [])) if i not in removed[field]]
+            new_state[field] = records + added[field]
+    return new_state
+
+def _validate(op, state):
+    if not isinstance(op, dict):
+        raise PatchError(f"Patch operation must be an object: {op!r}")
+    kind, field = op.get("op"), op.get("field")
+    if kind not in OPS:
+        raise PatchError(f"Unknown patch op {kind!r}")
+    if field not in LIST_FIELDS | DICT_FIELDS | VALUE_FIELDS:
+        raise PatchError(f"Unknown state field {field!r}")
+    if kind != "remove" and "value" not in op:
+        raise PatchError(f"'{kind}' on {field} needs a 'value'")
+
+    if kind in ("add", "remove") and field not in LIST_FIELDS:
+        raise PatchError(f"'{kind}' only applies to {sorted(LIST_FIELDS)}, not {field}")
+    if kind == "update" and field in VALUE_FIELDS:
+        raise PatchError(f"Use 'set' to change {field}")
+    if kind == "update" and not isinstance(op["value"], dict):
+        raise PatchError(f"'update' on {field} needs an object value")
+
+    if field in LIST_FIELDS and kind in ("remove", "update"):
+        index = op.get("id")
+        if not isinstance(index, int) or isinstance(index, bool) or not 0 <= index < len(state.get(field, [])):
+            raise PatchError(f"No {field} record with id {index!r}")
+        if kind == "update" and not isinstance(state[field][index], dict):
+            raise PatchError(f"{field} record {index} is not an object")
+    if kind == "set":
+        value = op["value"]
+        if field in LIST_FIELDS and not isinstance(value, list):
+            raise PatchError(f"'set' on {field} needs a list")
+        if field in DICT_FIELDS and not isinstance(value, dict):
+            raise PatchError(f"'set' on {field} needs an object")
+        if field == "num_processed_emails" and (not isinstance(value, int) or isinstance(value, bool) or value < 0):
+            raise PatchError("num_processed_emails must be a non-negative integer")
@@ -0,0 +1,391 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from agno.run.response import RunEvent
+import app
+import email_drafting
+from checkpoint_store import CheckpointStore
+import fake_llm
+from fake_llm import FakeAgent
+
+BASIC_INFO = {"first_name": "John", "company": "Acme Inc", "industry": "Technology"}
+
+
+def reply(text, step="CONTEXT_GENERATION", patch=()):
+    return {"content": {"text": text, "step": step, "patch": list(patch)}}
+
+
+class TestAgentTurns(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.checkpoints = app.checkpoints
+        app.checkpoints = CheckpointStore(os.path.join(self.tmpdir.name, "checkpoints.sqlite3"))
+        self.client = app.socketio.test_client(app.app)
+        self.received = []
+
+    def tearDown(self):
+        self.client.disconnect()
+        app.checkpoints = self.checkpoints
+        self.tmpdir.cleanup()
+
+    def start_session(self, session_id, responses, delay=0.0):
+        self.client.emit("initialize_agent", {"basic_info": dict(BASIC_INFO), "session_id": session_id})
+        self.assertEqual(self.client.get_received()[0]["name"], "agent_initialized")
+        agent = app.sessions.get(session_id)
+        agent.agent = FakeAgent(responses, delay=delay, chunk_chars=8)
+        return agent
+
+    def wait_for(self, name, timeout=5.0):
+        """Collect events until one named `name` arrives; returns all events so far"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.received.extend(self.client.get_received())
+            if any(event["name"] == name for event in self.received):
+                return self.received
+            time.sleep(0.01)
+        self.fail(f"No {name!r} event within {timeout}s; got {[e['name'] for e in self.received]}")
+
+    def test_turn_runs_on_the_worker_pool(self):
+        """The handler returns once the turn is queued; progress and the output follow from the pool"""
+        self.start_session("turn-pool", [reply("Okay, I've updated your profile.")], delay=0.3)
+        self.client.emit("user_input", {"text": "We sell CRM software"})
+
+        # The handler has returned with the turn queued, long before the model answers
+        self.received = self.client.get_received()
+        self.assertIn({"event": "queued"}, [e["args"][0] for e in self.received])
+        self.assertNotIn("agent_output", [e["name"] for e in self.received])
+
+        events = self.wait_for("agent_output")
+        progress = [e["args"][0] for e in events if e["name"] == "agent_progress"]
+        kinds = [p["event"] for p in progress]
+        self.assertIn("prompt", kinds)
+        self.assertEqual(kinds[-1], "completed")
+        streamed = "".join(p["text"] for p in progress if p["event"] == "text_delta")
+        self.assertEqual(streamed, "Okay, I've updated your profile.")
+        self.assertEqual(events[-1]["name"], "agent_output")
+        self.assertEqual(events[-1]["args"][0], "Okay, I've updated your profile.")
+
+        # The turn's state was checkpointed
+        self.assertEqual(app.checkpoints.load("turn-pool")["previous_step"], "CONTEXT_GENERATION")
+
+    def test_turn_errors_are_emitted(self):
+        """An unparseable reply ends the turn with an 'error' event"""
+        self.start_session("turn-error", [{"content": "not json at all"}])
+        self.client.emit("user_input", {"text": "hello"})
+        events = self.wait_for("error")
+        self.assertEqual(events[-1]["args"][0]["message"], "Failed to parse agent response")
+        self.assertNotIn("agent_output", [e["name"] for e in events])
+
+    def test_sessions_are_resumed_only_with_their_token(self):
+        """Another client cannot take over a session id without the token issued with it"""
+        self.client.emit("initialize_agent", {"basic_info": dict(BASIC_INFO), "session_id": "owned"})
+        token = self.client.get_received()[0]["args"][0]["session_token"]
+        other = app.socketio.test_client(app.app)
+        self.addCleanup(other.disconnect)
+
+        other.emit("initialize_agent", {"basic_info": {}, "session_id": "owned"})
+        other.emit("initialize_agent", {"basic_info": {}, "session_id": "owned", "session_token": "guess"})
+        self.assertEqual([e["name"] for e in other.get_received()], ["error", "error"])
+
+        # The token still works once the session has been evicted to its checkpoint
+        app.sessions.remove("owned")
+        other.emit("initialize_agent", {"basic_info": {}, "session_id": "owned", "session_token": token})
+        initialized = other.get_received()[0]["args"][0]
+        self.assertTrue(initialized["resumed"])
+        self.assertEqual(initialized["session_token"], token)
+
+    def test_session_is_pinned_during_its_turn(self):
+        """A running turn's session is not evicted, so reloading it cannot build a second agent"""
+        agent = self.start_session("pinned", [reply("Okay.")], delay=0.5)
+        self.client.emit("user_input", {"text": "hello"})
+        with mock.patch.object(app.sessions, "ttl_seconds", 1e-9):
+            app.sessions.evict_expired()
+            self.assertIs(app.load_session("pinned"), agent)
+            self.wait_for("agent_output")
+            # Unpinned as the turn ends, just after its output is emitted
+            deadline = time.monotonic() + 5
+            while "pinned" in app.sessions and time.monotonic() < deadline:
+                app.sessions.evict_expired()
+                time.sleep(0.01)
+        self.assertNotIn("pinned", app.sessions)
+        self.assertEqual(app.checkpoints.load("pinned")["previous_step"], "CONTEXT_GENERATION")
+
+    def test_session_is_not_replaced_during_its_turn(self):
+        """Re-initializing a session with a turn running is refused, so the turn cannot overwrite the new checkpoint"""
+        basic_info = dict(BASIC_INFO, uid="reinit")
+        self.client.emit("initialize_agent", {"basic_info": basic_info})
+        token = self.client.get_received()[0]["args"][0]["session_token"]
+        agent = app.sessions.get("reinit")
+        agent.agent = FakeAgent([reply("Okay.")], delay=0.3)
+        self.client.emit("user_input", {"text": "hello"})
+        self.client.emit("initialize_agent", {"basic_info": basic_info, "session_token": token})
+        events = [e for e in self.client.get_received() if e["name"] != "agent_progress"]
+        self.assertEqual(events[0]["name"], "error")
+        self.assertIn("turn running", events[0]["args"][0]["message"])
+        self.assertIs(app.sessions.get("reinit"), agent)
+
+        # Once the turn has ended the session can be started over
+        self.wait_for("agent_output")
+        deadline = time.monotonic() + 5
+        while agent.pending_turns and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.client.emit("initialize_agent", {"basic_info": basic_info, "session_token": token})
+        self.assertEqual(self.client.get_received()[0]["name"], "agent_initialized")
+        self.assertIsNot(app.sessions.get("reinit"), agent)
+
+    def test_busy_session_holds_one_worker(self):
+        """A session's turns run one at a time, on one worker, so other sessions are not kept waiting"""
+        pool = app.ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(app, "agent_workers", pool):
+            busy = self.start_session("busy", [reply(f"Reply {i}.") for i in range(3)], delay=0.4)
+            for i in range(3):
+                self.client.emit("user_input", {"text": f"message {i}"})
+            self.assertEqual(len(busy.pending_turns), 3)
+
+            other = app.socketio.test_client(app.app)
+            self.addCleanup(other.disconnect)
+            other.emit("initialize_agent", {"basic_info": dict(BASIC_INFO), "session_id": "idle"})
+            app.sessions.get("idle").agent = FakeAgent([reply("Quick.")])
+            start = time.monotonic()
+            other.emit("user_input", {"text": "hello"})
+            while "agent_output" not in [e["name"] for e in other.get_received()]:
+                self.assertLess(time.monotonic() - start, 5)
+                time.sleep(0.01)
+            # Well before the busy session's second turn could have ended
+            self.assertLess(time.monotonic() - start, 0.6)
+
+            deadline = time.monotonic() + 5
+            while len([e for e in self.received if e["name"] == "agent_output"]) < 3:
+                self.assertLess(time.monotonic(), deadline)
+                self.received.extend(self.client.get_received())
+                time.sleep(0.01)
+        outputs = [e["args"][0] for e in self.received if e["name"] == "agent_output"]
+        self.assertEqual(outputs, ["Reply 0.", "Reply 1.", "Reply 2."])
+        self.assertEqual(len(busy.pending_turns), 0)
+
+    def test_input_without_a_session(self):
+        """user_input before initialize_agent is rejected"""
+        self.client.emit("user_input", {"text": "hello"})
+        events = self.client.get_received()
+        self.assertEqual(events[0]["name"], "error")
+        self.assertIn("initialize_agent", events[0]["args"][0]["message"])
+
+
+class TestDraftQueue(unittest.TestCase):
+    def test_review_waits_only_for_the_current_draft(self):
+        """The next review turn waits for its own contact's draft, not the whole batch"""
+        def draft_email(contact, user_data):
+            time.sleep(0.05 if contact["name"] == "C1" else 1.0)
+            return {"subject": f"Hi {contact['name']}", "content": "..."}
+
+        agent = app.MainAgent(dict(BASIC_INFO))
+        agent.contacts = [{"name": f"C{i}", "email": f"c{i}@acme.com"} for i in range(12)]
+        agent.num_processed_emails = 1
+        with mock.patch.object(email_drafting, "draft_email", draft_email):
+            agent.start_batch_drafting()
+            self.assertEqual(sorted(agent.drafting), list(range(1, 12)))
+            start = time.monotonic()
+            draft = agent.next_queued_draft()
+            self.assertLess(time.monotonic() - start, 0.5)
+            self.assertEqual(draft["subject"], "Hi C1")
+            # The other drafts are still in flight and picked up by later turns
+            self.assertNotIn(1, agent.drafting)
+            self.assertIn(11, agent.drafting)
+
+            # A changed contact list stops the drafts that have not started
+            agent.set_state({"contacts": agent.contacts[:3]})
+            self.assertEqual(agent.drafting, {})
+            self.assertEqual(agent.draft_queue, {})
+
+
+def found_contacts(companies, concurrency=None, timeout=None):
+    """Stands in for find_contacts_by_company with the contact shape the search returns; "Down" fails"""
+    return [None if c["name"] == "Down" else
+            [{"Name": f"Lead at {c['name']}", "LinkedIn": f"https://linkedin.com/in/{c['name'].lower()}",
+              "Email": f"lead@{c['name'].lower()}.com", "Company": f"{c['name']}, Inc."}]
+            for c in companies]
+
+
+class TestContactSearch(unittest.TestCase):
+    def setUp(self):
+        self.agent = app.MainAgent(dict(BASIC_INFO, context="We sell CRM software"))
+        patcher = mock.patch.object(app, "find_contacts_by_company", mock.Mock(side_effect=found_contacts))
+        self.search = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def names(self):
+        return [c["Name"] for c in self.agent.contacts]
+
+    def test_found_contacts_are_not_pruned(self):
+        """Contacts with just a name, LinkedIn URL and email all reach the model and the state"""
+        self.agent.companies = [{"name": "Stripe"}, {"name": "Ramp"}, {"name": "Brex"}]
+        result = json.loads(self.agent.company_contacts_tool())
+        self.assertEqual([c["record"]["Name"] for c in result["new_contacts"]],
+                         ["Lead at Stripe", "Lead at Ramp", "Lead at Brex"])
+        self.assertEqual(result["searched"], ["Stripe", "Ramp", "Brex"])
+        self.assertEqual(self.names(), ["Lead at Stripe", "Lead at Ramp", "Lead at Brex"])
+
+    def test_only_added_companies_are_searched(self):
+        """A changed company list searches the added companies, reuses the kept ones and drops the removed ones"""
+        self.agent.companies = [{"name": "Stripe"}, {"name": "Ramp"}, {"name": "Down"}]
+        result = json.loads(self.agent.company_contacts_tool())
+        self.assertEqual(result["failed"], ["Down"])
+
+        self.agent.set_state({"companies": [{"name": "Ramp"}, {"name": "Brex"}, {"name": "Down"}]})
+        # Stripe's contact goes, even though its 'Company' is spelled differently
+        self.assertEqual(self.names(), ["Lead at Ramp"])
+        self.assertEqual(sorted(self.agent.contacts_by_company), ["ramp"])
+
+        result = json.loads(self.agent.company_contacts_tool())
+        self.assertEqual(self.search.call_args[0][0], [{"name": "Brex"}, {"name": "Down"}])
+        self.assertEqual((result["searched"], result["reused"]), (["Brex"], ["Ramp"]))
+        self.assertEqual([c["id"] for c in result["new_contacts"]], [1])
+        self.assertEqual(self.names(), ["Lead at Ramp", "Lead at Brex"])
+
+    def test_found_contacts_survive_a_failed_turn(self):
+        """Contacts recorded as found stay in the state when the turn's reply cannot be applied"""
+        self.agent.previous_step = app.WorkflowStep.CONTACTS.value
+        self.agent.companies = [{"name": "Stripe"}, {"name": "Ramp"}]
+        self.agent.company_contacts_tool()
+        self.agent.agent = FakeAgent([
+            {"content": "not json at all"},
+            reply("Here you go.", step="CONTACT_SEARCH", patch=[{"op": "remove", "field": "contacts", "id": 9}]),
+            reply("Here you go.", step="CONTACT_SEARCH"),
+        ])
+        for text in ("find contacts", "find contacts", "find contacts"):
+            self.agent.handle_input({"text": text})
+            self.assertEqual(self.names(), ["Lead at Stripe", "Lead at Ramp"])
+        # And the next search does not run again for them
+        self.assertEqual(json.loads(self.agent.company_contacts_tool())["reused"], ["Stripe", "Ramp"])
+        self.assertEqual(self.search.call_count, 1)
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class FlakyAgent:
+    """Streams a reply in two chunks; its first run is rate-limited after `fail_after` chunks"""
+
+    def __init__(self, fail_after):
+        self.fail_after = fail_after
+        self.runs = 0
+        self.run_response = SimpleNamespace(metrics={})
+
+    def run(self, message, stream=True, stream_intermediate_steps=True):
+        self.runs += 1
+        chunks = ['{"text": "Hello ', 'there.", "step": "CONTEXT_GENERATION", "patch": []}']
+        for i, content in enumerate(chunks):
+            if self.runs == 1 and i == self.fail_after:
+                raise RateLimited("429 Too Many Requests")
+            yield SimpleNamespace(event=RunEvent.run_response, content=content)
+
+
+class TestRateLimitedRuns(unittest.TestCase):
+    def run_turn(self, fail_after):
+        agent = app.MainAgent(dict(BASIC_INFO))
+        agent.agent = FlakyAgent(fail_after)
+        events = []
+        with mock.patch.object(app.get_limiter("openai"), "_sleep", lambda seconds: None):
+            result = agent.handle_input({"text": "hi"}, on_progress=events.append)
+        streamed = "".join(e["text"] for e in events if e["event"] == "text_delta")
+        return agent.agent.runs, result, streamed
+
+    def test_run_is_retried_before_anything_streamed(self):
+        """A 429 before the first chunk restarts the run"""
+        runs, result, streamed = self.run_turn(fail_after=0)
+        self.assertEqual(runs, 2)
+        self.assertEqual(result["text"], "Hello there.")
+        self.assertEqual(streamed, "Hello there.")
+
+    def test_run_is_not_restarted_once_streaming(self):
+        """A 429 after text reached the client fails the turn instead of streaming the text again"""
+        runs, result, streamed = self.run_turn(fail_after=1)
+        self.assertEqual(runs, 1)
+        self.assertIn("interrupted", result["error"])
+        self.assertEqual(streamed, "Hello ")
+
+
+class TestFakeModels(unittest.TestCase):
+    def test_install_fake_models_swaps_the_factories(self):
+        """Offline runs replace the model factories; sessions keep their real tools"""
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.object(app, "make_agent", app.make_agent), \
+                mock.patch.object(email_drafting, "make_agent", email_drafting.make_agent):
+            script_path = os.path.join(directory, "script.json")
+            with open(script_path, "w", encoding="utf-8") as f:
+                json.dump([reply("Okay, I've updated your profile.")], f)
+            fake_llm.install_fake_models(script_path, delay=0.0, delay_per_token=0.0)
+
+            agent = app.MainAgent(dict(BASIC_INFO))
+            self.assertIsInstance(agent.agent, FakeAgent)
+            self.assertIn(agent.view_records, agent.agent.tools)
+            self.assertEqual(agent.handle_input({"text": "hi"})["text"], "Okay, I've updated your profile.")
+            draft = email_drafting.complete_json("Draft an email", {"recipient": "Jane"})
+            self.assertEqual(draft["subject"], fake_llm.FAKE_DRAFT["subject"])
+
+
+class TestSteps(unittest.TestCase):
+    def test_null_or_unknown_step_keeps_the_previous_one(self):
+        """A conversational reply (step null) or an unknown step leaves the workflow where it was"""
+        agent = app.MainAgent(dict(BASIC_INFO))
+        agent.agent = FakeAgent([
+            reply("Moving on to companies.", step="COMPANY_SEARCH"),
+            {"content": {"text": "Happy to help!", "step": None, "patch": []}},
+            reply("Done?", step="FINISHED"),
+            {"content": {"text": "Sure.", "state": {}}},
+        ])
+        agent.handle_input({"text": "find companies"})
+        self.assertEqual(agent.previous_step, "COMPANY_SEARCH")
+        for text in ("what can you do?", "are we done?", "ok"):
+            agent.handle_input({"text": text})
+            self.assertEqual(agent.previous_step, "COMPANY_SEARCH")
+            self.assertEqual(agent.turn_steps(), ["COMPANY_SEARCH", "CONTACT_SEARCH"])
+            self.assertIn("Step 2", agent.step_instructions())
+
+
+class TestPromptState(unittest.TestCase):
+    def make_agent(self, size):
+        agent = app.MainAgent(dict(BASIC_INFO))
+        agent.previous_step = app.WorkflowStep.CONTACTS.value
+        agent.companies = [{"name": f"Company {i}", "reason": "Fintech"} for i in range(size)]
+        agent.contacts = [{"name": f"Contact {i}", "email": f"c{i}@acme.com", "company": f"Company {i}"}
+                          for i in range(2 * size)]
+        return agent
+
+    def test_prompt_stays_flat_as_lists_grow(self):
+        """Only the first page of each list is sent, with the totals"""
+        small, large = self.make_agent(50).prompt_state(), self.make_agent(500).prompt_state()
+        self.assertEqual(len(large["contacts"]), app.PROMPT_PAGE_SIZE)
+        self.assertEqual(len(large["company_refs"]), app.PROMPT_PAGE_SIZE)
+        self.assertEqual((large["num_companies"], large["num_contacts"]), (500, 1000))
+        self.assertLess(abs(len(json.dumps(large)) - len(json.dumps(small))), 100)
+
+    def test_view_records_reads_other_pages(self):
+        """view_records returns the requested page with ids, capped at one page"""
+        agent = self.make_agent(50)
+        page = json.loads(agent.view_records("contacts", start=95, count=10))
+        self.assertEqual(page["total"], 100)
+        self.assertEqual([r["id"] for r in page["records"]], list(range(95, 100)))
+        self.assertEqual(page["records"][0]["record"]["name"], "Contact 95")
+        page = json.loads(agent.view_records("companies", start=0, count=1000))
+        self.assertEqual(len(page["records"]), app.PROMPT_PAGE_SIZE)
+        self.assertIn("error", json.loads(agent.view_records("emails")))
+
+    def test_prompt_size_is_a_metric(self):
+        """Every turn's prompt size is recorded by step"""
+        agent = self.make_agent(5)
+        agent.agent = FakeAgent([reply("Here are your contacts.", step="CONTACT_SEARCH")])
+        before = app.PROMPT_CHARS.count(step="CONTACT_SEARCH")
+        agent.handle_input({"text": "looks good"})
+        self.assertEqual(app.PROMPT_CHARS.count(step="CONTACT_SEARCH"), before + 1)
+        self.assertIn("agent_prompt_chars_bucket", app.render_prometheus())
+
+
+if __name__ == "__main__":
+    unittest.main()
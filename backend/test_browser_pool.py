@@ -0,0 +1,129 @@
+import os
+import asyncio
+import tempfile
+import threading
+import unittest
+import urllib.request
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from browser_pool import BrowserPool
+
+STAND_IN_PAGE = """<html><body>
+<ul class="results">
+  <li><a href="/in/jane-doe/">Jane Doe</a> - Head of Sales at Acme Foods</li>
+  <li><a href="/in/bob-lee/">Bob Lee</a> - VP Sales at Noodle Co</li>
+</ul>
+</body></html>"""
+
+
+class FakeContext:
+    """Browser context stand-in that loads pages with urllib"""
+
+    def __init__(self):
+        self.closed = False
+        self.pages = []
+
+    async def goto(self, url):
+        html = await asyncio.to_thread(lambda: urllib.request.urlopen(url).read().decode())
+        self.pages.append(url)
+        return html
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeFactory:
+    def __init__(self):
+        self.contexts = []
+        self.closed = False
+
+    async def new_context(self):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.closed = True
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class TestBrowserPool(unittest.TestCase):
+    def setUp(self):
+        """Serve a static stand-in for the LinkedIn search page"""
+        self.site = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.site.name, "search.html"), "w") as f:
+            f.write(STAND_IN_PAGE)
+        self.server = HTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=self.site.name))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.factory = FakeFactory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.site.cleanup()
+
+    def test_contexts_are_reused_and_recycled(self):
+        """A context serves max_uses scrapes against the stand-in site, then is replaced"""
+        pool = BrowserPool(max_concurrency=1, max_uses=2, factory=self.factory, memory_usage=None)
+
+        async def scrape():
+            async with pool.session() as context:
+                return await context.goto(f"{self.base_url}/search.html")
+
+        async def run():
+            pages = [await scrape() for _ in range(3)]
+            await pool.close()
+            return pages
+
+        pages = asyncio.run(run())
+        self.assertIn("Jane Doe", pages[0])
+        self.assertEqual(len(self.factory.contexts), 2)
+        self.assertEqual(len(self.factory.contexts[0].pages), 2)
+        self.assertTrue(all(context.closed for context in self.factory.contexts))
+        self.assertTrue(self.factory.closed)
+
+    def test_concurrency_bound(self):
+        """No more than max_concurrency contexts are in use at once"""
+        pool = BrowserPool(max_concurrency=2, factory=self.factory, memory_usage=None)
+        peak = []
+
+        async def scrape():
+            async with pool.session():
+                peak.append(pool.stats()["in_use"])
+                await asyncio.sleep(0.01)
+
+        async def run():
+            await asyncio.gather(*(scrape() for _ in range(6)))
+
+        asyncio.run(run())
+        self.assertEqual(max(peak), 2)
+        self.assertEqual(len(self.factory.contexts), 2)
+
+    def test_failures_and_memory_pressure_discard_contexts(self):
+        """A context that raised, or is released over the memory limit, is closed"""
+        memory = {"mb": 100}
+        pool = BrowserPool(max_concurrency=1, max_memory_mb=500, factory=self.factory,
+                           memory_usage=lambda: memory["mb"])
+
+        async def run():
+            with self.assertRaises(RuntimeError):
+                async with pool.session():
+                    raise RuntimeError("page crashed")
+            memory["mb"] = 600
+            async with pool.session():
+                pass
+            return pool.stats()
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["recycled"], 2)
+        self.assertEqual(stats["idle"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import json
+import tempfile
+import unittest
+from campaign_io import parse_profile_row, load_profiles, read_progress, collect_leads
+
+
+class TestCampaignIO(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def test_parse_profile_row(self):
+        """Cells are stripped, empty ones dropped and list fields split"""
+        row = {" first_name ": " Jane ", "company": "", "target_roles": "CEO; Head of Sales ;", None: "extra"}
+        self.assertEqual(parse_profile_row(row), {"first_name": "Jane", "target_roles": ["CEO", "Head of Sales"]})
+        self.assertEqual(parse_profile_row({"target_roles": '["VP Sales", "CTO"]'}), {"target_roles": ["VP Sales", "CTO"]})
+
+    def test_load_profiles(self):
+        """CSV and JSONL profiles get an id: their own, their uid, or their line number"""
+        csv_path = self.write("profiles.csv", "id,first_name,target_roles\np1,Jane,CEO;CTO\n,Bob,\n")
+        profiles = load_profiles(csv_path)
+        self.assertEqual([p["id"] for p in profiles], ["p1", "2"])
+        self.assertEqual(profiles[0]["target_roles"], ["CEO", "CTO"])
+        self.assertNotIn("target_roles", profiles[1])
+
+        jsonl_path = self.write("profiles.jsonl", '{"uid": "u7", "first_name": "Ann"}\n\n{"id": "p9"}\n{"first_name": "Cy"}\n')
+        self.assertEqual([p["id"] for p in load_profiles(jsonl_path)], ["u7", "p9", "3"])
+
+    def test_read_progress(self):
+        """Completed profiles are skipped on resume; others keep counting their attempts"""
+        self.assertEqual(read_progress(os.path.join(self.tmpdir.name, "missing.jsonl")), (set(), {}))
+        records = [
+            {"profile_id": "p1", "type": "started", "attempt": 1},
+            {"profile_id": "p2", "type": "started", "attempt": 1},
+            {"profile_id": "p1", "type": "completed"},
+            {"profile_id": "p2", "type": "started", "attempt": 2},
+            {"profile_id": "p3", "type": "started"},
+        ]
+        # The last line was cut short by a killed run
+        path = self.write("campaign.jsonl", "".join(json.dumps(r) + "\n" for r in records) + '{"profile_id": "p3", "ty')
+        completed, attempts = read_progress(path)
+        self.assertEqual(completed, {"p1"})
+        self.assertEqual(attempts, {"p1": 1, "p2": 2, "p3": 1})
+
+    def test_collect_leads(self):
+        """Only the contacts of each profile's last attempt are kept"""
+        records = [
+            {"profile_id": "p1", "type": "started", "attempt": 1},
+            {"profile_id": "p1", "type": "contact", "contact": {"name": "Old Lead", "company": "Acme"}},
+            {"profile_id": "p1", "type": "started", "attempt": 2},
+            {"profile_id": "p1", "type": "contact", "contact": {"name": "Jane Doe", "company": "Acme"}},
+            {"profile_id": "p2", "type": "started", "attempt": 1},
+            {"profile_id": "p2", "type": "contact", "contact": {"name": "Bob Lee", "company": "Noodle Co"}},
+        ]
+        path = self.write("campaign.jsonl", "".join(json.dumps(r) + "\n" for r in records))
+        leads = collect_leads(path)
+        self.assertEqual(leads.to_dicts(), [
+            {"name": "Jane Doe", "source": "p1", "company": "Acme"},
+            {"name": "Bob Lee", "source": "p2", "company": "Noodle Co"},
+        ])
+        self.assertEqual(len(collect_leads(os.path.join(self.tmpdir.name, "missing.jsonl"))), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from checkpoint_store import CheckpointStore
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def setUp(self):
+        """Set up a store in a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "checkpoints.sqlite3")
+        self.now = 1000.0
+        self.store = CheckpointStore(self.path, clock=lambda: self.now)
+        self.state = {
+            "previous_step": "CONTACT_SEARCH",
+            "companies": [{"name": "A"}, {"name": "B"}],
+            "contacts": [{"name": "Jane Doe"}],
+            "num_processed_emails": 0,
+        }
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_only_changed_fields_are_written(self):
+        """A save after a small change rewrites just that field"""
+        self.assertEqual(self.store.save("s1", self.state), 4)
+        self.assertEqual(self.store.save("s1", self.state), 0)
+        self.state["num_processed_emails"] = 1
+        self.assertEqual(self.store.save("s1", self.state), 1)
+        self.assertEqual(self.store.load("s1")["num_processed_emails"], 1)
+        self.assertIsNone(self.store.load("missing"))
+
+    def test_state_survives_a_restart(self):
+        """A new store on the same file resumes the session and keeps diffing"""
+        self.store.save("s1", self.state)
+        restarted = CheckpointStore(self.path)
+        self.assertIn("s1", restarted)
+        self.assertEqual(restarted.load("s1"), self.state)
+        self.assertEqual(restarted.save("s1", self.state), 0)
+
+    def test_prune(self):
+        """Sessions not saved within the max age are deleted"""
+        self.store.save("old", self.state)
+        self.now += 100
+        self.store.save("new", self.state)
+        self.assertEqual(self.store.prune(max_age_seconds=50), 1)
+        self.assertNotIn("old", self.store)
+        self.assertIn("new", self.store)
+
+
+if __name__ == "__main__":
+    unittest.main()
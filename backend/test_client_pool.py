@@ -0,0 +1,74 @@
+import os
+import tempfile
+import threading
+import unittest
+import client_pool
+from client_pool import get_client, close_clients, load_prompt
+
+
+class FakeClient:
+    created = 0
+
+    def __init__(self):
+        FakeClient.created += 1
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestClientPool(unittest.TestCase):
+    def setUp(self):
+        FakeClient.created = 0
+        self.key = ("test-client", self.id())
+
+    def tearDown(self):
+        client_pool._clients.pop(self.key, None)
+
+    def test_client_is_created_once(self):
+        """Concurrent first uses share one client built by a single factory call"""
+        clients = []
+        threads = [threading.Thread(target=lambda: clients.append(get_client(self.key, FakeClient))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(FakeClient.created, 1)
+        self.assertTrue(all(client is clients[0] for client in clients))
+
+    def test_closed_clients_are_recreated(self):
+        """close_clients closes every pooled client; the next use builds a new one"""
+        saved = dict(client_pool._clients)
+        client_pool._clients.clear()
+        try:
+            first = get_client(self.key, FakeClient)
+            close_clients()
+            self.assertTrue(first.closed)
+            second = get_client(self.key, FakeClient)
+            self.assertIsNot(second, first)
+            self.assertEqual(FakeClient.created, 2)
+        finally:
+            client_pool._clients.clear()
+            client_pool._clients.update(saved)
+
+    def test_prompt_is_reread_when_it_changes(self):
+        """Prompts are served from memory until the file's mtime changes"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "prompt.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("first")
+            self.assertEqual(load_prompt(path), "first")
+
+            # Same mtime: the cached text is returned even though the file changed
+            mtime = os.path.getmtime(path)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("second")
+            os.utime(path, (mtime, mtime))
+            self.assertEqual(load_prompt(path), "first")
+
+            os.utime(path, (mtime + 10, mtime + 10))
+            self.assertEqual(load_prompt(path), "second")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from contact_parser import parse_scraped_contacts, extract_contacts, filter_contacts, parse_json_block
+
+HISTORY = (
+    "AgentHistoryList(all_results=[ActionResult(is_done=False, extracted_content='Found people:\\n"
+    "1. Jane Doe - Head of Sales at Acme Foods\\n   https://www.linkedin.com/in/jane-doe-1a/\\n"
+    "2. Bob Lee | VP Sales | Noodle Co', error=None), ActionResult(is_done=True, extracted_content="
+    "'[{\"name\": \"Ann Wu\", \"title\": \"Sales Manager\", \"company\": \"Dumpling AI\"}]', error=None)])"
+)
+
+
+class TestContactParser(unittest.TestCase):
+    def test_browser_history(self):
+        """Lines, URLs and JSON inside extracted_content are all picked up"""
+        result = parse_scraped_contacts(HISTORY)
+        self.assertEqual([c["name"] for c in result.contacts], ["Jane Doe", "Bob Lee", "Ann Wu"])
+        self.assertEqual(result.contacts[0]["profile_url"], "https://www.linkedin.com/in/jane-doe-1a/")
+        self.assertEqual(result.contacts[2]["role"], "Sales Manager")
+        self.assertGreater(result.confidence, 0.6)
+
+    def test_fenced_json_and_duplicates(self):
+        """JSON in markdown fences parses, and repeated profiles are merged"""
+        text = (
+            "```json\n["
+            '{"name": "Jane Doe", "role": "CEO", "linkedin_url": "https://linkedin.com/in/janedoe"},'
+            '{"name": "Jane Doe", "company": "HealthAI", "profile_url": "https://www.linkedin.com/in/janedoe/"}'
+            "]\n```"
+        )
+        self.assertEqual(parse_json_block(text)[0]["name"], "Jane Doe")
+        result = parse_scraped_contacts(text)
+        self.assertEqual(len(result.contacts), 1)
+        self.assertEqual(result.contacts[0]["company"], "HealthAI")
+        self.assertEqual(result.confidence, 1.0)
+
+    def test_unrecognized_text_has_no_confidence(self):
+        """Free text without contacts gives the LLM fallback a chance"""
+        result = parse_scraped_contacts("The LinkedIn page could not be loaded, please sign in.")
+        self.assertEqual(result.contacts, [])
+        self.assertEqual(result.confidence, 0.0)
+
+    def test_unparsed_mentions_lower_confidence(self):
+        """People mentioned in prose the parser cannot read send the scrape to the LLM"""
+        text = (
+            "Jane Doe - Head of Sales at Acme Foods\n"
+            "We also spoke with Mark Smith, who runs sales at Beta.\n"
+            "Lisa Chan leads marketing for Gamma Labs.\n"
+            "Tom Ray heads partnerships at Delta."
+        )
+        result = parse_scraped_contacts(text)
+        self.assertEqual([c["name"] for c in result.contacts], ["Jane Doe"])
+        self.assertLess(result.confidence, 0.6)
+
+    def test_filtering(self):
+        """Roles must match; industry and location only filter records that have them"""
+        contacts = [
+            {"name": "Jane Doe", "role": "Senior Sales Manager"},
+            {"name": "Bob Lee", "role": "Sales Engineer"},
+            {"name": "Ann Wu", "role": "Sales Manager", "location": "London"},
+            {"name": "Tim Ng", "role": "Head of Sales"},
+        ]
+        matched = filter_contacts(contacts, ["Sales Manager"], "Food Tech", "New York")
+        self.assertEqual([c["name"] for c in matched], ["Jane Doe"])
+        self.assertIn("justification", matched[0])
+        contacts, confidence = extract_contacts(HISTORY, ["Head of Sales", "Vice President of Sales"])
+        self.assertEqual([c["name"] for c in contacts], ["Jane Doe", "Bob Lee"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import time
+import threading
+import unittest
+from unittest import mock
+import email_drafting
+
+
+class FakeDrafts:
+    """Stands in for draft_email, recording the order and concurrency of drafts"""
+
+    def __init__(self, delay=0.05, failures=()):
+        self.delay = delay
+        self.failures = set(failures)
+        self.order = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, contact, user_data):
+        with self._lock:
+            self.order.append(contact["name"])
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delay)
+            if contact["name"] in self.failures:
+                raise RuntimeError("model error")
+            return {"subject": f"Hi {contact['name']}", "content": "..."}
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+class TestSubmitBatch(unittest.TestCase):
+    def test_one_future_per_contact(self):
+        """Drafts start in contact order, at most `concurrency` at once, each with its own future"""
+        fake = FakeDrafts(failures={"C3"})
+        contacts = [{"name": f"C{i}"} for i in range(8)]
+        with mock.patch.object(email_drafting, "draft_email", fake):
+            futures = email_drafting.submit_batch(contacts, {"first_name": "John"}, concurrency=2)
+            self.assertEqual(len(futures), 8)
+            self.assertEqual(futures[0].result(timeout=5)["subject"], "Hi C0")
+            # The first draft is ready well before the whole batch is
+            self.assertFalse(futures[-1].done())
+            drafts = [future.result(timeout=5) for future in futures]
+        self.assertEqual(fake.max_running, 2)
+        self.assertEqual(fake.order[:2], ["C0", "C1"])
+        self.assertIsNone(drafts[3])
+        self.assertEqual(drafts[7]["subject"], "Hi C7")
+
+    def test_cancelled_contacts_are_skipped(self):
+        """Cancelling the futures of contacts not yet started skips their drafts"""
+        fake = FakeDrafts(delay=0.1)
+        contacts = [{"name": f"C{i}"} for i in range(6)]
+        with mock.patch.object(email_drafting, "draft_email", fake):
+            futures = email_drafting.submit_batch(contacts, {}, concurrency=1)
+            for future in futures[2:]:
+                future.cancel()
+            futures[1].result(timeout=5)
+            time.sleep(0.2)
+        self.assertEqual(fake.order, ["C0", "C1"])
+        self.assertTrue(all(future.cancelled() for future in futures[2:]))
+
+
+if __name__ == "__main__":
+    unittest.main()
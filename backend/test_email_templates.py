@@ -0,0 +1,77 @@
+import os
+import time
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from result_cache import ResultCache
+from email_templates import TemplateDrafter, assemble_email, company_instructions, template_instructions
+
+SENDER = {"first_name": "John", "company": "Acme CRM", "context": "Sells CRM software to fintechs"}
+
+
+class FakeModel:
+    """Returns a canned piece for each kind of instructions and counts the calls"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = {"template": 0, "company": 0, "slots": 0}
+        self._lock = threading.Lock()
+
+    def __call__(self, instructions, payload):
+        time.sleep(self.delay)
+        if instructions is template_instructions:
+            kind, piece = "template", {"subject": "CRM for {company}", "pitch": "Our CRM saves time.",
+                                       "closing": "Free for a call?\nJohn"}
+        elif instructions is company_instructions:
+            kind, piece = "company", {"paragraph": f"{payload['company']} is growing fast."}
+        else:
+            kind, piece = "slots", {"opening": f"Congrats on leading {payload['recipient']['role']}."}
+        with self._lock:
+            self.calls[kind] += 1
+        return piece
+
+
+class TestEmailTemplates(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(path=os.path.join(self.tmpdir.name, "cache.sqlite3"))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_assembles_email_from_pieces(self):
+        """The subject placeholders are filled and the pieces joined in order"""
+        template = {"subject": "Hi {first_name} at {company}", "pitch": "Pitch.", "closing": "Bye"}
+        email = assemble_email(template, "Paragraph.", {"opening": "Opening."}, {"name": "Jane Doe", "company": "Stripe"})
+        self.assertEqual(email["subject"], "Hi Jane at Stripe")
+        self.assertEqual(email["content"], "Hi Jane,\n\nOpening.\n\nParagraph.\n\nPitch.\n\nBye")
+
+    def test_pieces_are_generated_once(self):
+        """Shared pieces are generated once per campaign and per company, even when drafted concurrently"""
+        model = FakeModel(delay=0.02)
+        drafter = TemplateDrafter(model, cache=self.cache)
+        contacts = [{"name": f"Person {i}", "role": f"Sales {i}", "company": f"Company {i % 2}"} for i in range(6)]
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            drafts = list(pool.map(lambda c: drafter.draft(c, SENDER), contacts))
+
+        self.assertEqual(model.calls, {"template": 1, "company": 2, "slots": 6})
+        self.assertEqual(drafts[3]["subject"], "CRM for Company 1")
+        self.assertIn("Congrats on leading Sales 3.\n\nCompany 1 is growing fast.", drafts[3]["content"])
+
+        # A redraft is served from the cache
+        self.assertEqual(drafter.draft(contacts[3], SENDER), drafts[3])
+        self.assertEqual(sum(model.calls.values()), 9)
+
+    def test_invalid_pieces_are_not_cached(self):
+        """A malformed piece raises and is generated again next time"""
+        responses = iter([{"subject": "Hi"}, {"subject": "Hi", "pitch": "P", "closing": "C"}])
+        drafter = TemplateDrafter(lambda instructions, payload: next(responses), cache=self.cache)
+        with self.assertRaises(ValueError):
+            drafter.template(SENDER)
+        self.assertEqual(drafter.template(SENDER)["pitch"], "P")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import json
+import unittest
+from json_stream import JsonResponseParser, JsonStreamError, parse_response
+
+
+def stream(text, chunk_chars):
+    """Feed `text` to a parser in chunks and return (parser, text deltas)"""
+    deltas = []
+    parser = JsonResponseParser(on_text=deltas.append)
+    for i in range(0, len(text), chunk_chars):
+        parser.feed(text[i:i + chunk_chars])
+    return parser, deltas
+
+
+class TestJsonStream(unittest.TestCase):
+    def test_text_is_emitted_as_it_streams(self):
+        """The text field arrives in order, decoded, before the object is complete"""
+        response = {
+            "text": 'Here are your companies:\n- "Acme" \u00e9t\u00e9 \U0001F680 C:\\path',
+            "step": "COMPANY_SEARCH",
+            "patch": [{"op": "add", "field": "companies", "value": {"name": "Acme", "text": "nested"}}],
+        }
+        raw = json.dumps(response)
+        for chunk_chars in (1, 3, 7, len(raw)):
+            parser, deltas = stream(raw, chunk_chars)
+            self.assertEqual("".join(deltas), response["text"])
+            self.assertEqual(parser.result(), response)
+        parser, deltas = stream(raw, 5)
+        self.assertGreater(len(deltas), 5)
+
+        # The text is complete before the patch has streamed in
+        parser = JsonResponseParser()
+        parser.feed(raw[:raw.index('"patch"')])
+        self.assertEqual(parser.text, response["text"])
+        self.assertFalse(parser.complete)
+
+    def test_recovers_fences_and_trailing_garbage(self):
+        """Markdown fences, prose around the object and trailing text are ignored"""
+        response = {"text": "Hi", "step": None, "patch": []}
+        for raw in (
+            "```json\n" + json.dumps(response) + "\n```",
+            "Sure! " + json.dumps(response) + " Let me know.",
+            json.dumps(response) + "}\n```",
+        ):
+            self.assertEqual(parse_response(raw), response)
+
+    def test_truncated_response(self):
+        """A cut-off text is kept, but a half-written patch is never applied"""
+        parser, deltas = stream('{"text": "Here is the dra', 4)
+        self.assertEqual(parser.result(), {"text": "Here is the dra"})
+        parser, _ = stream('{"text": "Done", "step": "CONTACT_SEARCH", "patch": [{"op": "add", "fi', 4)
+        self.assertEqual(parser.result(), {"text": "Done", "step": "CONTACT_SEARCH"})
+        with self.assertRaises(JsonStreamError):
+            parse_response("I could not do that")
+        with self.assertRaises(JsonStreamError):
+            parse_response('{"text": "a", "step": EMAIL}')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import numpy as np
+from lead_scoring import hashed_features, rank_contacts, score_contacts, similarities
+
+PROFILE = {
+    "target_roles": ["VP Sales", "Head of Sales"],
+    "target_industry": "Fintech",
+    "location": "New York City",
+    "context": "We sell payments software to fintech sales teams",
+}
+
+
+class TestLeadScoring(unittest.TestCase):
+    def test_similar_texts_score_higher(self):
+        """Synonyms and word order still match; unrelated text does not"""
+        features = hashed_features(["Vice President of Sales", "sales vp"])
+        self.assertAlmostEqual(float(np.linalg.norm(features[0])), 1.0, places=5)
+        scores = similarities(["Vice President, Sales", "Software Engineer", "Sales VP", ""], ["VP Sales"])
+        self.assertGreater(scores[0], 0.8)
+        self.assertLess(scores[1], 0.2)
+        self.assertGreater(scores[2], 0.8)
+        self.assertEqual(scores[3], 0.0)
+
+    def test_ranks_thresholds_and_caps(self):
+        """The best matches come first, weak ones are dropped and the list is capped"""
+        contacts = [
+            {"name": "Ann", "role": "Nurse", "company": "City Hospital", "location": "Boston"},
+            {"name": "Bob", "title": "Head of Sales", "company": "PayCo", "industry": "Fintech", "location": "NYC"},
+            {"name": "Cy", "role": "VP Sales", "company": "Shop", "industry": "Retail", "location": "London"},
+            {"name": "Di", "role": "Vice President of Sales", "company": "Ledger", "industry": "Fintech payments",
+             "location": "New York, NY"},
+        ]
+        scores = score_contacts(contacts, PROFILE)
+        self.assertEqual(scores.shape, (4,))
+        ranked = rank_contacts(contacts, PROFILE, min_score=0.3)
+        self.assertEqual([c["name"] for c in ranked][:2], ["Bob", "Di"])
+        self.assertNotIn("Ann", [c["name"] for c in ranked])
+        self.assertTrue(all("score" in c for c in ranked))
+        self.assertNotIn("score", contacts[1])
+        self.assertEqual(len(rank_contacts(contacts, PROFILE, min_score=0, max_contacts=2)), 2)
+
+        # Without targets there is nothing to rank against
+        self.assertEqual(rank_contacts(contacts, {"email_purpose": "demo"}), contacts)
+
+    def test_contacts_without_compared_fields_are_kept(self):
+        """Contacts with only a name, LinkedIn URL and email are not judged on fields they lack"""
+        contacts = [
+            {"Name": "Ann Lee", "LinkedIn": "https://linkedin.com/in/annlee", "Email": "ann@payco.com"},
+            {"Name": "Bob Roy", "LinkedIn": "https://linkedin.com/in/bobroy", "Email": "bob@shop.com"},
+            {"Name": "Cy Park", "Role": "Nurse", "Email": "cy@hospital.org"},
+            {"Name": "Di Chen", "Role": "VP Sales", "Email": "di@ledger.com"},
+        ]
+        scores = score_contacts(contacts, PROFILE)
+        self.assertTrue(np.isnan(scores[:2]).all())
+        ranked = rank_contacts(contacts, PROFILE, min_score=0.3)
+        self.assertEqual([c["Name"] for c in ranked], ["Di Chen", "Ann Lee", "Bob Roy"])
+        self.assertNotIn("score", ranked[1])
+        # A role alone is scored on the targets it can be compared with (roles and context)
+        self.assertGreater(ranked[0]["score"], 0.5)
+
+    def test_scores_thousands_of_contacts(self):
+        """A large list is scored in one pass, one score per contact"""
+        roles = ["Head of Sales", "Software Engineer", "CEO", "Nurse"]
+        contacts = [{"name": f"P{i}", "role": roles[i % 4], "company": f"Co {i}"} for i in range(4000)]
+        ranked = rank_contacts(contacts, PROFILE, max_contacts=100)
+        self.assertEqual(len(ranked), 100)
+        self.assertTrue(all(c["role"] == "Head of Sales" for c in ranked))
+
+
+if __name__ == "__main__":
+    unittest.main()
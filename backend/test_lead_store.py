@@ -0,0 +1,92 @@
+import os
+import sys
+import tempfile
+import unittest
+import importlib.util
+from lead_store import LeadStore
+
+
+def make_contacts(size):
+    return [
+        {
+            "name": f"Contact {i}",
+            "title": "Head of Sales" if i % 2 else "VP Marketing",
+            "company": f"Company {i % 10}",
+            "email": f"contact{i}@company{i % 10}.com",
+            "linkedin": f"https://www.linkedin.com/in/contact-{i}/",
+            "location": "New York",
+            **({"score": 0.5} if i % 3 == 0 else {}),
+            **({"justification": "Leads the sales team"} if i % 4 == 0 else {}),
+        }
+        for i in range(size)
+    ]
+
+
+class TestLeadStore(unittest.TestCase):
+    def test_round_trips_contacts(self):
+        """Contacts come back with canonical field names, their extra fields and scores"""
+        store = LeadStore(make_contacts(12))
+        self.assertEqual(len(store), 12)
+        self.assertEqual(len(store.company_names), 10)
+        first = store[0].to_dict()
+        self.assertEqual(first, {
+            "name": "Contact 0", "role": "VP Marketing", "email": "contact0@company0.com",
+            "profile_url": "https://www.linkedin.com/in/contact-0/", "location": "New York",
+            "company": "Company 0", "score": 0.5, "justification": "Leads the sales team",
+        })
+        self.assertEqual(store[1].role, "Head of Sales")
+        self.assertIsNone(store[1].score)
+        self.assertEqual(store[-1].get("justification", "none"), "none")
+        # Repeated values are stored once
+        self.assertIs(store[1].role, store[3].role)
+
+    def test_pages_are_views(self):
+        """A page reads the store's columns; nothing is copied"""
+        store = LeadStore(make_contacts(25))
+        page = store.page(2, 10)
+        self.assertEqual((page.start, page.stop, len(page)), (20, 25, 5))
+        self.assertEqual([lead.name for lead in page], [f"Contact {i}" for i in range(20, 25)])
+        self.assertEqual(page[0].company, "Company 0")
+        store.scores[21] = 0.75
+        self.assertEqual(page.scores[1], 0.75)
+        self.assertEqual(len(store.page(5, 10)), 0)
+
+    def test_uses_less_memory_than_dicts(self):
+        """Columns take a fraction of the memory of the equivalent list of dicts"""
+        contacts = make_contacts(2000)
+
+        def deep_size(value, seen):
+            if id(value) in seen:
+                return 0
+            seen.add(id(value))
+            size = sys.getsizeof(value)
+            if isinstance(value, dict):
+                size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in value.items())
+            elif isinstance(value, list):
+                size += sum(deep_size(v, seen) for v in value)
+            return size
+
+        store = LeadStore(contacts)
+        store_size = deep_size([store.columns, store.company_names, store.extras], set())
+        store_size += sys.getsizeof(store.company_ids) + sys.getsizeof(store.scores)
+        self.assertLess(store_size, deep_size(contacts, set()) * 0.7)
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet_and_arrow_export(self):
+        """Stores survive a round trip through Parquet and Arrow IPC files"""
+        store = LeadStore(make_contacts(30))
+        store.add({"name": "No Company"}, source="campaign-1")
+        table = store.to_arrow()
+        self.assertEqual(table.num_rows, 31)
+        self.assertEqual(table.column("company").type.value_type, "string")
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("leads.parquet", "leads.arrow"):
+                path = os.path.join(directory, name)
+                store.export(path)
+                loaded = LeadStore.read_parquet(path) if name.endswith(".parquet") else LeadStore.read_ipc(path)
+                self.assertEqual(loaded.to_dicts(), store.to_dicts())
+                self.assertEqual(loaded.company_names, store.company_names)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import json
+import tempfile
+import unittest
+import importlib.util
+from argparse import Namespace
+from load_test import percentile, summarize_latencies, free_port, start_server, wait_until_ready, run_load
+from benchmark import app_script
+
+
+class TestLoadTest(unittest.TestCase):
+    def test_percentiles(self):
+        """Percentiles interpolate between the closest ranks"""
+        values = [float(v) for v in range(1, 101)]
+        self.assertAlmostEqual(percentile(values, 50), 50.5)
+        self.assertAlmostEqual(percentile(values, 99), 99.01)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertIsNone(percentile([], 50))
+        summary = summarize_latencies([0.2, 0.1, 0.4, 0.3])
+        self.assertEqual((summary["count"], summary["max"]), (4, 0.4))
+        self.assertAlmostEqual(summary["p50"], 0.25)
+        self.assertEqual(summarize_latencies([]), {"count": 0})
+
+    @unittest.skipUnless(importlib.util.find_spec("socketio") and importlib.util.find_spec("agno"),
+                         "python-socketio or agno is not installed")
+    def test_replays_conversations_against_a_server(self):
+        """Every client completes every turn against a server with the fake model backend"""
+        args = Namespace(clients=2, ramp=0.0, delay=0.01, delay_per_token=0.0, timeout=30.0, transports="polling")
+        script = app_script(3, 1, 0.0)
+        with tempfile.TemporaryDirectory() as workdir:
+            script_path = os.path.join(workdir, "script.json")
+            with open(script_path, "w", encoding="utf-8") as f:
+                json.dump([response for _, response in script], f)
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            process, _ = start_server(port, script_path, args, workdir)
+            try:
+                wait_until_ready(url, process)
+                results = run_load(url, [text for text, _ in script], args)
+            finally:
+                process.terminate()
+                process.wait(timeout=10)
+
+        self.assertEqual(results["errors"], [])
+        self.assertEqual(results["completed_turns"], 2 * len(script))
+        self.assertEqual(results["latency"]["turn"]["count"], 2 * len(script))
+        self.assertEqual(results["latency"]["connect"]["count"], 2)
+        self.assertGreater(results["server_memory_bytes"]["peak"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
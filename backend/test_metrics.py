@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+from metrics import Registry, Histogram, span, timed, record_cache, SPAN_SECONDS, SPAN_TOKENS, SPAN_CACHE_HITS
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        """Observations land in every bucket at or above them, plus sum and count"""
+        registry = Registry()
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        histogram.observe(0.05, step="A")
+        histogram.observe(0.5, step="A")
+        text = registry.render()
+        self.assertIn("# TYPE latency_seconds histogram", text)
+        self.assertIn('latency_seconds_bucket{step="A",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{step="A",le="1.0"} 2', text)
+        self.assertIn('latency_seconds_bucket{step="A",le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count{step="A"} 2', text)
+        self.assertIsInstance(histogram, Histogram)
+
+    def test_nested_spans_roll_up(self):
+        """Tokens and cache hits of inner spans count for the enclosing span too"""
+        with span("turn", "test_rollup") as turn:
+            with span("model", "test_rollup_model") as model:
+                model.add_tokens(10, 5)
+            record_cache("test_rollup", hit=True)
+        self.assertEqual((turn.input_tokens, turn.output_tokens, turn.cache_hits), (10, 5, 1))
+        self.assertEqual(SPAN_TOKENS.value(kind="turn", name="test_rollup", direction="input"), 10)
+        self.assertEqual(SPAN_CACHE_HITS.value(kind="turn", name="test_rollup"), 1)
+
+    def test_timed_records_status(self):
+        """Decorated sync and async functions are timed, failures as errors"""
+        @timed("tool", "test_timed")
+        def failing():
+            raise RuntimeError("boom")
+
+        @timed("tool", "test_timed")
+        async def succeeding():
+            return 1
+
+        with self.assertRaises(RuntimeError):
+            failing()
+        self.assertEqual(asyncio.run(succeeding()), 1)
+        self.assertEqual(SPAN_SECONDS.count(kind="tool", name="test_timed", status="error"), 1)
+        self.assertEqual(SPAN_SECONDS.count(kind="tool", name="test_timed", status="ok"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
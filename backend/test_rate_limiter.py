@@ -0,0 +1,174 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from rate_limiter import ProviderLimiter, TokenBucket, LimitedModel, estimate_message_tokens, is_rate_limit_error, limit_agno_model
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class FakeClock:
+    """Clock advanced by the limiter's own sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+        await asyncio.sleep(0)
+
+
+class FlakyModel:
+    """Model whose first request of each kind is rate-limited; streams yield two chunks"""
+
+    def __init__(self):
+        self.requests = []
+        self.last_input_token_count = self.last_output_token_count = None
+
+    def _request(self, kind):
+        self.requests.append(kind)
+        if self.requests.count(kind) == 1:
+            raise RateLimitError("Too Many Requests")
+
+    def invoke(self, messages):
+        self._request("invoke")
+        return "reply"
+
+    async def ainvoke(self, messages):
+        self._request("ainvoke")
+        return "reply"
+
+    def invoke_stream(self, messages):
+        self._request("invoke_stream")
+        yield "Hello "
+        yield "there."
+
+    async def ainvoke_stream(self, messages):
+        self._request("ainvoke_stream")
+        yield "Hello "
+        yield "there."
+
+    def __call__(self, messages, stop_sequences=None):
+        self._request("call")
+        self.last_input_token_count, self.last_output_token_count = 300, 50
+        return "reply"
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def make_limiter(self, rpm=60, tpm=0, concurrency=4, retries=3):
+        return ProviderLimiter(
+            "test", rpm=rpm, tpm=tpm, max_concurrency=concurrency, max_retries=retries,
+            clock=self.clock, sleep=self.clock.sleep, async_sleep=self.clock.async_sleep,
+        )
+
+    def test_token_bucket_paces_requests(self):
+        """Once a minute's quota is spent, calls wait for the bucket to refill"""
+        limiter = self.make_limiter(rpm=60)
+        for _ in range(61):
+            limiter.call(lambda: None)
+        self.assertAlmostEqual(self.clock.now, 1.0, places=3)
+        bucket = TokenBucket(600, clock=self.clock)
+        bucket.consume(700)
+        self.assertAlmostEqual(bucket.wait_time(100), 20.0)
+
+    def test_retries_429_with_backoff_and_halves_concurrency(self):
+        """Rate-limited calls are retried and shrink the concurrency limit"""
+        limiter = self.make_limiter(concurrency=8)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimitError("Too Many Requests")
+            return "ok"
+
+        self.assertEqual(limiter.call(flaky), "ok")
+        self.assertEqual(len(attempts), 3)
+        self.assertLess(limiter.concurrency_limit, 3)
+        self.assertEqual(limiter.in_flight, 0)
+
+        with self.assertRaises(ValueError):
+            limiter.call(lambda: (_ for _ in ()).throw(ValueError("bad request")))
+        self.assertEqual(len(attempts), 3)
+
+    def test_retries_are_bounded(self):
+        """After max_retries the 429 is raised to the caller"""
+        limiter = self.make_limiter(retries=2)
+
+        async def always_limited():
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(limiter.acall(always_limited))
+        self.assertEqual(limiter.in_flight, 0)
+        self.assertTrue(is_rate_limit_error(RateLimitError()))
+        self.assertFalse(is_rate_limit_error(ValueError("invalid prompt")))
+
+    def test_concurrency_limit_adapts(self):
+        """Successes grow the limit back towards its maximum, never past it"""
+        limiter = self.make_limiter(rpm=0, concurrency=4)
+        limiter.concurrency_limit = 1.0
+        for _ in range(20):
+            limiter.call(lambda: None)
+        self.assertEqual(limiter.concurrency_limit, 4)
+
+        async def run():
+            peak = []
+
+            async def call():
+                peak.append(limiter.in_flight)
+                await asyncio.sleep(0)
+
+            await asyncio.gather(*(limiter.acall(call) for _ in range(10)))
+            return max(peak)
+
+        self.assertLessEqual(asyncio.run(run()), 4)
+
+
+    def test_agno_models_are_limited_per_request(self):
+        """Each model request is paced and retried on its own, streamed ones until their first chunk"""
+        limiter = self.make_limiter(rpm=60)
+        limiter.backoff = lambda attempt: 0.0
+        model = limit_agno_model(FlakyModel(), limiter)
+        messages = [SimpleNamespace(role="user", content="Find contacts")]
+        self.assertEqual(model.invoke(messages=messages), "reply")
+        self.assertEqual(asyncio.run(model.ainvoke(messages=messages)), "reply")
+        self.assertEqual(list(model.invoke_stream(messages=messages)), ["Hello ", "there."])
+
+        async def stream():
+            return [chunk async for chunk in model.ainvoke_stream(messages=messages)]
+
+        self.assertEqual(asyncio.run(stream()), ["Hello ", "there."])
+        self.assertEqual(model.requests, [kind for kind in ("invoke", "ainvoke", "invoke_stream", "ainvoke_stream")
+                                          for _ in range(2)])
+        # One request of the minute's quota per attempt
+        self.assertEqual(limiter.requests.level, 52)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_smolagents_models_charge_the_tokens_they_used(self):
+        """LimitedModel retries a request and charges its reported token counts to the budget"""
+        limiter = self.make_limiter(rpm=0, tpm=6000)
+        limiter.backoff = lambda attempt: 0.0
+        model = LimitedModel(FlakyModel(), limiter)
+        messages = [{"role": "user", "content": [{"type": "text", "text": "x" * 400}]}]
+        self.assertEqual(model(messages, stop_sequences=["<end_code>"]), "reply")
+        self.assertEqual(model.requests, ["call", "call"])
+        self.assertEqual(model.last_input_token_count, 300)
+        # Both attempts were charged the estimate, then the request what it really used
+        self.assertEqual(limiter.tokens.level, 6000 - estimate_message_tokens(messages) - 350)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import asyncio
+import tempfile
+import unittest
+from result_cache import ResultCache, MISSING, cached, normalize_query
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        """Set up a cache in a temporary directory"""
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.cache = ResultCache(
+            path=os.path.join(self.tmpdir.name, "cache.sqlite3"),
+            ttl_seconds=60,
+            max_entries=2,
+            clock=self.clock,
+        )
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_normalized_queries_share_entries(self):
+        """Case, whitespace and list order do not change the key"""
+        self.assertEqual(normalize_query("  Fintech   companies in NYC "), "fintech companies in nyc")
+        self.cache.set("companies", ["Bilt", "Republic"], ["a"])
+        self.assertEqual(self.cache.get("companies", ["republic", "bilt "]), ["a"])
+        self.assertIs(self.cache.get("contacts", ["republic", "bilt"]), MISSING)
+
+    def test_ttl_expiry(self):
+        """Entries expire after the TTL"""
+        self.cache.set("companies", "q", "result")
+        self.clock.now += 61
+        self.assertIs(self.cache.get("companies", "q"), MISSING)
+
+    def test_size_bounded_eviction(self):
+        """The least recently used entry is evicted past max_entries"""
+        self.cache.set("companies", "a", 1)
+        self.clock.now += 1
+        self.cache.set("companies", "b", 2)
+        self.clock.now += 1
+        self.cache.get("companies", "a")
+        self.clock.now += 1
+        self.cache.set("companies", "c", 3)
+        self.assertEqual(self.cache.get("companies", "a"), 1)
+        self.assertIs(self.cache.get("companies", "b"), MISSING)
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+    def test_cached_decorator_counts_hits_and_misses(self):
+        """Sync and async functions are only called on a miss"""
+        calls = []
+
+        @cached("companies", cache=self.cache)
+        def search(query):
+            calls.append(query)
+            return [query]
+
+        @cached("linkedin", cache=self.cache)
+        async def scrape(query):
+            calls.append(query)
+            return query.upper()
+
+        self.assertEqual(search("Fintech NYC"), ["Fintech NYC"])
+        self.assertEqual(search("fintech  nyc"), ["Fintech NYC"])
+        self.assertEqual(asyncio.run(scrape("ceo")), "CEO")
+        self.assertEqual(asyncio.run(scrape("CEO")), "CEO")
+        self.assertEqual(calls, ["Fintech NYC", "ceo"])
+        stats = self.cache.stats()
+        self.assertEqual(stats["namespaces"]["companies"], {"hits": 1, "misses": 1})
+        self.assertEqual(stats["namespaces"]["linkedin"], {"hits": 1, "misses": 1})
+
+    def test_cached_decorator_encode_decode(self):
+        """Results are stored encoded and come back decoded on a hit"""
+        @cached("records", cache=self.cache, encode=lambda s: sorted(s), decode=set)
+        def lookup(query):
+            return {query, "extra"}
+
+        self.assertEqual(lookup("a"), {"a", "extra"})
+        self.assertEqual(self.cache.get("records", "a"), ["a", "extra"])
+        self.assertEqual(lookup("a"), {"a", "extra"})
+
+    def test_cached_decorator_skips_failed_results(self):
+        """Results rejected by should_cache are returned but not stored"""
+        calls = []
+
+        @cached("linkedin", cache=self.cache, should_cache=lambda result: not result["errors"])
+        async def scrape(query):
+            calls.append(query)
+            return {"content": [], "errors": ["timeout"]} if len(calls) == 1 else {"content": ["ok"], "errors": []}
+
+        self.assertEqual(asyncio.run(scrape("ceo"))["errors"], ["timeout"])
+        self.assertIs(self.cache.get("linkedin", "ceo"), MISSING)
+        self.assertEqual(asyncio.run(scrape("ceo"))["content"], ["ok"])
+        self.assertEqual(asyncio.run(scrape("ceo"))["content"], ["ok"])
+        self.assertEqual(calls, ["ceo", "ceo"])
+
+
+if __name__ == "__main__":
+    unittest.main()
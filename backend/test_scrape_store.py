@@ -0,0 +1,33 @@
+import unittest
+from scrape_store import ScrapeStore, iter_chunks
+
+
+class TestScrapeStore(unittest.TestCase):
+    def test_least_recently_used_results_are_evicted(self):
+        """The store stays within its entry and character limits"""
+        store = ScrapeStore(max_entries=2, max_chars=100)
+        first = store.put("a" * 10)
+        second = store.put("b" * 10)
+        store.get(first)
+        third = store.put("c" * 10)
+        self.assertIsNone(store.get(second))
+        self.assertEqual(store.get(first), "a" * 10)
+        store.put("d" * 95)
+        self.assertEqual(len(store), 1)
+        self.assertIsNone(store.get(third))
+
+    def test_chunks_overlap_and_cover_the_text(self):
+        """Every line appears whole in some chunk, and chunks respect the size limit"""
+        lines = [f"{i}. Person {i} - Head of Sales at Company {i}\n" for i in range(200)]
+        text = "".join(lines)
+        chunks = list(iter_chunks(text, chunk_chars=500, overlap=100))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 500 for chunk in chunks))
+        for line in lines:
+            self.assertTrue(any(line in chunk for chunk in chunks), line)
+        self.assertTrue(chunks[0].endswith("\n"))
+        self.assertEqual(list(iter_chunks("short", chunk_chars=500, overlap=100)), ["short"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+from session_registry import SessionRegistry
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestSessionRegistry(unittest.TestCase):
+    def setUp(self):
+        """Set up a registry with a controllable clock"""
+        self.clock = FakeClock()
+        self.evicted = []
+        self.registry = SessionRegistry(
+            max_sessions=3,
+            ttl_seconds=60,
+            max_memory_bytes=100,
+            size_of=lambda agent: agent["size"],
+            on_evict=lambda key, agent: self.evicted.append(key),
+            clock=self.clock,
+        )
+
+    def test_sessions_are_isolated(self):
+        """Each key gets its own agent"""
+        self.registry.create("a", {"size": 1})
+        self.registry.create("b", {"size": 2})
+        self.assertEqual(self.registry.get("a"), {"size": 1})
+        self.assertEqual(self.registry.get("b"), {"size": 2})
+        self.assertIsNone(self.registry.get("c"))
+
+    def test_lru_eviction_on_capacity(self):
+        """The least recently used session is evicted when over capacity"""
+        for key in ["a", "b", "c"]:
+            self.registry.create(key, {"size": 1})
+        self.registry.get("a")
+        self.registry.create("d", {"size": 1})
+        self.assertEqual(self.evicted, ["b"])
+        self.assertIn("a", self.registry)
+        self.assertEqual(len(self.registry), 3)
+
+    def test_ttl_eviction(self):
+        """Idle sessions expire after the TTL"""
+        self.registry.create("a", {"size": 1})
+        self.clock.now = 30
+        self.registry.create("b", {"size": 1})
+        self.clock.now = 61
+        self.assertIsNone(self.registry.get("a"))
+        self.assertIsNotNone(self.registry.get("b"))
+        self.assertEqual(self.registry.stats()["evictions"]["ttl"], 1)
+
+    def test_memory_cap(self):
+        """Sessions are evicted oldest first once the memory cap is exceeded"""
+        agent = {"size": 10}
+        self.registry.create("a", {"size": 40})
+        self.registry.create("b", agent)
+        agent["size"] = 70
+        self.registry.refresh("b")
+        self.assertEqual(self.evicted, ["a"])
+        stats = self.registry.stats()
+        self.assertEqual(stats["memory_bytes"], 70)
+        self.assertEqual(stats["sessions"][0]["turns"], 1)
+
+    def test_pinned_sessions_are_not_evicted(self):
+        """A pinned session outlives the TTL and capacity limits until it is unpinned"""
+        self.registry.create("a", {"size": 1}, pin=True)
+        self.assertEqual(self.registry.pin("a"), {"size": 1})
+        for key in ["b", "c", "d"]:
+            self.registry.create(key, {"size": 1})
+        self.assertEqual(self.evicted, ["b"])
+        self.clock.now = 61
+        self.registry.evict_expired()
+        self.assertEqual(self.evicted, ["b", "c", "d"])
+        self.assertTrue(self.registry.stats()["sessions"][0]["pinned"])
+
+        self.registry.unpin("a")
+        self.registry.unpin("a")
+        self.clock.now = 122
+        self.assertIsNone(self.registry.get("a"))
+        self.assertIsNone(self.registry.pin("a"))
+
+    def test_pinned_sessions_are_kept_unless_replaced_explicitly(self):
+        """create(replace_pinned=False) leaves a pinned session in place"""
+        first = self.registry.create("a", {"size": 1}, pin=True)
+        self.assertIsNone(self.registry.create("a", {"size": 2}, replace_pinned=False))
+        self.assertIs(self.registry.get("a"), first)
+        self.registry.unpin("a")
+        self.assertEqual(self.registry.create("a", {"size": 2}, replace_pinned=False), {"size": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
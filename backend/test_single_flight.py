@@ -0,0 +1,91 @@
+import time
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from single_flight import SingleFlight, SINGLE_FLIGHT_CALLS, canonicalize_query, coalesce
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_equivalent_queries_share_a_key(self):
+        """Case, spacing, punctuation, articles and synonyms do not change the key"""
+        self.assertEqual(canonicalize_query("VP Sales in NYC"), canonicalize_query("vice  president, sales in the New York City"))
+        self.assertEqual(canonicalize_query("Heads of Sales"), canonicalize_query("head sales"))
+        self.assertEqual(canonicalize_query(["Stripe", "Acme Corp"]), canonicalize_query(["acme corp", "STRIPE"]))
+        self.assertNotEqual(canonicalize_query("VP Sales in NYC"), canonicalize_query("VP Marketing in NYC"))
+
+    def test_distinct_queries_keep_distinct_keys(self):
+        """Reordering words that change the meaning gives a different key"""
+        self.assertNotEqual(canonicalize_query("VP Sales and Director of Marketing at Stripe"),
+                            canonicalize_query("VP Marketing and Director of Sales at Stripe"))
+        self.assertNotEqual(canonicalize_query("engineers who left Google for Meta"),
+                            canonicalize_query("engineers who left Meta for Google"))
+        self.assertNotEqual(canonicalize_query(["VP Sales", "Director Marketing"]),
+                            canonicalize_query(["VP Marketing", "Director Sales"]))
+
+    def test_ambiguous_words_are_not_folded(self):
+        """Prepositions and short words with several meanings keep queries apart"""
+        pairs = [
+            ("engineers hiring from Google", "engineers hiring at Google"),
+            ("agencies that sell to us", "agencies that sell to usa"),
+            ("LA fitness managers", "Los Angeles fitness managers"),
+            ("BD managers", "business development managers"),
+            ("sales leads at fintechs", "sales lead at fintechs"),
+            ("recruiters in SF", "recruiters in San Francisco"),
+        ]
+        for first, second in pairs:
+            self.assertNotEqual(canonicalize_query(first), canonicalize_query(second), (first, second))
+
+    def test_concurrent_threads_share_one_call(self):
+        """Callers arriving while a call is in flight get its result without running it again"""
+        flight = SingleFlight("test_threads")
+        calls = []
+        release = threading.Event()
+
+        def search(query):
+            calls.append(query)
+            release.wait(5)
+            return f"results for {query}"
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(flight.do, "vp sales", search, "VP Sales") for _ in range(4)]
+            while SINGLE_FLIGHT_CALLS.value(name="test_threads", result="coalesced") < 3:
+                time.sleep(0.01)
+            release.set()
+            results = [f.result() for f in futures]
+
+        self.assertEqual(calls, ["VP Sales"])
+        self.assertEqual(results, ["results for VP Sales"] * 4)
+        self.assertEqual(SINGLE_FLIGHT_CALLS.value(name="test_threads", result="leader"), 1)
+
+        # Once it finished, the next call runs again
+        release.set()
+        flight.do("vp sales", search, "VP Sales")
+        self.assertEqual(len(calls), 2)
+
+    def test_async_callers_share_result_and_errors(self):
+        """Coroutine callers are coalesced too, and a failure reaches every waiter"""
+        calls = []
+
+        @coalesce("test_async")
+        async def scrape(query):
+            calls.append(query)
+            await asyncio.sleep(0.01)
+            if "fail" in query:
+                raise RuntimeError("scrape failed")
+            return query.upper()
+
+        async def run():
+            results = await asyncio.gather(scrape("VP Sales NYC"), scrape("vp, sales new york city"), scrape("vp sales nyc"))
+            errors = await asyncio.gather(scrape("fail now"), scrape("Fail, now!"), return_exceptions=True)
+            return results, errors
+
+        results, errors = asyncio.run(run())
+        self.assertEqual(results, ["VP SALES NYC"] * 3)
+        self.assertTrue(all(isinstance(e, RuntimeError) for e in errors))
+        self.assertEqual(calls, ["VP Sales NYC", "fail now"])
+        self.assertEqual(SINGLE_FLIGHT_CALLS.value(name="test_async", result="coalesced"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
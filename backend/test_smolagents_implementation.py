@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import inspect
+import threading
+import unittest
+from unittest import mock
+from smolagents.models import ChatMessage
+import smolagents_implementation as search
+from metrics import span
+from rate_limiter import LimitedModel, ProviderLimiter
+
+
+class FakeSearch:
+    """Stands in for _search_contacts: one contact per company, with per-company delays and failures"""
+
+    def __init__(self, delays=None, failures=()):
+        self.delays = delays or {}
+        self.failures = set(failures)
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, batch):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(max(self.delays.get(company, 0.02) for company in batch))
+            if self.failures & set(batch):
+                raise RuntimeError("search failed")
+            return json.dumps([{"name": f"Head of Sales at {company}", "company": company} for company in batch])
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+class FakeSearchModel:
+    """smolagents model that answers every task with one contact, reporting its token counts"""
+
+    def __init__(self):
+        self.last_input_token_count = self.last_output_token_count = 0
+
+    def __call__(self, messages, stop_sequences=None, **kwargs):
+        self.last_input_token_count, self.last_output_token_count = 120, 30
+        code = 'final_answer(\'[{"name": "Jane Doe", "company": "Acme"}]\')'
+        return ChatMessage(role="assistant", content=f"Thought: done\nCode:\n```py\n{code}\n```<end_code>")
+
+
+class TestContactFanout(unittest.TestCase):
+    def test_searches_companies_with_bounded_concurrency(self):
+        """Each company is searched on its own, at most `concurrency` at once, results in order"""
+        fake = FakeSearch()
+        companies = [f"Company {i}" for i in range(10)]
+        with mock.patch.object(search, "_search_contacts", fake):
+            results = search.find_contacts_by_company(companies, concurrency=3, timeout=5)
+        self.assertEqual(fake.max_running, 3)
+        self.assertEqual([r[0]["company"] for r in results], companies)
+
+    def test_failed_and_slow_searches_are_dropped(self):
+        """A failed or timed-out company gives None without holding up the others"""
+        fake = FakeSearch(delays={"Slow": 2.0}, failures={"Broken"})
+        start = time.monotonic()
+        with mock.patch.object(search, "_search_contacts", fake):
+            results = search.find_contacts_by_company(["Slow", "Broken", "Fine"], concurrency=3, timeout=0.3)
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertIsNone(results[0])
+        self.assertIsNone(results[1])
+        self.assertEqual(results[2][0]["company"], "Fine")
+
+    def test_searches_waiting_for_a_worker_time_out(self):
+        """The timeout runs from submission, so a batch stuck behind a full pool is cancelled"""
+        pool = search.ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(pool.shutdown)
+        pool.submit(time.sleep, 1.0)
+        fake = FakeSearch()
+        start = time.monotonic()
+        with mock.patch.object(search, "search_workers", pool), mock.patch.object(search, "_search_contacts", fake):
+            self.assertEqual(search.find_contacts_by_company(["Acme"], timeout=0.2), [None])
+            self.assertLess(time.monotonic() - start, 0.8)
+            time.sleep(1.0)
+        self.assertEqual(fake.max_running, 0)
+
+    def test_running_search_stops_at_its_deadline(self):
+        """A search agent still running when its batch times out is interrupted after its current step"""
+        agent = mock.Mock()
+        search._search_deadline.at = time.monotonic() + 60
+        self.addCleanup(setattr, search._search_deadline, "at", None)
+        search._stop_after_deadline(None, agent)
+        agent.interrupt.assert_not_called()
+        search._search_deadline.at = time.monotonic() - 1
+        search._stop_after_deadline(None, agent)
+        agent.interrupt.assert_called_once()
+
+    def test_tool_returns_the_same_shape_with_or_without_fanout(self):
+        """contact_finder_tool returns a JSON list of contacts whether or not it fanned out"""
+        def fake(batch):
+            # Agents return Python lists as often as JSON text
+            return [{"name": f"Head of Sales at {company}", "company": company} for company in batch]
+
+        with mock.patch.object(search, "_search_contacts", fake), \
+                mock.patch.object(search, "CONTACT_FINDER_BATCH_SIZE", 1):
+            fanned_out = json.loads(search.contact_finder_tool(["Acme", "Initech"]))
+            with mock.patch.object(search, "CONTACT_FINDER_FANOUT", False):
+                single = json.loads(search.contact_finder_tool(["Acme", "Initech"]))
+        self.assertEqual(single, fanned_out)
+        self.assertEqual([c["company"] for c in single], ["Acme", "Initech"])
+
+    def test_fanout_merges_and_dedupes(self):
+        """Batches are merged into one list without repeated contacts"""
+        def fake(batch):
+            return json.dumps([{"name": "Jane Doe", "email": "jane@acme.com"}] + [{"name": c} for c in batch])
+
+        with mock.patch.object(search, "_search_contacts", fake):
+            contacts = search.find_contacts_fanout(["A", "B", "C"], batch_size=2, concurrency=2, timeout=5)
+        self.assertEqual([c["name"] for c in contacts], ["Jane Doe", "A", "B", "C"])
+
+    def test_each_thread_has_its_own_model(self):
+        """Search models are reused within a thread but never shared between threads"""
+        with mock.patch.dict(os.environ, {"OPENAI_API_KEY": "test"}):
+            models = []
+            model = search.get_search_model()
+            self.assertIs(search.get_search_model(), model)
+            thread = threading.Thread(target=lambda: models.append(search.get_search_model()))
+            thread.start()
+            thread.join()
+        self.assertIsNot(models[0], model)
+
+    def test_search_tokens_reach_the_calling_span(self):
+        """Model tokens are recorded on the search's span and roll up into the caller's, across threads"""
+        model = LimitedModel(FakeSearchModel(), ProviderLimiter("test", rpm=0, tpm=0, max_concurrency=4))
+        with mock.patch.object(search, "get_search_model", lambda: model), \
+                mock.patch.object(search, "_search_contacts", inspect.unwrap(search._search_contacts)):
+            with span("tool", "contact_finder_tool") as tool_span:
+                results = search.run_batches([["Acme"]], concurrency=1, timeout=30)
+        self.assertEqual(search.parse_contacts(results[0]), [{"name": "Jane Doe", "company": "Acme"}])
+        self.assertEqual((tool_span.input_tokens, tool_span.output_tokens), (120, 30))
+
+
+if __name__ == "__main__":
+    unittest.main()
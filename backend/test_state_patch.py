@@ -0,0 +1,58 @@
+import unittest
+from state_patch import apply_patch, PatchError
+
+
+class TestStatePatch(unittest.TestCase):
+    def setUp(self):
+        """Set up a workflow state"""
+        self.state = {
+            "user_data": {"first_name": "John", "context": ""},
+            "companies": [{"name": "A"}, {"name": "B"}, {"name": "C"}],
+            "contacts": [],
+            "current_email": {},
+            "num_processed_emails": 0,
+        }
+
+    def test_ids_refer_to_original_list(self):
+        """Removes and updates in one patch do not shift each other's ids"""
+        new_state = apply_patch(self.state, [
+            {"op": "remove", "field": "companies", "id": 0},
+            {"op": "update", "field": "companies", "id": 2, "value": {"reason": "fit"}},
+            {"op": "remove", "field": "companies", "id": 1},
+            {"op": "add", "field": "companies", "value": [{"name": "D"}]},
+        ])
+        self.assertEqual(new_state["companies"], [{"name": "C", "reason": "fit"}, {"name": "D"}])
+        self.assertEqual(len(self.state["companies"]), 3)
+
+    def test_dict_and_value_fields(self):
+        """Dict fields merge on update, values are replaced on set"""
+        new_state = apply_patch(self.state, [
+            {"op": "update", "field": "user_data", "value": {"context": "Selling CRMs"}},
+            {"op": "set", "field": "current_email", "value": {"subject": "Hi", "content": "..."}},
+            {"op": "set", "field": "num_processed_emails", "value": 1},
+        ])
+        self.assertEqual(new_state["user_data"], {"first_name": "John", "context": "Selling CRMs"})
+        self.assertEqual(new_state["current_email"]["subject"], "Hi")
+        self.assertEqual(new_state["num_processed_emails"], 1)
+        self.assertEqual(apply_patch(self.state, []), self.state)
+
+    def test_invalid_patches_are_rejected(self):
+        """Malformed operations raise PatchError and leave the state untouched"""
+        invalid = [
+            {"op": "remove", "field": "companies", "id": 3},
+            {"op": "add", "field": "user_data", "value": {}},
+            {"op": "update", "field": "num_processed_emails", "value": 2},
+            {"op": "set", "field": "num_processed_emails", "value": -1},
+            {"op": "drop", "field": "companies"},
+            {"op": "set", "field": "secrets", "value": 1},
+        ]
+        for op in invalid:
+            with self.assertRaises(PatchError):
+                apply_patch(self.state, [{"op": "remove", "field": "companies", "id": 0}, op])
+        with self.assertRaises(PatchError):
+            apply_patch(self.state, {"op": "set"})
+        self.assertEqual(len(self.state["companies"]), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
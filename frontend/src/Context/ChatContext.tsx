@@ -26,6 +26,13 @@ interface ChatMessage {
   role: string;
   message: string;
   timestamp: Timestamp;
+  // The agent's reply while it streams in; replaced by the final message
+  streaming?: boolean;
+}
+
+interface AgentSession {
+  session_id: string;
+  session_token: string;
 }
 
 interface ChatContextType {
@@ -45,11 +52,53 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
   const [chatLog, setChatLog] = useState<ChatMessage[]>([]);
   const [socket, setSocket] = useState<Socket | null>(null);
   const userRef = useRef(user);
+  const userInfoRef = useRef(userInfo);
+  // Set when the user starts the agent, so only that initialization is announced in the chat
+  const announceInitRef = useRef(false);
 
   useEffect(() => {
     userRef.current = user;
   }, [user]);
 
+  useEffect(() => {
+    userInfoRef.current = userInfo;
+  }, [userInfo]);
+
+  // The agent session issued to this user, kept so it can be resumed after a reconnect or reload
+  const sessionKey = () => `agentSession:${userRef.current?.uid}`;
+
+  const loadSession = (): AgentSession | null => {
+    const saved = localStorage.getItem(sessionKey());
+    return saved ? JSON.parse(saved) : null;
+  };
+
+  // Starts a new agent session, or with `resume` rejoins the saved one (if any)
+  const initializeAgent = (target: Socket | null, resume = false) => {
+    const session = resume ? loadSession() : null;
+    if (resume && !session) return;
+    target?.emit("initialize_agent", {
+      basic_info: userInfoRef.current,
+      ...(session ?? {}),
+    });
+  };
+
+  const appendReplyDelta = (text: string) => {
+    setChatLog((chats) => {
+      const last = chats[chats.length - 1];
+      if (last?.streaming) {
+        return [...chats.slice(0, -1), { ...last, message: last.message + text }];
+      }
+      return [
+        ...chats,
+        { role: "agent", message: text, timestamp: Timestamp.now(), streaming: true },
+      ];
+    });
+  };
+
+  const dropStreamingReply = () => {
+    setChatLog((chats) => chats.filter((chat) => !chat.streaming));
+  };
+
   useEffect(() => {
     const initClient = () => {
       gapi.client
@@ -148,7 +197,8 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
       setChatLog((chats) => [...chats, newMessage]);
 
       if (message === "start") {
-        socket?.emit("initialize_agent", userInfo);
+        announceInitRef.current = true;
+        initializeAgent(socket);
       } else {
         socket?.emit("user_input", { text: message, approved: false });
       }
@@ -161,14 +211,32 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
 
     newSocket.on("connect", () => {
       console.log("Connected to server");
+      // A new connection has no agent until its session is resumed
+      if (userRef.current) {
+        initializeAgent(newSocket, true);
+      }
+    });
+
+    newSocket.on("agent_initialized", (data) => {
+      localStorage.setItem(
+        sessionKey(),
+        JSON.stringify({ session_id: data.session_id, session_token: data.session_token })
+      );
+      if (announceInitRef.current) {
+        announceInitRef.current = false;
+        sendChat("We have recieved your information. You may continue.", true);
+      }
+      console.log(data.resumed ? "Agent session resumed" : "Agent initialized");
     });
 
-    newSocket.on("agent_initialized", () => {
-      sendChat("We have recieved your information. You may continue.", true);
-      console.log("Agent initialized");
+    newSocket.on("agent_progress", (event) => {
+      if (event.event === "text_delta") {
+        appendReplyDelta(event.text);
+      }
     });
 
     newSocket.on("agent_output", (message) => {
+      dropStreamingReply();
       sendChat(message, true);
       console.log("Received from server:", JSON.stringify(message.data));
     });
@@ -179,7 +247,12 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
     });
 
     newSocket.on("error", (message) => {
-      console.log("error:", message.data);
+      dropStreamingReply();
+      // A session saved by another browser or a wiped server cannot be resumed; start a new one
+      if (message.message?.includes("belongs to another client")) {
+        localStorage.removeItem(sessionKey());
+      }
+      console.log("error:", message.message);
     });
 
     newSocket.on("disconnect", () => {
@@ -198,6 +271,12 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ children }) => {
     }
   }, [user]);
 
+  useEffect(() => {
+    if (user && socket?.connected) {
+      initializeAgent(socket, true);
+    }
+  }, [user, socket]);
+
   return (
     <ChatContext.Provider value={{ chatLog, getChat, sendChat }}>
       {children}
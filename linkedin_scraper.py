@@ -2,29 +2,117 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from browser_use import Agent
 from dotenv import load_dotenv
 import os
+import re
+import time
 import asyncio
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+from backend.result_cache import cached
+from backend.browser_pool import get_browser_pool
+from backend.single_flight import coalesce, canonicalize_query
 
 # Read GOOGLE_API_KEY into env
 load_dotenv()
 
+# Site the scraper starts from; tests point this at a local static-HTML stand-in
+LINKEDIN_BASE_URL = os.getenv('LINKEDIN_BASE_URL', 'https://www.linkedin.com')
+
+# When SCRAPER_DEBUG is set, the full browser_use history of each scrape is saved
+# as JSON under SCRAPER_DEBUG_DIR
+SCRAPER_DEBUG = os.getenv('SCRAPER_DEBUG', '') not in ('', '0')
+SCRAPER_DEBUG_DIR = os.getenv('SCRAPER_DEBUG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scrape_history'))
+
 # Initialize the model (consider initializing once in the main agent)
 llm = ChatGoogleGenerativeAI(model='gemini-2.0-flash-exp', api_key=os.getenv('GEMINI_API_KEY'))
 
-async def scrape_linkedin(query: str) -> str:
+@dataclass
+class ScrapeResult:
+    """What a scrape found, without the browser_use step history"""
+    query: str
+    content: List[str] = field(default_factory=list)
+    final_result: Optional[str] = None
+    urls: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    is_done: bool = False
+    history_path: Optional[str] = None
+
+    @classmethod
+    def from_history(cls, query, history, history_path=None):
+        """Build a result from a browser_use AgentHistoryList"""
+        final_result = history.final_result()
+        content = []
+        for text in history.extracted_content():
+            if text and text not in content:
+                content.append(text)
+        return cls(
+            query=query,
+            content=content,
+            final_result=final_result,
+            urls=[url for url in dict.fromkeys(history.urls()) if url],
+            errors=[error for error in history.errors() if error],
+            is_done=history.is_done(),
+            history_path=history_path,
+        )
+
+    @property
+    def failed(self):
+        """True when the scrape extracted nothing and ended with errors or without finishing"""
+        return not self.content and not self.final_result and (bool(self.errors) or not self.is_done)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def text(self):
+        """The extracted content as one string, final result first"""
+        parts = [self.final_result] if self.final_result else []
+        parts.extend(text for text in self.content if text != self.final_result)
+        return "\n\n".join(parts)
+
+    def __str__(self):
+        return self.text()
+
+def save_history(query, history):
+    """Save the full run history for debugging and return its path"""
+    os.makedirs(SCRAPER_DEBUG_DIR, exist_ok=True)
+    slug = re.sub(r'[^a-z0-9]+', '-', query.lower()).strip('-')[:60]
+    path = os.path.join(SCRAPER_DEBUG_DIR, f"{int(time.time())}-{slug}.json")
+    history.save_to_file(path)
+    return path
+
+@coalesce("linkedin")
+@cached("linkedin_results", encode=ScrapeResult.to_dict, decode=ScrapeResult.from_dict, key=canonicalize_query,
+        should_cache=lambda result: not result.failed)
+async def scrape_linkedin(query: str) -> ScrapeResult:
     """
     Uses browser_use.Agent to scrape LinkedIn based on the provided query.
-    Returns the result as a string.
+    Returns the extracted content as a ScrapeResult; str() of it gives the text.
+    Equivalent queries share cached results, and concurrent ones share one scrape;
+    failed scrapes are not cached, so the next call tries again.
     """
     print(f"Starting LinkedIn scrape for query: {query}")
     # The task needs to be specific enough for the browser_use agent
-    task = f"Find information on LinkedIn related to: {query}. Extract relevant details like names, roles, companies, and profile links if possible."
-    agent = Agent(
-        task=task,
-        llm=llm
+    task = f"Find information on LinkedIn ({LINKEDIN_BASE_URL}) related to: {query}. Extract relevant details like names, roles, companies, and profile links if possible."
+    # Browser contexts are borrowed from a warm pool instead of launching a browser per query
+    async with get_browser_pool().session() as browser_context:
+        agent = Agent(
+            task=task,
+            llm=llm,
+            browser=browser_context.browser,
+            browser_context=browser_context,
+            initial_actions=[{'go_to_url': {'url': LINKEDIN_BASE_URL}}],
+        )
+        history = await agent.run()
+    history_path = save_history(query, history) if SCRAPER_DEBUG else None
+    result = ScrapeResult.from_history(query, history, history_path)
+    print(
+        f"LinkedIn scrape completed: {len(result.content)} extracted items, "
+        f"{len(result.text())} characters, {len(result.errors)} errors"
     )
-    result = await agent.run()
-    print(f"LinkedIn scrape completed. Result: {result}")
-    return str(result) # Ensure result is string
+    return result
 
 # Example usage (optional, for testing)
 async def main():
@@ -9,18 +9,56 @@ import json
 from dotenv import load_dotenv
 from linkedin_scraper import scrape_linkedin
 from backend.model import User # Keep User model for context
+from backend.client_pool import get_client
+from backend.metrics import span, timed
+from backend.contact_parser import extract_contacts, parse_json_block, dedupe_contacts
+from backend.scrape_store import get_store, iter_chunks
+from backend.browser_pool import close_browser_pool
+from backend.rate_limiter import get_limiter, estimate_tokens, limit_agno_model
+from backend.lead_scoring import rank_contacts
+from backend.email_templates import TemplateDrafter
 from typing import List, Dict, Any
 
 load_dotenv()
 
+# Model used by the tools that call an LLM directly
+TOOL_MODEL_ID = 'gemini-2.0-flash-exp'
+
+def get_tool_llm():
+    """Shared Gemini client for tool calls, so connections are reused across calls"""
+    return get_client(
+        ('gemini', TOOL_MODEL_ID),
+        lambda: Gemini(id=TOOL_MODEL_ID, api_key=os.getenv('GEMINI_API_KEY')),
+    )
+
+# Scrapes the local parser reads with at least this confidence skip the organizer LLM
+CONTACT_PARSER_MIN_CONFIDENCE = float(os.getenv('CONTACT_PARSER_MIN_CONFIDENCE', '0.6'))
+
+# Scrape results are kept server-side; the model sees a preview of this many characters
+SCRAPE_PREVIEW_CHARS = int(os.getenv('SCRAPE_PREVIEW_CHARS', '1500'))
+
+# At most this many chunks of a scrape are organized at once
+ORGANIZE_CONCURRENCY = int(os.getenv('ORGANIZE_CONCURRENCY', '4'))
+
+# At most this many emails are drafted at once by generate_emails_batch_tool
+EMAIL_DRAFT_CONCURRENCY = int(os.getenv('EMAIL_DRAFT_CONCURRENCY', '5'))
+
 # --- Global list to store queries for testing ---
 _test_queries_used = []
 
 # --- Main Agent Definition ---
 
 class MainAgent:
-    def __init__(self):
-        agent_llm = Gemini(id='gemini-2.0-flash-exp', api_key=os.getenv('GEMINI_API_KEY'))
+    def __init__(self, on_event=None):
+        # Called with an event dict ({"event": "contacts" | "email", ...}) as results are produced
+        self.on_event = on_event
+        # Each request of the run is limited on its own, so a 429 retries that request
+        # rather than the whole workflow and the tools it already ran
+        agent_llm = limit_agno_model(
+            Gemini(id='gemini-2.0-flash-exp', api_key=os.getenv('GEMINI_API_KEY')), get_limiter("gemini"),
+        )
+        # Drafts produced by generate_emails_batch_tool, in contact order
+        self.draft_queue = []
         self.agent = Agent(
             model=agent_llm,
             # Pass the MainAgent instance itself as the tool provider
@@ -28,14 +66,15 @@ class MainAgent:
                 self.linkedin_scraper_tool,
                 self.organize_information_tool,
                 self.generate_email_tool,
+                self.generate_emails_batch_tool,
             ],
             instructions=[
                 "You are an autonomous sales outreach assistant.",
                 "Your goal is to find relevant contacts based on user criteria and draft personalized outreach emails using the tools available directly within this agent.",
                 "Follow these steps:",
                 "1. Use the linkedin_scraper_tool to find potential companies or people based on the user's request (industry, roles, location). You might need multiple searches.",
-                "2. Use the organize_information_tool to process the raw scraped data and extract a structured list of contacts matching the user's target roles.",
-                "3. For each contact found and organized, use the generate_email_tool to draft a personalized email based on the contact's details and the user's profile/purpose.",
+                "2. Use the organize_information_tool with the scrape_id from each search to process the full scraped data and extract a structured list of contacts matching the user's target roles.",
+                "3. Once the contacts are organized, use the generate_emails_batch_tool once to draft personalized emails for all of them based on their details and the user's profile/purpose. Use the generate_email_tool only to redraft a single email.",
                 "4. Present the final drafted emails as your result. If multiple emails are generated, provide them as a list of JSON objects.",
                 "Think step-by-step using the ReasoningTools to plan your actions.",
                 "Ensure all necessary information (like user profile details) is passed correctly to the tools.",
@@ -43,33 +82,79 @@ class MainAgent:
             # debug_mode=True # Enable for detailed Agno logs
         )
 
+    def emit_event(self, event, **data):
+        """Report a workflow result to `on_event` as soon as it is produced"""
+        if self.on_event is not None:
+            self.on_event({"event": event, **data})
+
     # --- Tool Definitions moved into MainAgent ---
 
+    @timed("tool")
     async def linkedin_scraper_tool(self, query: str) -> str:
         """
         Searches LinkedIn for profiles or companies based on the provided query.
-        Returns the raw scraping results as a string.
+        Returns a scrape_id for the full results, followed by a preview of them.
+        Pass the scrape_id to organize_information_tool to process all of the results.
         """
         print(f"--- Calling LinkedIn Scraper Tool with query: {query} ---")
         global _test_queries_used
         _test_queries_used.append(query) # Store query for test output
         try:
-            result = await scrape_linkedin(query)
-            return str(result)[:4000] # Return result as string, potentially truncated
+            scrape = await scrape_linkedin(query)
+            result = str(scrape)
+            if not result and getattr(scrape, "errors", None):
+                return f"Error scraping LinkedIn: {scrape.errors[-1]}"
+            # The full result stays here; only its id and a preview go back to the model
+            scrape_id = get_store().put(result)
+            preview = result[:SCRAPE_PREVIEW_CHARS]
+            return f"scrape_id: {scrape_id} ({len(result)} characters)\nPreview:\n{preview}"
         except Exception as e:
             print(f"Error in linkedin_scraper_tool: {e}")
             return f"Error scraping LinkedIn: {e}"
 
+    @timed("tool")
     async def organize_information_tool(self, scraped_data: str, target_roles: List[str], target_industry: str, location: str) -> List[Dict[str, Any]]:
         """
         Organizes raw scraped data (text) into a structured list of potential contacts.
         Filters based on target roles, industry, and location.
-        Input 'scraped_data' is the raw text output from the linkedin_scraper_tool.
+        Input 'scraped_data' is the scrape_id returned by the linkedin_scraper_tool (or raw scraped text).
         Returns a JSON list of dictionaries, each representing a contact with keys like 'name', 'role', 'company', 'profile_url', 'justification'.
         Example Output: [ { "name": "Jane Doe", "role": "CEO", "company": "HealthAI", "profile_url": "...", "justification": "Matches target role CEO in Healthcare AI." } ]
         """
         print("--- Calling Organize Information Tool ---")
-        organizer_llm = Gemini(id='gemini-2.0-flash-exp', api_key=os.getenv('GEMINI_API_KEY'))
+        scrape_id = scraped_data.strip().removeprefix("scrape_id:").strip()
+        text = get_store().get(scrape_id) or scraped_data
+
+        # Most scrapes follow a few known shapes, which are parsed without a model call
+        contacts, confidence = extract_contacts(text, target_roles, target_industry, location)
+        if confidence >= CONTACT_PARSER_MIN_CONFIDENCE:
+            print(f"Parsed {len(contacts)} contacts locally (confidence {confidence:.2f})")
+            self.emit_event("contacts", contacts=contacts)
+            return contacts
+
+        # Otherwise organize overlapping chunks concurrently and merge the results.
+        # Workers pull chunks from one generator, so at most ORGANIZE_CONCURRENCY
+        # chunks exist at a time.
+        chunks = enumerate(iter_chunks(text))
+        organized = {}
+
+        async def worker():
+            for index, chunk in chunks:
+                organized[index] = await self.organize_chunk(chunk, target_roles, target_industry, location)
+
+        await asyncio.gather(*(worker() for _ in range(ORGANIZE_CONCURRENCY)))
+        merged = dedupe_contacts([c for index in sorted(organized) for c in organized[index] if isinstance(c, dict)])
+        print(f"Organized {len(merged)} contacts from {len(organized)} chunks")
+        self.emit_event("contacts", contacts=merged)
+        return merged
+
+    async def organize_chunk(self, scraped_data: str, target_roles: List[str], target_industry: str, location: str) -> List[Dict[str, Any]]:
+        """Organize one chunk of scraped text, with the local parser or the organizer LLM"""
+        contacts, confidence = extract_contacts(scraped_data, target_roles, target_industry, location)
+        if confidence >= CONTACT_PARSER_MIN_CONFIDENCE:
+            return contacts
+
+        organizer_llm = get_tool_llm()
         prompt = f"""
         Parse the following raw scraped data and extract relevant contacts based on the criteria.
 
@@ -88,21 +173,20 @@ class MainAgent:
         Example Output: [{{ "name": "Jane Doe", "role": "CEO", "company": "HealthAI", "profile_url": "...", "justification": "Matches target role CEO in Healthcare AI." }}]
         """
         try:
-            response = await organizer_llm.acall(prompt)
-            organized_list = json.loads(response)
+            with span("model", TOOL_MODEL_ID):
+                response = await get_limiter("gemini").acall(organizer_llm.acall, prompt, estimated_tokens=estimate_tokens(prompt))
+            organized_list = parse_json_block(response)
             if isinstance(organized_list, list):
-                print(f"Organized Data: {organized_list}")
                 return organized_list
             else:
-                print("Organize tool did not return a list.")
-                return []
-        except json.JSONDecodeError:
-            print(f"Error decoding JSON from organize_information_tool response: {response}")
-            return []
+                # Whatever the local parser found is better than nothing
+                print(f"Organize tool did not return a list: {response}")
+                return contacts
         except Exception as e:
             print(f"Error in organize_information_tool: {e}")
-            return []
+            return contacts
 
+    @timed("tool")
     async def generate_email_tool(self, contact: Dict[str, Any], user_profile: Dict[str, Any]) -> Dict[str, str]:
         """
         Generates a personalized sales outreach email for a given contact.
@@ -112,7 +196,7 @@ class MainAgent:
         Example Output: {{ "subject": "Introducting Our New Product", "body": "Hi Jane Doe, ..." }}
         """
         print(f"--- Calling Generate Email Tool for: {contact.get('name')} ---")
-        email_llm = Gemini(id='gemini-2.0-flash-exp', api_key=os.getenv('GEMINI_API_KEY'))
+        email_llm = get_tool_llm()
         prompt = f"""
         Draft a concise and compelling personalized sales email based on the following information.
 
@@ -131,10 +215,12 @@ class MainAgent:
         Example Output: {{ "subject": "Regarding [Relevant Topic]", "body": "Hi {{contact['name']}},\n\nI saw your work at {{contact['company']}}..." }}
         """
         try:
-            response = await email_llm.acall(prompt)
+            with span("model", TOOL_MODEL_ID):
+                response = await get_limiter("gemini").acall(email_llm.acall, prompt, estimated_tokens=estimate_tokens(prompt))
             email_draft = json.loads(response)
             if isinstance(email_draft, dict) and 'subject' in email_draft and 'body' in email_draft:
                 print(f"Generated Email Draft: {email_draft}")
+                self.emit_event("email", contact=contact, email=email_draft)
                 return email_draft
             else:
                 print("Generate email tool did not return expected format.")
@@ -146,6 +232,58 @@ class MainAgent:
             print(f"Error in generate_email_tool: {e}")
             return {"subject": "Error", "body": f"Error generating email: {e}"}
 
+    async def generate_emails_batch_tool(self, contacts: List[Dict[str, Any]], user_profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Generates personalized sales outreach emails for the best matching contacts at once,
+        from a shared campaign template, a paragraph per company and an opening line per contact.
+        'contacts' is a list of contact dictionaries (name, role, company, etc.).
+        'user_profile' contains information about the sender and the email's purpose (target_industry, target_roles, location, context, email_purpose, etc.).
+        Contacts are ranked against the profile's targets first; weak matches are skipped.
+        Returns a JSON list with one object per drafted contact, best match first, each with 'contact' and 'email' ('subject' and 'body') keys.
+        """
+        print(f"--- Calling Generate Emails Batch Tool for {len(contacts)} contacts ---")
+        ranked = rank_contacts(contacts, user_profile)
+        if len(ranked) < len(contacts):
+            print(f"Drafting for the {len(ranked)} best matching of {len(contacts)} contacts")
+        contacts = ranked
+        semaphore = asyncio.Semaphore(EMAIL_DRAFT_CONCURRENCY)
+        loop = asyncio.get_running_loop()
+
+        # Emails are assembled from a campaign template, a paragraph per company and an
+        # opening line per contact, each generated once and cached. The drafter runs in
+        # worker threads; its model calls are scheduled back onto this loop.
+        def generate(instructions, payload):
+            prompt = f"{instructions}\n\n{json.dumps(payload, default=str)}"
+            return asyncio.run_coroutine_threadsafe(self.complete_json(prompt), loop).result()
+
+        drafter = TemplateDrafter(generate)
+
+        async def draft(contact):
+            async with semaphore:
+                try:
+                    email = await asyncio.to_thread(drafter.draft, contact, user_profile)
+                except Exception as e:
+                    print(f"Error drafting email for {contact.get('name')}: {e}")
+                    return {"subject": "Error", "body": f"Error generating email: {e}"}
+            email_draft = {"subject": email["subject"], "body": email["content"]}
+            self.emit_event("email", contact=contact, email=email_draft)
+            return email_draft
+
+        drafts = await asyncio.gather(*(draft(contact) for contact in contacts))
+        batch = [{"contact": contact, "email": email} for contact, email in zip(contacts, drafts)]
+        self.draft_queue.extend(batch)
+        return batch
+
+    async def complete_json(self, prompt: str) -> Dict[str, Any]:
+        """Run one tool LLM call and return its response as a JSON object"""
+        llm = get_tool_llm()
+        with span("model", TOOL_MODEL_ID):
+            response = await get_limiter("gemini").acall(llm.acall, prompt, estimated_tokens=estimate_tokens(prompt))
+        result = parse_json_block(response)
+        if not isinstance(result, dict):
+            raise ValueError(f"Expected a JSON object, got: {response}")
+        return result
+
     # --- Workflow Execution ---
 
     async def run_workflow(self, user_data: User) -> Any:
@@ -170,7 +308,10 @@ class MainAgent:
         """
 
         try:
-            final_result = await self.agent.arun(initial_prompt)
+            with span("workflow", "run_workflow") as workflow_span:
+                final_result = await self.agent.arun(initial_prompt)
+                metrics = self.agent.run_response.metrics or {}
+                workflow_span.add_tokens(sum(metrics.get("input_tokens", [])), sum(metrics.get("output_tokens", [])))
             print(f"--- Workflow Completed ---")
             print(f"Final Result: {final_result}")
             return final_result
@@ -211,6 +352,7 @@ async def test_agent():
         f.write("Running autonomous workflow...\n\n")
 
         final_output = await agent_instance.run_workflow(user)
+        await close_browser_pool()
 
         f.write("### LinkedIn Scraper Queries Used:\n")
         if _test_queries_used:
@@ -0,0 +1,112 @@
+"""
+Headless batch runner for the autonomous outreach workflow.
+
+Reads user profiles from a CSV or JSONL file and runs MainAgent.run_workflow
+for each of them, at most --workers at a time. Every contact and email is
+appended to the output JSONL file as soon as it is produced, one record per
+line, tagged with the profile id:
+
+    {"profile_id": "p1", "type": "started", "attempt": 1, ...}
+    {"profile_id": "p1", "type": "contact", "contact": {...}, ...}
+    {"profile_id": "p1", "type": "email", "contact": {...}, "email": {...}, ...}
+    {"profile_id": "p1", "type": "completed", "result": ..., ...}
+
+Re-running with the same output file skips profiles that already have a
+"completed" record. Profiles that were interrupted are run again as a new
+attempt, so consumers should keep the records of each profile's last attempt.
+
+With --export, once the campaign is done the contacts of every profile's last
+attempt are read back from the output file into a LeadStore and written to a
+Parquet (.parquet) or Arrow IPC (.arrow) file, tagged with their profile id as
+'source'. This needs pyarrow.
+
+Usage:
+    python run_campaign.py profiles.csv --output campaign.jsonl --workers 4
+    python run_campaign.py profiles.csv --output campaign.jsonl --export leads.parquet
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from backend.browser_pool import close_browser_pool
+from backend.campaign_io import load_profiles, read_progress, collect_leads, ResultWriter
+
+async def run_profile(profile, writer, attempt):
+    # The workflow pulls in the model and scraper dependencies, so it is only
+    # imported once a profile actually runs
+    from mainAgent import MainAgent
+    from backend.model import User
+
+    profile_id = profile["id"]
+    writer.write(profile_id, "started", attempt=attempt, profile=profile)
+
+    def on_event(event):
+        if event["event"] == "contacts":
+            for contact in event["contacts"]:
+                writer.write(profile_id, "contact", contact=contact)
+        elif event["event"] == "email":
+            writer.write(profile_id, "email", contact=event["contact"], email=event["email"])
+
+    user = User(uid=profile_id, profile={k: v for k, v in profile.items() if k != "id"})
+    start = time.perf_counter()
+    result = await MainAgent(on_event=on_event).run_workflow(user)
+    seconds = round(time.perf_counter() - start, 3)
+    if isinstance(result, dict) and "error" in result:
+        writer.write(profile_id, "failed", error=result["error"], seconds=seconds)
+        return False
+    content = getattr(result, "content", result)
+    writer.write(profile_id, "completed", result=content, seconds=seconds)
+    return True
+
+async def run_campaign(profiles, output, workers):
+    """Run the profiles not completed yet, appending their results to `output`"""
+    completed, attempts = read_progress(output)
+    pending = [p for p in profiles if p["id"] not in completed]
+    print(f"{len(profiles)} profiles, {len(profiles) - len(pending)} already completed, {len(pending)} to run")
+
+    writer = ResultWriter(output)
+    queue = asyncio.Queue()
+    for profile in pending:
+        queue.put_nowait(profile)
+    summary = {"completed": 0, "failed": 0}
+
+    async def worker():
+        while not queue.empty():
+            profile = queue.get_nowait()
+            try:
+                ok = await run_profile(profile, writer, attempts.get(profile["id"], 0) + 1)
+            except Exception as e:
+                print(f"Profile {profile['id']} failed: {e}")
+                writer.write(profile["id"], "failed", error=str(e))
+                ok = False
+            summary["completed" if ok else "failed"] += 1
+            print(f"Profile {profile['id']} {'completed' if ok else 'failed'} "
+                  f"({summary['completed'] + summary['failed']}/{len(pending)})")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, workers))))
+    finally:
+        writer.close()
+        await close_browser_pool()
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the outreach workflow for many profiles")
+    parser.add_argument("profiles", help="CSV or JSONL file of user profiles")
+    parser.add_argument("--output", default="campaign_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CAMPAIGN_WORKERS", "4")),
+                        help="Profiles run at once")
+    parser.add_argument("--export", help="Also write the contacts found to this .parquet or .arrow file")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run_campaign(load_profiles(args.profiles), args.output, args.workers))
+    print(f"Campaign finished: {summary['completed']} completed, {summary['failed']} failed")
+    if args.export:
+        leads = collect_leads(args.output)
+        leads.export(args.export)
+        print(f"Exported {len(leads)} contacts to {args.export}")
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())